@@ -1,12 +1,11 @@
 import configparser
 import os
 from datetime import datetime
-from tqdm import tqdm
 import sqlite3
-import pandas as pd
-from PyQt5.QtWidgets import QMessageBox
-from PyQt5.QtWidgets import QApplication,QMessageBox,QDialog, QLabel, QVBoxLayout, QProgressBar, QApplication
-from PyQt5.QtCore import Qt
+import time
+
+# Shortest delay between two partial reports sent to on_partial while a run goes on
+PARTIAL_INTERVAL_SECONDS = 1.0
 
 # Function to read configuration from config.ini
 def read_config():
@@ -18,148 +17,246 @@ def read_config():
 
 # Function to collect database files
 def collecter_noms_fichiers_bases_de_donnees(chemin_dossier_pc, start_date, end_date):
-    file_names = []
-    if os.path.exists(chemin_dossier_pc):
-        for nom_fichier in os.listdir(chemin_dossier_pc):
-            if nom_fichier.endswith("[COUNT].db"):
-                date_fichier = nom_fichier.split("_")[0]
-                if start_date <= date_fichier <= end_date:
-                    fichier_db = os.path.join(chemin_dossier_pc, nom_fichier)
-                    file_names.append(fichier_db)
-    return file_names
+    from source_catalog import list_source_files
+    return list_source_files(chemin_dossier_pc, start_date, end_date)
 
 
 
 
 # Function to process collected data
-def process_collected_data(start_date, end_date, start_time, end_time, servers):
+# on_error(file_name) is called for each unreadable file (a warning box when not given),
+# on_progress(stage, details) after each stage and each file. Returns the report path, None when no row was found.
+# The timings of the run are recorded into metrics (a PipelineMetrics) when given and logged to the [Logging] file.
+# output_format is one of report_writers.OUTPUT_FORMATS (the [Output] format when not given). With raw_output,
+# every extracted row is also exported to that CSV file (gzip-compressed when it ends with .gz) as it is read.
+# on_partial(report) gets the report of the files read so far, at most once per PARTIAL_INTERVAL_SECONDS.
+# cancelled() is checked at every file and table boundary, a cancelled run returns None without writing the report.
+# on_report(aggregated_data, collected_data) gets the finished report and, in memory / sqlite mode, the extracted rows.
+def process_collected_data(start_date, end_date, start_time, end_time, servers, on_error=None, output_file=None, on_progress=None,
+                           metrics=None, output_format=None, raw_output=None, on_partial=None, cancelled=None, on_report=None):
+    # The pipeline modules (and pandas with them) are only loaded once a report is run
+    from extraction import (concat_frames, extract_files, read_worker_count, read_aggregation_mode, read_time_pruning,
+                            read_prefetch_settings)
+    from aggregation import StreamingAggregator, aggregate_frame
+    from parsed_cache import open_parsed_cache
+    from result_cache import fingerprint_files, open_result_cache
+    from pushdown import aggregate_attached
+    from warehouse import open_warehouse
+    from source_catalog import plan_file_tasks
+    from instrumentation import PipelineMetrics, read_log_settings, timed_stage
+    from report_writers import CsvWriter, check_output_format, read_output_format, report_file_name, write_report_file
+
+    if cancelled is None:
+        cancelled = lambda: False
     # Read configuration from config.ini
     config = read_config()
+    cache = open_parsed_cache(config)
+    start_datetime = datetime.strptime(f"{start_date} {start_time}", "%Y%m%d %H:%M")
+    end_datetime = datetime.strptime(f"{end_date} {end_time}", "%Y%m%d %H:%M")
+    output_format = check_output_format(output_format) if output_format else read_output_format(config)
+    output_file = output_file or report_file_name(start_date, end_date, servers, output_format)
+    metrics = metrics if metrics is not None else PipelineMetrics()
+
+    def warn_database_error(file_name):
+        if on_error is not None:
+            on_error(file_name)
+            return
+        # Display warning if the database file cannot be opened
+        from PyQt5.QtWidgets import QMessageBox
+        QMessageBox.warning(None, "Database Error", f"Failed to open database file: {file_name}. Skipping...")
+
+    def report_progress(stage, **details):
+        if on_progress is not None:
+            on_progress(stage, details)
+
+    def file_scanned(file_name, done, total):
+        report_progress('scan', file=file_name, done=done, total=total)
+
+    def finish(result, was_cancelled=False):
+        metrics.write_log(*read_log_settings(config), report=f"{start_date} {start_time} - {end_date} {end_time}", lines=servers,
+                          cancelled=was_cancelled)
+        return result
+
+    def write_report(aggregated_data, collected_data=None):
+        if on_report is not None:
+            on_report(aggregated_data, collected_data)
+        with timed_stage(metrics, 'report write') as stage:
+            write_report_file(aggregated_data, output_file, output_format)
+            stage.add(rows=len(aggregated_data), bytes=os.path.getsize(output_file))
+        report_progress('write', output=output_file)
+
+    # Step 1: Collect the database files of each server (from the source catalog when enabled)
+    with timed_stage(metrics, 'file discovery') as stage:
+        file_tasks = plan_file_tasks(config, servers, start_date, end_date, start_datetime, end_datetime, warn_database_error,
+                                     file_scanned)
+        stage.add(rows=len(file_tasks))
+    report_progress('plan', files=len(file_tasks))
+
+    # Step 1.1: Answer a repeated request from the result cache, as long as its files are unchanged
+    # (not with a raw export, which needs the rows to be extracted)
+    result_cache = open_result_cache(config) if raw_output is None else None
+    if result_cache is not None:
+        with timed_stage(metrics, 'result cache') as stage:
+            request_key = result_cache.request_key(servers, start_datetime, end_datetime)
+            fingerprints = fingerprint_files(file_tasks)
+            cached_report = result_cache.get(request_key, fingerprints)
+            stage.add(rows=len(file_tasks))
+        if cached_report is not None:
+            report_progress('aggregate', groups=len(cached_report), cached=True)
+            write_report(cached_report)
+            return finish(output_file)
+
+    # Function to store the report of the run in the result cache
+    def keep_result(aggregated_data):
+        if result_cache is not None and aggregated_data is not None:
+            result_cache.put(request_key, fingerprints, aggregated_data)
+
+    # Step 2: Extract the Prod_NXT/Prod_XPF tables of each file, serially or in a process pool
+    workers = read_worker_count(config)
+    pruning = read_time_pruning(config)
+    read_threads, queue_depth = read_prefetch_settings(config)
+    aggregation_mode = read_aggregation_mode(config)
+    if raw_output is not None and aggregation_mode in ('pushdown', 'warehouse'):
+        raise ValueError(f"The raw export needs the rows to be extracted, not possible with aggregation = {aggregation_mode}")
+
+    # Running report of the files read so far, for on_partial. In streaming and pushdown mode it is the state
+    # of the run itself. In memory / sqlite mode the collected frames are only folded into it once a partial
+    # report is due, so runs shorter than PARTIAL_INTERVAL_SECONDS never build it.
+    preview = StreamingAggregator() if on_partial is not None and aggregation_mode != 'warehouse' else None
     collected_data_frames = []
-    
+    folded_frames = [0]
+    last_partial = [time.monotonic()]
 
-    # Step 1: Iterate through each server
-    for server in servers:
-        # Step 2: Collect database files
-        server_path = config['Paths'][server]
-        collected_files = collecter_noms_fichiers_bases_de_donnees(server_path, start_date, end_date)
-        
+    # Function to fold the collected frames not yet in the preview
+    def fold_collected_frames():
+        for df in collected_data_frames[folded_frames[0]:]:
+            preview.add_frame(df)
+        folded_frames[0] = len(collected_data_frames)
 
-        # Step 3: For each database file
-        for file_name in collected_files:
-            try :
-                # Step 4: Get all tables starting with "Prod_NXT" or "Prod_XPF"
-                with sqlite3.connect(file_name) as db_conn:
-                    cursor = db_conn.cursor()
-                    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND (name LIKE 'Prod_NXT%' OR name LIKE 'Prod_XPF%')")
-                    tables = cursor.fetchall()
-                    
-                    # Step 5: For each table
-                    for table in tables:
-                        table_name = table[0]
-                        # Step 6: Execute SQL query to select data
-                        query = f"SELECT DateTime, Module, Data FROM {table_name} WHERE DateTime >= ? AND DateTime <= ?"
-                        start_datetime = datetime.strptime(f"{start_date} {start_time}", "%Y%m%d %H:%M")
-                        end_datetime = datetime.strptime(f"{end_date} {end_time}", "%Y%m%d %H:%M")
-
-                        params = (start_datetime, end_datetime)
-                        df = pd.read_sql_query(query, db_conn, params=params)
-                        
-                        # Step 7: Add Line_name and Type columns
-                        df['Line_name'] = server
-                        df['Type'] = 'XPF' if 'Prod_XPF' in table_name else 'NXT'
-                        
-                        # Step 8: Split the "Data" column into multiple columns using tabs
-                        split_columns = ['Last_Panel_ID_produced', 'Conveyor_name', 'Recipe_name', 'Operator_name', 'Stage_no', 'Group_key', 'Position_no', 'Sub-Position_no', 'Parts_pickup_count', 'Error_parts_count', 'Error_rejected_parts_count', 'Rejected_parts_count', 'Dislodged_parts_count', 'NoPickup_Number_of_parts_not_used', 'Used_parts_count', 'Rescan_count', 'PartName', 'Unit_position_ID', 'FIDL', 'Module_Number', 'vide']
-                        split_data = df['Data'].str.split('\t', expand=True)
-                        split_data.columns = split_columns[:len(split_data.columns)]  # Ensure correct number of columns
-                        # Concatenate split data with original DataFrame
-                        df = pd.concat([df, split_data], axis=1)
-                        # Drop the original "Data" column and other unwanted columns
-                        columns_to_drop = ['Data', 'Last_Panel_ID_produced', 'Conveyor_name', 'Operator_name', 'Group_key', 'Sub-Position_no', 'Rescan_count', 'Unit_position_ID', 'Module_Number']
-                        columns_to_drop = [col for col in columns_to_drop if col in df.columns]  # Filter existing columns
-                        df.drop(columns=columns_to_drop, inplace=True)
-                        # Convert specified columns to integers
-                        int_columns = ['Position_no','Stage_no', 'Parts_pickup_count', 'Error_parts_count', 'Error_rejected_parts_count', 'Rejected_parts_count', 'Dislodged_parts_count', 'NoPickup_Number_of_parts_not_used', 'Used_parts_count']
-                        df[int_columns] = df[int_columns].astype(int)
-                        # Add StartTime column with proper formatting
-                        df['StartTime'] = pd.to_datetime(df['DateTime']).dt.strftime('%Y-%m-%d %H:%M')
-                        # Append the DataFrame to the list
-                        collected_data_frames.append(df)
-            except sqlite3.Error:
-                # Display warning if the database file cannot be opened
-                QMessageBox.warning(None, "Database Error", f"Failed to open database file: {file_name}. Skipping...")
-                continue
-                        
-    # Step 5: Concatenate collected data frames
-    if collected_data_frames:
-        collected_data = pd.concat(collected_data_frames, ignore_index=True)
-        
-        # Step 6: Define the desired column order and reorder columns
-        desired_columns = ["Line_name", "Type", "Module", "Recipe_name", "StartTime", "Stage_no",'Position_no', "Parts_pickup_count", "Error_parts_count", "Error_rejected_parts_count", "Rejected_parts_count", "Dislodged_parts_count", "NoPickup_Number_of_parts_not_used", "Used_parts_count", "PartName", "FIDL"]
-        collected_data = collected_data.reindex(columns=desired_columns)
-        
-        # Step 7: Format the StartTime column
-        collected_data['StartTime'] = pd.to_datetime(collected_data['StartTime']).dt.strftime('%Y-%m-%d %H:%M:%S')
-        
-        # Step 8: Save collected data to a SQLite database
-        db_file = f'collected_data_{start_date}_{end_date}.db'
-        conn = sqlite3.connect(db_file)
-        collected_data.to_sql('collected_data', conn, if_exists='replace', index=False)
-        conn.close()
+    def file_done(file_name, done, total):
+        report_progress('file', file=file_name, done=done, total=total)
+        if preview is not None and time.monotonic() - last_partial[0] >= PARTIAL_INTERVAL_SECONDS:
+            fold_collected_frames()
+            partial = preview.result()
+            if partial is not None:
+                on_partial(partial)
+            last_partial[0] = time.monotonic()
 
-        # Step 9: Execute SQL query to aggregate the data
-        aggregated_data = aggregate_data(db_file)
+    # Function to extract the rows of the files, exporting each frame to raw_output on its way
+    def extract(on_frame):
+        if raw_output is None:
+            extract_files(file_tasks, start_datetime, end_datetime, cache, workers, warn_database_error,
+                          on_frame=on_frame, pruning=pruning, metrics=metrics, on_file=file_done, cancelled=cancelled,
+                          read_threads=read_threads, queue_depth=queue_depth)
+            return
+        raw_writer = CsvWriter(raw_output, compress=raw_output.endswith('.gz'))
 
-        # Step 10: Save the aggregated data to a CSV file
-        aggregated_data.to_csv(f'Report_generate_{start_date}_{end_date}{servers}.csv', index=False)
-        # Step 11: remove db file collected
-        os.remove(db_file)
+        def export_frame(df):
+            with timed_stage(metrics, 'raw export') as stage:
+                raw_writer.write(df)
+                stage.add(rows=len(df))
+            on_frame(df)
 
-def aggregate_data(db_file):
-    conn = sqlite3.connect(db_file)
-    query = """
-    SELECT
-        Line_name,
-        Type,
-        Module,
-        Recipe_name,
-        PartName,
-        MIN(StartTime) AS StartTime,
-        MAX(StartTime) AS EndTime,
-        MAX(Position_no) AS Slot,
-        MIN(Stage_no) AS Stage_no,
-        SUM(Parts_pickup_count) AS PickupCount,
-        SUM(Used_parts_count) AS TotalPartsUsed,
-        SUM(Rejected_parts_count) AS RejectParts,
-        SUM(NoPickup_Number_of_parts_not_used) AS PickupMiss,
-        SUM(Error_parts_count) AS ErrorParts,
-        SUM(Error_rejected_parts_count) AS Error_rejected_parts_count,
-        SUM(Dislodged_parts_count) AS Dislodged_parts_count,
-        FIDL
-    FROM collected_data
-    GROUP BY Line_name, Type, Module, Recipe_name, FIDL, PartName, strftime('%Y%m%d', StartTime);
-    """
-
-    aggregated_data = pd.read_sql_query(query, conn)
-    conn.close()
+        try:
+            extract_files(file_tasks, start_datetime, end_datetime, cache, workers, warn_database_error,
+                          on_frame=export_frame, pruning=pruning, metrics=metrics, on_file=file_done, cancelled=cancelled,
+                          read_threads=read_threads, queue_depth=queue_depth)
+        finally:
+            raw_writer.close()
+        report_progress('export', output=raw_output)
 
-    # Calculate errorPickupRate and ErrorRate
-    aggregated_data['ErrorPickupRate'] = (aggregated_data['PickupMiss'] / aggregated_data['PickupCount']) * 100
-    aggregated_data['ErrorRate'] = (aggregated_data['ErrorParts'] / aggregated_data['PickupCount']) * 100
-    aggregated_data['RejectRate'] = (aggregated_data['RejectParts'] / aggregated_data['PickupCount']) * 100
+    if aggregation_mode in ('streaming', 'pushdown', 'warehouse'):
+        if aggregation_mode == 'warehouse':
+            # Ingest the new rows of the files, then query the (line, day) partitions of the window
+            with timed_stage(metrics, 'aggregate'):
+                warehouse = open_warehouse(config)
+                for file_name in warehouse.ingest(file_tasks, file_done, cancelled):
+                    warn_database_error(file_name)
+                aggregated_data = None if cancelled() else warehouse.aggregate(servers, start_datetime, end_datetime)
+        elif aggregation_mode == 'pushdown':
+            # Aggregate inside SQLite over the ATTACHed source files
+            with timed_stage(metrics, 'aggregate'):
+                aggregated_data = aggregate_attached(file_tasks, start_datetime, end_datetime, warn_database_error, pruning,
+                                                     file_done, cancelled, preview)
+        else:
+            # Fold each extracted frame into a running group-by state instead of concatenating everything
+            aggregator = preview if preview is not None else StreamingAggregator()
 
-    # Define the desired column order
-    column_order = ["Line_name", "Type", "Module", "Recipe_name", "StartTime", "EndTime", "PartName", "Slot",
-                    "Stage_no", "PickupCount", "TotalPartsUsed", "RejectParts", "PickupMiss", "ErrorParts",
-                    "Error_rejected_parts_count", "Dislodged_parts_count","RejectRate", "ErrorPickupRate", "ErrorRate", "FIDL"]
+            def add_frame(df):
+                with timed_stage(metrics, 'aggregate') as stage:
+                    aggregator.add_frame(df)
+                    stage.add(rows=len(df))
 
-    # Reorder the columns
-    aggregated_data = aggregated_data[column_order]
+            extract(add_frame)
+            with timed_stage(metrics, 'aggregate'):
+                aggregated_data = aggregator.result()
+        if cancelled():
+            return finish(None, True)
+        if aggregated_data is None:
+            return finish(None)
+        keep_result(aggregated_data)
+        report_progress('aggregate', groups=len(aggregated_data))
+        write_report(aggregated_data)
+        return finish(output_file)
 
-    return aggregated_data
+    extract(collected_data_frames.append)
+    if cancelled():
+        return finish(None, True)
+    report_progress('extract', frames=len(collected_data_frames))
 
+    # Step 5: Concatenate collected data frames
+    if collected_data_frames:
+        with timed_stage(metrics, 'concat') as stage:
+            collected_data = concat_frames(collected_data_frames)
+        
+            # Step 6: Define the desired column order and reorder columns
+            desired_columns = ["Line_name", "Type", "Module", "Recipe_name", "StartTime", "Stage_no",'Position_no', "Parts_pickup_count", "Error_parts_count", "Error_rejected_parts_count", "Rejected_parts_count", "Dislodged_parts_count", "NoPickup_Number_of_parts_not_used", "Used_parts_count", "PartName", "FIDL"]
+            collected_data = collected_data.reindex(columns=desired_columns)
+            stage.add(rows=len(collected_data), bytes=collected_data.memory_usage(index=False).sum())
+        
+        if aggregation_mode == 'memory' and preview is not None and folded_frames[0] > 0:
+            # Step 7: The preview already holds part of the rows, the report is finished from it
+            with timed_stage(metrics, 'aggregate') as stage:
+                fold_collected_frames()
+                aggregated_data = preview.result()
+                stage.add(rows=len(collected_data))
+        elif aggregation_mode == 'memory':
+            # Step 7: Aggregate the collected rows in memory
+            with timed_stage(metrics, 'aggregate') as stage:
+                aggregated_data = aggregate_frame(collected_data)
+                stage.add(rows=len(collected_data))
+        else:
+            # Step 7: Format the StartTime column as the text SQLite compares
+            with timed_stage(metrics, 'datetime conversion') as stage:
+                collected_data['StartTime'] = collected_data['StartTime'].dt.strftime('%Y-%m-%d %H:%M:%S')
+                stage.add(rows=len(collected_data))
 
+            # Step 8: Save collected data to a SQLite database
+            db_file = f'collected_data_{start_date}_{end_date}.db'
+            with timed_stage(metrics, 'to_sql') as stage:
+                conn = sqlite3.connect(db_file)
+                collected_data.to_sql('collected_data', conn, if_exists='replace', index=False)
+                conn.close()
+                stage.add(rows=len(collected_data), bytes=os.path.getsize(db_file))
 
+            # Step 9: Execute SQL query to aggregate the data
+            with timed_stage(metrics, 'aggregate') as stage:
+                aggregated_data = aggregate_data(db_file)
+                stage.add(rows=len(collected_data))
+            # Step 9.1: remove db file collected
+            os.remove(db_file)
 
+        keep_result(aggregated_data)
+        report_progress('aggregate', groups=len(aggregated_data))
 
+        # Step 10: Save the aggregated data in the output format
+        write_report(aggregated_data, collected_data)
+        return finish(output_file)
+    return finish(None)
+
+def aggregate_data(db_file):
+    from aggregation import aggregate_connection
+    conn = sqlite3.connect(db_file)
+    aggregated_data = aggregate_connection(conn)
+    conn.close()
+    return aggregated_data
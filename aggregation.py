@@ -0,0 +1,222 @@
+import numpy as np
+import pandas as pd
+
+
+# Columns of the group key, the day is added on top of them
+group_columns = ["Line_name", "Type", "Module", "Recipe_name", "FIDL", "PartName"]
+
+# (report column, collected column) pairs summed per group
+sum_columns = [
+    ("PickupCount", "Parts_pickup_count"),
+    ("TotalPartsUsed", "Used_parts_count"),
+    ("RejectParts", "Rejected_parts_count"),
+    ("PickupMiss", "NoPickup_Number_of_parts_not_used"),
+    ("ErrorParts", "Error_parts_count"),
+    ("Error_rejected_parts_count", "Error_rejected_parts_count"),
+    ("Dislodged_parts_count", "Dislodged_parts_count"),
+]
+
+# Nanoseconds in a minute and in a day, the unit of the int64 timestamps of the bucketing functions
+MINUTE_NS = 60 * 10**9
+DAY_NS = 1440 * MINUTE_NS
+
+report_columns = ["Line_name", "Type", "Module", "Recipe_name", "StartTime", "EndTime", "PartName", "Slot",
+                  "Stage_no", "PickupCount", "TotalPartsUsed", "RejectParts", "PickupMiss", "ErrorParts",
+                  "Error_rejected_parts_count", "Dislodged_parts_count", "RejectRate", "ErrorPickupRate", "ErrorRate", "FIDL"]
+
+
+aggregate_query = """
+SELECT
+    Line_name,
+    Type,
+    Module,
+    Recipe_name,
+    PartName,
+    MIN(StartTime) AS StartTime,
+    MAX(StartTime) AS EndTime,
+    MAX(Position_no) AS Slot,
+    MIN(Stage_no) AS Stage_no,
+    SUM(Parts_pickup_count) AS PickupCount,
+    SUM(Used_parts_count) AS TotalPartsUsed,
+    SUM(Rejected_parts_count) AS RejectParts,
+    SUM(NoPickup_Number_of_parts_not_used) AS PickupMiss,
+    SUM(Error_parts_count) AS ErrorParts,
+    SUM(Error_rejected_parts_count) AS Error_rejected_parts_count,
+    SUM(Dislodged_parts_count) AS Dislodged_parts_count,
+    FIDL
+FROM collected_data
+GROUP BY Line_name, Type, Module, Recipe_name, FIDL, PartName, strftime('%Y%m%d', StartTime);
+"""
+
+
+# Function to compute the rate columns from the summed counters
+def add_rates(aggregated_data):
+    # Calculate errorPickupRate and ErrorRate
+    aggregated_data['ErrorPickupRate'] = (aggregated_data['PickupMiss'] / aggregated_data['PickupCount']) * 100
+    aggregated_data['ErrorRate'] = (aggregated_data['ErrorParts'] / aggregated_data['PickupCount']) * 100
+    aggregated_data['RejectRate'] = (aggregated_data['RejectParts'] / aggregated_data['PickupCount']) * 100
+    return aggregated_data
+
+
+# Function to add the rate columns and put the report columns in order
+def finalize_report(aggregated_data):
+    add_rates(aggregated_data)
+
+    # Reorder the columns
+    return aggregated_data[report_columns]
+
+
+# Function to sort group keys the way SQLite orders its GROUP BY output (NULL first)
+def _group_sort_key(key):
+    return tuple((0, '') if value is None else (1, value) for value in key)
+
+
+# Running group-by state keyed on (Line_name, Type, Module, Recipe_name, FIDL, PartName, day).
+# Each collected frame is folded into the state as soon as it is extracted, so memory is bounded
+# by the number of groups instead of the number of rows. The result matches aggregate_data().
+class StreamingAggregator:
+    def __init__(self):
+        # key -> [StartTime, EndTime, Slot, Stage_no, sums...]
+        self.groups = {}
+
+    # bucket: optional Series of labels replacing the day in the group key (hour, shift...)
+    # end_column: column whose maximum is the EndTime of a group (rows carrying their own end time)
+    def add_frame(self, df, bucket=None, end_column='StartTime'):
+        if df is None or df.empty:
+            return
+        # Pre-aggregate the frame with a vectorized group by, then fold the partial groups.
+        # Rows are grouped on the datetime64 day, only the groups are formatted as text.
+        day = (df['StartTime'].dt.floor('D') if bucket is None else bucket).rename('day')
+        aggregations = {
+            'StartTime': ('StartTime', 'min'),
+            'EndTime': (end_column, 'max'),
+            'Slot': ('Position_no', 'max'),
+            'Stage_no': ('Stage_no', 'min'),
+        }
+        for report_column, collected_column in sum_columns:
+            aggregations[report_column] = (collected_column, 'sum')
+        partial = df.groupby([df[column] for column in group_columns] + [day], sort=False, dropna=False,
+                             observed=True).agg(**aggregations).reset_index()
+        if bucket is None:
+            partial['day'] = partial['day'].dt.strftime('%Y-%m-%d')
+        partial['StartTime'] = partial['StartTime'].dt.strftime('%Y-%m-%d %H:%M')
+        partial['EndTime'] = partial['EndTime'].dt.strftime('%Y-%m-%d %H:%M')
+        self.add_partial(partial)
+
+    # Function to fold already aggregated rows: group columns, day, StartTime, EndTime, Slot, Stage_no, sums
+    def add_partial(self, partial):
+        key_length = len(group_columns) + 1
+        for row in partial.itertuples(index=False, name=None):
+            key = tuple(None if pd.isna(value) else value for value in row[:key_length])
+            values = row[key_length:]
+            state = self.groups.get(key)
+            if state is None:
+                self.groups[key] = list(values)
+                continue
+            state[0] = min(state[0], values[0])
+            state[1] = max(state[1], values[1])
+            state[2] = max(state[2], values[2])
+            state[3] = min(state[3], values[3])
+            for index in range(4, len(state)):
+                state[index] += values[index]
+
+    def result(self):
+        if not self.groups:
+            return None
+        keys = sorted(self.groups, key=_group_sort_key)
+        rows = [key[:-1] + tuple(self.groups[key]) for key in keys]
+        aggregated_data = pd.DataFrame(
+            rows, columns=group_columns + ['StartTime', 'EndTime', 'Slot', 'Stage_no'] + [column for column, _ in sum_columns])
+        # Minutes are stored as '%Y-%m-%d %H:%M', the report shows seconds
+        aggregated_data['StartTime'] = aggregated_data['StartTime'] + ':00'
+        aggregated_data['EndTime'] = aggregated_data['EndTime'] + ':00'
+        return finalize_report(aggregated_data)
+
+
+# Function to format datetime64 values as text, each distinct value being formatted once
+def format_moments(moments, date_format):
+    codes, uniques = pd.factorize(moments)
+    return pd.Series(np.asarray(uniques.strftime(date_format), dtype=object)[codes], index=moments.index)
+
+
+# Function to return the datetime64 values of a Series as int64 nanoseconds
+def timestamps_ns(moments):
+    return moments.to_numpy().astype('datetime64[ns]').view(np.int64)
+
+
+# Function to compute the start of the fixed-width bucket of each int64 timestamp (ns), the buckets
+# of every day starting at midnight (5 min: 00:00, 00:05...). Integer arithmetic only.
+def fixed_bucket_starts(timestamps, width_minutes):
+    width = width_minutes * MINUTE_NS
+    days = timestamps // DAY_NS * DAY_NS
+    return days + (timestamps - days) // width * width
+
+
+# Function to read the shift start times from the [Shifts] section of config.ini, as minutes of the day
+def read_shift_starts(config):
+    starts = config.get('Shifts', 'starts', fallback='06:00, 14:00, 22:00')
+    minutes = []
+    for start in starts.split(','):
+        hours, mins = start.strip().split(':')
+        minutes.append(int(hours) * 60 + int(mins))
+    return sorted(minutes)
+
+
+# Function to compute the start of the shift of each int64 timestamp (ns). shift_starts are the sorted
+# minutes of the day the shifts start at, each shift lasting until the next start. The last shift of
+# a day crosses midnight: rows before the first start belong to the previous day's last shift
+# (with a single 06:00 start, every shift runs 06:00 -> 06:00).
+def shift_bucket_starts(timestamps, shift_starts):
+    starts = np.asarray(shift_starts, dtype=np.int64) * MINUTE_NS
+    days = timestamps // DAY_NS * DAY_NS
+    shift_index = np.searchsorted(starts, timestamps - days, side='right') - 1
+    # Index -1 picks the last start, on the previous day
+    return days - (shift_index < 0) * DAY_NS + starts[shift_index]
+
+
+# Function to factorize one group column, codes follow the sorted values with NULL first like SQLite
+def _factorize_sorted(values):
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes.astype(np.int64) + 1, len(uniques) + 1
+
+
+# Function to aggregate the collected rows in memory, without the temporary SQLite database.
+# Produces the same report as aggregate_data(): the group keys are factorized and combined
+# with the integer day key into one int64 group id, then every column is reduced per group.
+def aggregate_frame(collected_data):
+    if collected_data.empty:
+        return None
+    # Step 1: Integer timestamps (minutes kept as nanoseconds) and integer day keys
+    timestamps = pd.to_datetime(collected_data['StartTime']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+    days = timestamps // DAY_NS
+
+    # Step 2: Combine the factorized group columns and the day into a single group key
+    group_key = np.zeros(len(collected_data), dtype=np.int64)
+    for column in group_columns:
+        codes, cardinality = _factorize_sorted(collected_data[column])
+        group_key, _ = _factorize_sorted(group_key * cardinality + codes)
+    day_codes, day_count = _factorize_sorted(days)
+    group_ids, _ = _factorize_sorted(group_key * day_count + day_codes)
+    group_ids -= 1
+
+    # Step 3: Sort the rows by group and reduce each column per group
+    order = np.argsort(group_ids, kind='stable')
+    starts = np.flatnonzero(np.r_[True, np.diff(group_ids[order]) != 0])
+    aggregated_data = collected_data[group_columns].iloc[order[starts]].reset_index(drop=True)
+
+    sorted_timestamps = timestamps[order]
+    aggregated_data['StartTime'] = pd.to_datetime(np.minimum.reduceat(sorted_timestamps, starts)).strftime('%Y-%m-%d %H:%M:%S')
+    aggregated_data['EndTime'] = pd.to_datetime(np.maximum.reduceat(sorted_timestamps, starts)).strftime('%Y-%m-%d %H:%M:%S')
+    aggregated_data['Slot'] = np.maximum.reduceat(collected_data['Position_no'].to_numpy(np.int64)[order], starts)
+    aggregated_data['Stage_no'] = np.minimum.reduceat(collected_data['Stage_no'].to_numpy(np.int64)[order], starts)
+    for report_column, collected_column in sum_columns:
+        aggregated_data[report_column] = np.add.reduceat(collected_data[collected_column].to_numpy(np.int64)[order], starts)
+    return finalize_report(aggregated_data)
+
+
+# Function to run the SQLite GROUP BY over an open database holding the collected_data table
+def aggregate_connection(conn):
+    aggregated_data = pd.read_sql_query(aggregate_query, conn)
+    # Calculate the rates and reorder the columns
+    return finalize_report(aggregated_data)
+
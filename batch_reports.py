@@ -0,0 +1,77 @@
+import pandas as pd
+from aggregation import StreamingAggregator, format_moments, read_shift_starts, shift_bucket_starts, timestamps_ns
+from extraction import extract_files, read_prefetch_settings, read_time_pruning, read_worker_count
+from parsed_cache import open_parsed_cache
+from source_catalog import plan_file_tasks
+
+# Groupings a report spec can ask for: the time bucket added to the report group key
+GROUPINGS = ['day', 'hour', 'shift', 'window']
+
+
+# One report of a batch: a window, the lines it covers and its time grouping
+class ReportSpec:
+    def __init__(self, name, start_datetime, end_datetime, lines, grouping='day'):
+        if grouping not in GROUPINGS:
+            raise ValueError(f"Unknown grouping '{grouping}', expected one of {GROUPINGS}")
+        self.name = name
+        self.start_datetime = start_datetime
+        self.end_datetime = end_datetime
+        self.lines = list(lines)
+        self.grouping = grouping
+
+
+# Function to label each row with the start of its shift ('YYYY-MM-DD HH:MM'). Rows before the first
+# shift start of a day belong to the last shift of the previous day.
+def _shift_bucket(start_times, shift_starts):
+    labels = shift_bucket_starts(timestamps_ns(start_times), shift_starts).view('datetime64[ns]')
+    return format_moments(pd.Series(labels, index=start_times.index), '%Y-%m-%d %H:%M')
+
+
+# Function to build the bucket Series of a spec's rows (None keeps the report's day grouping)
+def _bucket(spec, rows, shift_starts):
+    if spec.grouping == 'day':
+        return None
+    if spec.grouping == 'hour':
+        return format_moments(rows['StartTime'].dt.floor('h'), '%Y-%m-%d %H')
+    if spec.grouping == 'window':
+        return pd.Series('', index=rows.index)
+    return _shift_bucket(rows['StartTime'], shift_starts)
+
+
+# Function to compute several reports in one pass: the files of the union of the lines and windows
+# are planned once, every source row is read and parsed once and each parsed frame is fanned out to
+# the aggregator of every spec whose lines and window it matches.
+# Returns {spec name: report DataFrame, None when the spec matched no row}.
+def run_report_batch(config, specs, on_error=None):
+    if not specs:
+        return {}
+    lines = []
+    for spec in specs:
+        lines.extend(line for line in spec.lines if line not in lines)
+    start_datetime = min(spec.start_datetime for spec in specs)
+    end_datetime = max(spec.end_datetime for spec in specs)
+    shift_starts = read_shift_starts(config)
+    aggregators = {spec.name: StreamingAggregator() for spec in specs}
+
+    def fan_out(df):
+        for spec in specs:
+            # The window end is exclusive, as in the extraction of a single report
+            matching = df['Line_name'].isin(spec.lines) & \
+                (df['DateTime'] >= spec.start_datetime) & (df['DateTime'] < spec.end_datetime)
+            if matching.all():
+                rows = df
+            elif matching.any():
+                rows = df[matching]
+            else:
+                continue
+            aggregators[spec.name].add_frame(rows, _bucket(spec, rows, shift_starts))
+
+    # Step 1: Plan the files of the union once
+    file_tasks = plan_file_tasks(config, lines, start_datetime.strftime('%Y%m%d'), end_datetime.strftime('%Y%m%d'),
+                                 start_datetime, end_datetime, on_error)
+
+    # Step 2: Read and parse each row once, fanning the frames out to the reports
+    read_threads, queue_depth = read_prefetch_settings(config)
+    extract_files(file_tasks, start_datetime, end_datetime, open_parsed_cache(config), read_worker_count(config),
+                  on_error, on_frame=fan_out, pruning=read_time_pruning(config), read_threads=read_threads, queue_depth=queue_depth)
+    return {name: aggregator.result() for name, aggregator in aggregators.items()}
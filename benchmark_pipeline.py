@@ -0,0 +1,129 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from contextlib import closing
+import pandas as pd
+from aggregation import aggregate_frame
+from extraction import concat_frames, list_prod_tables, parse_table_frame
+from source_access import connect_source
+from source_catalog import list_source_files
+from synthetic_data import generate_dataset
+
+# Stages timed by the suite, in pipeline order
+STAGES = ['discovery', 'sql_read', 'parse', 'concat', 'aggregation', 'csv_write']
+
+# Slowdowns smaller than this are timer noise, never reported as regressions
+MIN_REGRESSION_SECONDS = 0.01
+
+# Default baseline file, next to this script
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+
+# Function to run the report pipeline once over the line folders, timing each stage
+def run_pipeline(folders, start_date, end_date, output_file):
+    timings = {}
+
+    start = time.perf_counter()
+    file_tasks = [(line, file_name) for line, folder in folders.items()
+                  for file_name in list_source_files(folder, start_date, end_date)]
+    timings['discovery'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw_frames = []
+    for line, file_name in file_tasks:
+        with closing(connect_source(file_name)) as db_conn:
+            for table_name in list_prod_tables(db_conn):
+                raw_frames.append((line, table_name, pd.read_sql_query(f"SELECT DateTime, Module, Data FROM {table_name}", db_conn)))
+    timings['sql_read'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    frames = []
+    for line, table_name, df in raw_frames:
+        df = parse_table_frame(df)
+        df['Line_name'] = pd.Categorical([line] * len(df))
+        df['Type'] = pd.Categorical(['XPF' if 'Prod_XPF' in table_name else 'NXT'] * len(df))
+        frames.append(df)
+    timings['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    collected_data = concat_frames(frames)
+    timings['concat'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    aggregated_data = aggregate_frame(collected_data)
+    timings['aggregation'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    aggregated_data.to_csv(output_file, index=False)
+    timings['csv_write'] = time.perf_counter() - start
+    return timings, len(collected_data), len(aggregated_data)
+
+
+# Function to compare a run with the baseline. Returns the stages slower than tolerance x baseline.
+def compare_with_baseline(results, baseline, tolerance):
+    regressions = []
+    print(f"{'stage':<12} {'seconds':>9} {'baseline':>9} {'ratio':>7}")
+    for stage in STAGES + ['total']:
+        seconds = results['timings'][stage]
+        reference = baseline['timings'].get(stage)
+        if not reference:
+            print(f"{stage:<12} {seconds:>9.3f} {'-':>9} {'-':>7}")
+            continue
+        ratio = seconds / reference
+        flag = ''
+        if ratio > tolerance and seconds - reference > MIN_REGRESSION_SECONDS:
+            regressions.append(stage)
+            flag = '  REGRESSION'
+        print(f"{stage:<12} {seconds:>9.3f} {reference:>9.3f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each stage of the report pipeline on synthetic data")
+    parser.add_argument('--lines', type=int, default=2)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--modules', type=int, default=6)
+    parser.add_argument('--feeders', type=int, default=20)
+    parser.add_argument('--rows-per-day', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3, help="runs, the fastest time of each stage is kept")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+    scale = {'lines': args.lines, 'days': args.days, 'modules': args.modules, 'feeders': args.feeders,
+             'rows_per_day': args.rows_per_day}
+
+    with tempfile.TemporaryDirectory() as root:
+        folders = generate_dataset(root, args.lines, args.days, '20240301', args.modules, args.feeders, args.rows_per_day)
+        end_date = (pd.Timestamp('20240301') + pd.Timedelta(days=args.days - 1)).strftime('%Y%m%d')
+        best = {}
+        for _ in range(args.repeat):
+            timings, row_count, group_count = run_pipeline(folders, '20240301', end_date, os.path.join(root, 'report.csv'))
+            for stage, seconds in timings.items():
+                best[stage] = min(best.get(stage, seconds), seconds)
+    best['total'] = sum(best[stage] for stage in STAGES)
+    results = {'scale': scale, 'rows': row_count, 'groups': group_count, 'timings': best}
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('scale') != scale:
+            print(f"Baseline was recorded at another scale: {baseline.get('scale')}")
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+    else:
+        for stage in STAGES + ['total']:
+            print(f"{stage:<12} {best[stage]:>9.3f}")
+    print(f"rows={row_count} groups={group_count}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,115 @@
+# Benchmark of the source access paths on slow storage: the plain sqlite3.connect() path and the tuned
+# source_access path read the same files while every read of a database file is delayed, and the
+# wall-clock time of each path is reported.
+#
+# Needs the apsw package (pip install apsw): Python's sqlite3 cannot put a custom VFS under SQLite, and
+# the delayed reads come from one. A Python VFS serves no memory-mapped pages, so mmap_size has no effect
+# here. On the sample files both paths issue about the same reads: the tuned path is about read-only /
+# immutable safety (no lock, no journal check, no write possible), not speed.
+#
+# usage: python benchmark_source_access.py <[COUNT].db files> [--latency-ms 2] [--repeat 3]
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from contextlib import closing
+from extraction import list_prod_tables
+from source_access import source_uri, tune_source_connection
+
+try:
+    import apsw
+except ImportError:  # Optional, only this benchmark needs it
+    apsw = None
+
+# Name of the VFS that delays every read
+SLOW_VFS_NAME = 'slow_reads'
+
+
+# Function to register a VFS that stands in for slow storage: every read of a database file sleeps
+# latency_ms before it is served by the default VFS. Returns the VFS (keep it referenced while in use)
+# and the dictionary counting its reads.
+def register_slow_vfs(latency_ms):
+    latency = latency_ms / 1000
+    stats = {'reads': 0}
+
+    class SlowFile(apsw.VFSFile):
+        def xRead(self, amount, offset):
+            stats['reads'] += 1
+            time.sleep(latency)
+            return super().xRead(amount, offset)
+
+    class SlowVFS(apsw.VFS):
+        def __init__(self):
+            super().__init__(SLOW_VFS_NAME, '')
+
+        def xOpen(self, name, flags):
+            return SlowFile('', name, flags)
+
+    return SlowVFS(), stats
+
+
+# Function to open a file the plain way, as sqlite3.connect(file_name) does
+def connect_plain(file_name):
+    return apsw.Connection(file_name, flags=apsw.SQLITE_OPEN_READWRITE, vfs=SLOW_VFS_NAME)
+
+
+# Function to open a file the tuned way, as source_access.connect_source does
+def connect_tuned(file_name):
+    db_conn = apsw.Connection(source_uri(file_name), flags=apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_URI,
+                              vfs=SLOW_VFS_NAME)
+    return tune_source_connection(db_conn)
+
+
+# Function to read every Prod table of the files the way the report does, with one connection per file
+def read_files(file_names, connect):
+    row_count = 0
+    for file_name in file_names:
+        with closing(connect(file_name)) as db_conn:
+            for table_name in list_prod_tables(db_conn):
+                for _ in db_conn.execute(f"SELECT DateTime, Module, Data FROM {table_name}"):
+                    row_count += 1
+    return row_count
+
+
+# Function to time one access path on the slow VFS, the best wall-clock time of the runs is kept
+def run_path(name, file_names, connect, stats, latency_ms, repeat):
+    best = None
+    for _ in range(repeat):
+        reads = stats['reads']
+        start = time.perf_counter()
+        row_count = read_files(file_names, connect)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, stats['reads'] - reads, row_count)
+    elapsed, reads, row_count = best
+    print(f"{name:<8} rows={row_count:<9} reads={reads:<8} wall-clock with {latency_ms} ms per read={elapsed:.3f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the plain and the tuned source access paths on slow storage")
+    parser.add_argument('files', nargs='+', help="[COUNT].db source files to read")
+    parser.add_argument('--latency-ms', type=float, default=2.0, help="delay added to every read of a database file")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per path, the best one is kept")
+    args = parser.parse_args()
+    if apsw is None:
+        parser.error("the benchmark needs the apsw package to put a slow VFS under SQLite (pip install apsw)")
+
+    vfs, stats = register_slow_vfs(args.latency_ms)
+    # Work on local copies so both paths read the same bytes and the sources are left untouched
+    with tempfile.TemporaryDirectory() as folder:
+        file_names = []
+        for file_name in args.files:
+            copy = os.path.join(folder, os.path.basename(file_name))
+            shutil.copyfile(file_name, copy)
+            file_names.append(copy)
+        plain = run_path('plain', file_names, connect_plain, stats, args.latency_ms, args.repeat)
+        tuned = run_path('tuned', file_names, connect_tuned, stats, args.latency_ms, args.repeat)
+    vfs.unregister()
+    print(f"speedup: {plain / tuned:.2f}x (wall-clock)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,574 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from pandas.api.types import union_categoricals
+from instrumentation import PipelineMetrics, timed_stage
+from source_access import connect_source, is_closed_source
+from time_pruning import range_overlaps, table_time_range, window_id_range
+
+
+# Query listing the production tables of a [COUNT].db file
+PROD_TABLES_QUERY = "SELECT name FROM sqlite_master WHERE type='table' AND (name LIKE 'Prod_NXT%' OR name LIKE 'Prod_XPF%')"
+
+# Layout of the tab-separated "Data" payload of the Prod tables (one name per field)
+split_columns = ['Last_Panel_ID_produced', 'Conveyor_name', 'Recipe_name', 'Operator_name', 'Stage_no', 'Group_key', 'Position_no', 'Sub-Position_no', 'Parts_pickup_count', 'Error_parts_count', 'Error_rejected_parts_count', 'Rejected_parts_count', 'Dislodged_parts_count', 'NoPickup_Number_of_parts_not_used', 'Used_parts_count', 'Rescan_count', 'PartName', 'Unit_position_ID', 'FIDL', 'Module_Number', 'vide']
+columns_to_drop = ['Data', 'Last_Panel_ID_produced', 'Conveyor_name', 'Operator_name', 'Group_key', 'Sub-Position_no', 'Rescan_count', 'Unit_position_ID', 'Module_Number']
+int_columns = ['Position_no', 'Stage_no', 'Parts_pickup_count', 'Error_parts_count', 'Error_rejected_parts_count', 'Rejected_parts_count', 'Dislodged_parts_count', 'NoPickup_Number_of_parts_not_used', 'Used_parts_count']
+
+# Payload fields the report needs, with their position in the layout
+payload_columns = ['Recipe_name', 'Stage_no', 'Position_no', 'Parts_pickup_count', 'Error_parts_count', 'Error_rejected_parts_count', 'Rejected_parts_count', 'Dislodged_parts_count', 'NoPickup_Number_of_parts_not_used', 'Used_parts_count', 'PartName', 'FIDL']
+payload_positions = {column: split_columns.index(column) for column in payload_columns}
+
+# Text columns with few distinct values, kept as categoricals: one small code per row instead of a string object
+categorical_columns = ['Line_name', 'Type', 'Recipe_name', 'PartName', 'FIDL']
+
+# Widest text field decoded through a byte matrix, longer fields are sliced one by one
+TEXT_GATHER_WIDTH = 64
+
+# Powers of ten of the digits of an integer field (18 digits at most), followed by 0 for the bytes past its end
+DIGIT_POWERS = np.array([10 ** exponent for exponent in range(18)] + [0] * 18, dtype=np.int64)
+
+# Zero bytes appended to the joined payloads, so that a field window never runs past the buffer
+FIELD_WINDOW_PADDING = TEXT_GATHER_WIDTH
+
+# Integer columns stored as uint16 when every value of a frame fits (sums are computed in int64)
+narrow_columns = ['Module'] + int_columns
+
+
+# Function to list the Prod_NXT*/Prod_XPF* tables of an open database (or of one of its attached schemas)
+def list_prod_tables(db_conn, schema=None):
+    query = PROD_TABLES_QUERY if schema is None else PROD_TABLES_QUERY.replace('sqlite_master', f'{schema}.sqlite_master')
+    return [table[0] for table in db_conn.execute(query).fetchall()]
+
+
+# Function to decode the report fields of the "Data" payloads into columns.
+# The payloads are joined into one byte buffer and the tab / row separators are located with numpy,
+# which also checks in one pass that every payload has the layout's field count. Only the report fields
+# are decoded, from their byte offsets: the numeric ones into int64 arrays, the text ones with each
+# distinct value decoded once. Returns None when a payload does not follow the layout, the generic
+# split handles those.
+def parse_data_payload(data, metrics=None):
+    row_count = len(data)
+    field_count = len(split_columns)
+    if row_count == 0:
+        return {column: np.empty(0, dtype=np.int64 if column in int_columns else object) for column in payload_columns}
+    with timed_stage(metrics, 'Data split') as stage:
+        try:
+            raw = '\n'.join(data).encode('utf-8', 'surrogatepass')
+        except TypeError:
+            # NULL payloads
+            return None
+        # Zero padding lets the fields be read as fixed-width windows of the buffer
+        buffer = np.frombuffer(raw + bytes(FIELD_WINDOW_PADDING), dtype=np.uint8)
+        # Every payload must have field_count fields: the separators are then tabs, except each
+        # field_count-th one which is a row break
+        row_breaks = buffer == 10
+        separators = np.flatnonzero(row_breaks | (buffer == 9))
+        if len(separators) != row_count * field_count - 1 or np.count_nonzero(row_breaks) != row_count - 1:
+            return None
+        if not row_breaks[separators[field_count - 1::field_count]].all():
+            return None
+        # Start and end offsets of every field, one row per payload
+        bounds = np.concatenate(([-1], separators, [len(raw)]))
+        starts = (bounds[:-1] + 1).reshape(row_count, field_count)
+        ends = bounds[1:].reshape(row_count, field_count)
+        columns = {column: _decode_text(raw, buffer, starts[:, payload_positions[column]], ends[:, payload_positions[column]])
+                   for column in payload_columns if column not in int_columns}
+        stage.add(rows=row_count, bytes=len(raw))
+    with timed_stage(metrics, 'int cast') as stage:
+        for column in int_columns:
+            position = payload_positions[column]
+            columns[column] = _decode_integers(raw, buffer, starts[:, position], ends[:, position])
+        stage.add(rows=row_count, bytes=row_count * len(int_columns) * 8)
+    return columns
+
+
+# Function to decode the text field spanning [starts, ends) of each payload, as an object array.
+# Short fields are gathered into a zero-padded byte matrix read as 8-byte words, the words are
+# factorized column by column into one exact code per distinct value, and only the first payload
+# of each value is decoded. Long fields are sliced payload by payload.
+def _decode_text(raw, buffer, starts, ends):
+    lengths = ends - starts
+    width = -(-int(lengths.max()) // 8) * 8
+    if 0 < width <= TEXT_GATHER_WIDTH:
+        matrix = sliding_window_view(buffer, width)[starts]
+        matrix[np.arange(width) >= lengths[:, None]] = 0
+        words = matrix.view(np.uint64)
+        codes = np.zeros(len(starts), dtype=np.int64)
+        for word in range(words.shape[1]):
+            word_codes, word_values = pd.factorize(words[:, word])
+            codes, _ = pd.factorize(codes * len(word_values) + word_codes)
+        first = np.empty(codes.max() + 1, dtype=np.int64)
+        first[codes[::-1]] = np.arange(len(codes) - 1, -1, -1)
+        uniques = [raw[start:end] for start, end in zip(starts[first].tolist(), ends[first].tolist())]
+    else:
+        codes, uniques = pd.factorize(np.array([raw[start:end] for start, end in zip(starts.tolist(), ends.tolist())],
+                                               dtype=object))
+    return np.array([value.decode('utf-8', 'surrogatepass') for value in uniques], dtype=object)[codes]
+
+
+# Function to decode the integer field spanning [starts, ends) of each payload into an int64 array.
+# Plain digit strings are decoded digit column by digit column (18 digits at most, so no value can wrap),
+# anything else (signs, spaces, longer numbers) is left to int(), which rejects what astype(int) rejects.
+def _decode_integers(raw, buffer, starts, ends):
+    lengths = ends - starts
+    width = int(lengths.max()) if len(lengths) else 0
+    if 0 < width <= 18 and lengths.min() > 0:
+        # Power of ten of each digit, 0 past the end of the field (exponent -1 picks the trailing 0)
+        powers = DIGIT_POWERS[lengths[:, None] - 1 - np.arange(width)]
+        digits = sliding_window_view(buffer, width)[starts] - np.uint8(48)
+        if ((digits <= 9) | (powers == 0)).all():
+            return (digits * powers).sum(axis=1)
+    return np.array([int(raw[start:end]) for start, end in zip(starts.tolist(), ends.tolist())], dtype=np.int64)
+
+
+# Function to split the "Data" column and type the counters of a (DateTime, Module, Data) frame
+def parse_table_frame(df, metrics=None):
+    columns = parse_data_payload(df['Data'].tolist(), metrics)
+    if columns is None:
+        return _split_table_frame(df, metrics)
+    parsed = pd.DataFrame({'DateTime': df['DateTime'], 'Module': df['Module']})
+    for column in payload_columns:
+        parsed[column] = columns[column]
+    return _compact_frame(parsed, metrics)
+
+
+# Function to split every field of the "Data" column, used for payloads that do not follow the layout
+def _split_table_frame(df, metrics=None):
+    with timed_stage(metrics, 'Data split') as stage:
+        stage.add(rows=len(df), bytes=df['Data'].str.len().sum())
+        split_data = df['Data'].str.split('\t', expand=True)
+        split_data.columns = split_columns[:len(split_data.columns)]  # Ensure correct number of columns
+        # Concatenate split data with original DataFrame
+        df = pd.concat([df, split_data], axis=1)
+        # Drop the original "Data" column and other unwanted columns
+        drop = [col for col in columns_to_drop if col in df.columns]  # Filter existing columns
+        df.drop(columns=drop, inplace=True)
+    # Convert specified columns to integers
+    with timed_stage(metrics, 'int cast') as stage:
+        df[int_columns] = df[int_columns].astype(int)
+        stage.add(rows=len(df))
+    return _compact_frame(df, metrics)
+
+
+# Function to give a parsed frame its compact layout: DateTime and StartTime (the minute) as datetime64,
+# repeated strings as categoricals and small integers as uint16. Text is only formatted again for the report.
+def _compact_frame(df, metrics=None):
+    with timed_stage(metrics, 'datetime conversion') as stage:
+        df['DateTime'] = pd.to_datetime(df['DateTime'], format='ISO8601')
+        df['StartTime'] = df['DateTime'].dt.floor('min')
+        stage.add(rows=len(df))
+    with timed_stage(metrics, 'dictionary encode') as stage:
+        for column in categorical_columns:
+            if column in df.columns:
+                df[column] = pd.Categorical(df[column])
+        for column in narrow_columns:
+            values = df[column].to_numpy()
+            if len(values) and values.min() >= 0 and values.max() <= np.iinfo(np.uint16).max:
+                df[column] = values.astype(np.uint16)
+        stage.add(rows=len(df), bytes=df.memory_usage(index=False).sum())
+    return df
+
+
+# Function to build the categorical column of a value shared by all the rows of a frame
+def _constant_column(value, length):
+    return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), [value])
+
+
+# Function to concatenate parsed frames. Plain pd.concat turns categoricals with different categories
+# into string objects, so the categorical columns are merged with union_categoricals (sorted categories,
+# the order SQLite sorts the text in).
+def concat_frames(frames):
+    categorical = [column for column in frames[0].columns
+                   if all(column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames)]
+    collected_data = pd.concat([df.drop(columns=categorical) for df in frames], ignore_index=True)
+    for column in categorical:
+        collected_data[column] = union_categoricals([df[column] for df in frames], sort_categories=True)
+    return collected_data[list(dict.fromkeys(column for df in frames for column in df.columns))]
+
+
+# Function to read and parse the rows of one table inside the time window
+# Returns None when the table has no row in the window
+# With pruning, tables whose DateTime range misses the window are skipped and only the id range
+# of the window (found by binary search on id) is read
+# With metrics, the query / parse stages and the time spent on the table are recorded
+def extract_table(db_conn, file_name, table_name, server, start_datetime, end_datetime, cache=None, pruning=False, metrics=None):
+    if metrics is None:
+        return _read_table(db_conn, file_name, table_name, server, start_datetime, end_datetime, cache, pruning)
+    started = time.perf_counter()
+    df = _read_table(db_conn, file_name, table_name, server, start_datetime, end_datetime, cache, pruning, metrics)
+    metrics.add_table(server, file_name, table_name, time.perf_counter() - started, 0 if df is None else len(df))
+    return df
+
+
+def _read_table(db_conn, file_name, table_name, server, start_datetime, end_datetime, cache, pruning, metrics=None):
+    fetched = _fetch_table(db_conn, file_name, table_name, start_datetime, end_datetime, cache, pruning, metrics)
+    return _parse_fetched(fetched, file_name, table_name, server, start_datetime, end_datetime, cache, metrics)
+
+
+# Function to read the rows of a source query. pandas wraps SQLite errors (a corrupt table, a file
+# that is not a database) into its own DatabaseError, they are raised again as sqlite3 errors so every
+# caller handles them like the errors of opening the file.
+def read_source_rows(db_conn, query, params=None):
+    try:
+        return pd.read_sql_query(query, db_conn, params=params)
+    except pd.errors.DatabaseError as error:
+        raise sqlite3.DatabaseError(str(error)) from error
+
+
+# Function to run the I/O half of a table read: pruning checks, cache lookup and SQL query.
+# Returns None when the table has no row to read, else (rows, parsed, cache key) with either the
+# raw rows still to parse or the whole parsed table found in the cache. Files still being written
+# change at every run, so their tables are never cached: only the window is read, like without cache
+# (the cache key is then None).
+def _fetch_table(db_conn, file_name, table_name, start_datetime, end_datetime, cache, pruning, metrics=None):
+    if cache is not None and not is_closed_source(file_name):
+        cache = None
+    if pruning and cache is not None:
+        if not range_overlaps(table_time_range(db_conn, table_name, file_name), start_datetime, end_datetime):
+            return None
+    if cache is None:
+        if pruning:
+            id_range = window_id_range(db_conn, table_name, start_datetime, end_datetime, file_name)
+            if id_range is None:
+                return None
+            query = f"SELECT DateTime, Module, Data FROM {table_name} WHERE id BETWEEN ? AND ? AND DateTime >= ? AND DateTime <= ?"
+            params = id_range + (start_datetime, end_datetime)
+        else:
+            query = f"SELECT DateTime, Module, Data FROM {table_name} WHERE DateTime >= ? AND DateTime <= ?"
+            params = (start_datetime, end_datetime)
+        with timed_stage(metrics, 'query') as stage:
+            df = read_source_rows(db_conn, query, params)
+            stage.add(rows=len(df))
+        if df.empty:
+            return None
+        return df, None, None
+
+    # The cache holds the whole parsed table, the window is applied afterwards
+    key = cache.source_key(file_name, db_conn, table_name)
+    parsed = cache.get(file_name, table_name, key)
+    if parsed is not None:
+        return None, parsed, key
+    with timed_stage(metrics, 'query') as stage:
+        df = read_source_rows(db_conn, f"SELECT DateTime, Module, Data FROM {table_name}")
+        stage.add(rows=len(df))
+    return df, None, key
+
+
+# Function to run the CPU half of a table read: parse the fetched rows (storing the parsed table in the cache)
+# and keep the rows of the window. Returns None when no row is left.
+def _parse_fetched(fetched, file_name, table_name, server, start_datetime, end_datetime, cache, metrics=None):
+    if fetched is None:
+        return None
+    rows, parsed, key = fetched
+    if key is None:
+        df = parse_table_frame(rows, metrics)
+    else:
+        if parsed is None:
+            parsed = rows if rows.empty else parse_table_frame(rows, metrics)
+            cache.put(file_name, table_name, key, parsed)
+        if parsed.empty:
+            return None
+        # Same window as the SQL text comparison: DateTime carries milliseconds, so a row stamped
+        # exactly at the end minute ('HH:MM:00.000') sorts after 'HH:MM:00' and is left out
+        in_window = (parsed['DateTime'] >= start_datetime) & (parsed['DateTime'] < end_datetime)
+        df = parsed[in_window].reset_index(drop=True)
+        if df.empty:
+            return None
+
+    # Add Line_name and Type columns
+    df['Line_name'] = _constant_column(server, len(df))
+    df['Type'] = _constant_column('XPF' if 'Prod_XPF' in table_name else 'NXT', len(df))
+    return df
+
+
+# Connection of the file a worker process read last: jobs are submitted file by file,
+# so the following tables of the same file reuse it
+_worker_connection = {}
+
+
+# Function to return the worker's connection to a source file, closing the previous file's one
+def _worker_source(file_name):
+    if file_name not in _worker_connection:
+        for db_conn in _worker_connection.values():
+            db_conn.close()
+        _worker_connection.clear()
+        _worker_connection[file_name] = connect_source(file_name)
+    return _worker_connection[file_name]
+
+
+# Function run in a worker process: extract one (file, table) pair and return its columns as arrays
+# (categoricals travel as codes + categories), with the worker's metrics of the table when they are collected
+def extract_table_columns(file_name, table_name, server, start_datetime, end_datetime, cache=None, pruning=False,
+                          collect_metrics=False):
+    metrics = PipelineMetrics() if collect_metrics else None
+    with timed_stage(metrics, 'DB open'):
+        db_conn = _worker_source(file_name)
+    df = extract_table(db_conn, file_name, table_name, server, start_datetime, end_datetime, cache, pruning, metrics)
+    columns = None if df is None else {column: df[column].array for column in df.columns}
+    return columns, None if metrics is None else metrics.to_dict()
+
+
+# Function to read the worker count from the [Processing] section of config.ini (0 = one per CPU core)
+def read_worker_count(config):
+    workers = config.getint('Processing', 'workers', fallback=1)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+# Function to read whether time-window pruning is enabled in the [Processing] section of config.ini
+def read_time_pruning(config):
+    return config.getboolean('Processing', 'time_pruning', fallback=False)
+
+
+# Function to read the aggregation mode from the [Processing] section of config.ini
+# ('memory', 'streaming', 'pushdown', 'warehouse', or 'sqlite' for the temporary database fallback)
+def read_aggregation_mode(config):
+    return config.get('Processing', 'aggregation', fallback='memory').strip().lower()
+
+
+# Function to read the read-ahead settings from the [Processing] section of config.ini:
+# (number of threads reading the files ahead, 0 = no read-ahead, depth of the hand-over queues)
+def read_prefetch_settings(config):
+    read_threads = max(config.getint('Processing', 'read_threads', fallback=0), 0)
+    queue_depth = max(config.getint('Processing', 'queue_depth', fallback=4), 1)
+    return read_threads, queue_depth
+
+
+# Function to extract every Prod table of the (server, file_name) pairs
+# Frames are returned in (server, file, table) order whatever the number of workers,
+# so the pool mode produces the same report as the serial mode.
+# When on_frame is given each frame is handed to it instead of being kept in the returned list.
+# With a PipelineMetrics, every stage and table is recorded into it (the workers' ones included).
+# on_file(file_name, done, total) is called once each file is finished (read or failed).
+# cancelled() is checked at every file and table boundary: once it returns True no other table is
+# read and the frames extracted so far are returned.
+# With read_threads (serial mode only), the files are read ahead by that many threads while the
+# previous ones are parsed, queue_depth bounding the files waiting between two stages.
+def extract_files(file_tasks, start_datetime, end_datetime, cache=None, workers=1, on_error=None, on_frame=None, pruning=False,
+                  metrics=None, on_file=None, cancelled=None, read_threads=0, queue_depth=4):
+    frames = []
+    if on_frame is None:
+        on_frame = frames.append
+    if on_file is None:
+        on_file = _ignore_file
+    if cancelled is None:
+        cancelled = _never_cancelled
+    if workers > 1:
+        _extract_files_in_pool(file_tasks, start_datetime, end_datetime, cache, workers, on_error, on_frame, pruning, metrics,
+                               on_file, cancelled)
+        return frames
+    if read_threads > 0:
+        _extract_files_pipelined(file_tasks, start_datetime, end_datetime, cache, on_error, on_frame, pruning, metrics,
+                                 on_file, cancelled, read_threads, queue_depth)
+        return frames
+    for done, (server, file_name) in enumerate(file_tasks, start=1):
+        if cancelled():
+            break
+        try:
+            with timed_stage(metrics, 'DB open') as stage:
+                db_conn = connect_source(file_name)
+                stage.add(bytes=os.path.getsize(file_name))
+            with closing(db_conn):
+                for table_name in list_prod_tables(db_conn):
+                    if cancelled():
+                        break
+                    df = extract_table(db_conn, file_name, table_name, server, start_datetime, end_datetime, cache, pruning, metrics)
+                    if df is not None:
+                        on_frame(df)
+        except sqlite3.Error:
+            if on_error is not None:
+                on_error(file_name)
+        on_file(file_name, done, len(file_tasks))
+    return frames
+
+
+def _ignore_file(file_name, done, total):
+    pass
+
+
+def _never_cancelled():
+    return False
+
+
+# Marks the end of a hand-over queue
+_END = object()
+
+
+# Function to put an item into a bounded queue, waiting for room unless the pipeline is stopped.
+# Returns False when it was stopped first.
+def _put_item(items, item, stop):
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+# Function to take the next item of a queue, None once the pipeline is stopped
+def _get_item(items, stop):
+    while not stop.is_set():
+        try:
+            return items.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return None
+
+
+# Function to extract the files in three overlapped stages: read_threads threads open the files and
+# run the I/O half of their tables ahead (queries, cache lookups), one thread parses the fetched rows
+# and the calling thread hands the frames over in file order. The stages are linked by queues of
+# queue_depth files, a full queue blocks the stage feeding it, so the memory held by the files read
+# ahead stays bounded however fast the disk is compared to the parsing.
+def _extract_files_pipelined(file_tasks, start_datetime, end_datetime, cache, on_error, on_frame, pruning, metrics,
+                             on_file, cancelled, read_threads, queue_depth):
+    stop = threading.Event()
+    fetched_files = queue.Queue(maxsize=queue_depth)
+    parsed_files = queue.Queue(maxsize=queue_depth)
+
+    # Stage 1 (read threads): fetch the tables of one file, returns ([(table_name, fetched, seconds)], failed)
+    def fetch_file(file_name):
+        tables = []
+        try:
+            with timed_stage(metrics, 'DB open') as stage:
+                db_conn = connect_source(file_name)
+                stage.add(bytes=os.path.getsize(file_name))
+            with closing(db_conn):
+                for table_name in list_prod_tables(db_conn):
+                    if stop.is_set() or cancelled():
+                        break
+                    started = time.perf_counter()
+                    fetched = _fetch_table(db_conn, file_name, table_name, start_datetime, end_datetime, cache, pruning, metrics)
+                    tables.append((table_name, fetched, time.perf_counter() - started))
+        except sqlite3.Error:
+            return tables, True
+        return tables, False
+
+    # Files are submitted in order, the queue holding their futures throttles the reads
+    def feed(executor):
+        for server, file_name in file_tasks:
+            if stop.is_set() or cancelled():
+                break
+            if not _put_item(fetched_files, (server, file_name, executor.submit(fetch_file, file_name)), stop):
+                return
+        _put_item(fetched_files, _END, stop)
+
+    # Stage 2 (parse thread): parse the fetched tables of each file in order
+    def parse():
+        try:
+            while True:
+                item = _get_item(fetched_files, stop)
+                if item is None:
+                    return
+                if item is _END:
+                    _put_item(parsed_files, _END, stop)
+                    return
+                server, file_name, future = item
+                tables, failed = future.result()
+                frames = []
+                for table_name, fetched, seconds in tables:
+                    started = time.perf_counter()
+                    try:
+                        df = _parse_fetched(fetched, file_name, table_name, server, start_datetime, end_datetime, cache, metrics)
+                    except sqlite3.Error:
+                        failed = True
+                        break
+                    if metrics is not None:
+                        metrics.add_table(server, file_name, table_name, seconds + time.perf_counter() - started,
+                                          0 if df is None else len(df))
+                    if df is not None:
+                        frames.append(df)
+                if not _put_item(parsed_files, (file_name, frames, failed), stop):
+                    return
+        except BaseException as error:
+            # Raised again in the calling thread
+            _put_item(parsed_files, error, stop)
+
+    # Stage 3 (calling thread): hand the frames over and report the files
+    executor = ThreadPoolExecutor(max_workers=read_threads)
+    feeder = threading.Thread(target=feed, args=(executor,), daemon=True)
+    parser = threading.Thread(target=parse, daemon=True)
+    feeder.start()
+    parser.start()
+    try:
+        done = 0
+        while True:
+            item = _get_item(parsed_files, stop)
+            if item is None or item is _END:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            if cancelled():
+                break
+            file_name, frames, failed = item
+            for df in frames:
+                on_frame(df)
+            if failed and on_error is not None:
+                on_error(file_name)
+            done += 1
+            on_file(file_name, done, len(file_tasks))
+    finally:
+        # Stop the other stages (also on cancel or error): reads not started yet are dropped
+        stop.set()
+        feeder.join()
+        parser.join()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def _extract_files_in_pool(file_tasks, start_datetime, end_datetime, cache, workers, on_error, on_frame, pruning, metrics,
+                           on_file, cancelled):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Step 1: List the tables in the parent and submit one job per (file, table) pair
+        jobs = []
+        for server, file_name in file_tasks:
+            if cancelled():
+                break
+            try:
+                with closing(connect_source(file_name)) as db_conn:
+                    tables = list_prod_tables(db_conn)
+                    if pruning:
+                        # Tables (and so whole files) outside the window are never sent to a worker
+                        tables = [table_name for table_name in tables
+                                  if range_overlaps(table_time_range(db_conn, table_name, file_name), start_datetime, end_datetime)]
+            except sqlite3.Error:
+                jobs.append((file_name, None))
+                continue
+            futures = [executor.submit(extract_table_columns, file_name, table_name, server, start_datetime, end_datetime, cache, pruning,
+                                       metrics is not None)
+                       for table_name in tables]
+            jobs.append((file_name, futures))
+
+        # Step 2: Rebuild the frames from the returned column arrays, in submission order
+        for done, (file_name, futures) in enumerate(jobs, start=1):
+            failed = futures is None
+            for future in futures or []:
+                if cancelled():
+                    break
+                try:
+                    columns, worker_metrics = future.result()
+                except sqlite3.Error:
+                    failed = True
+                    continue
+                if worker_metrics is not None:
+                    metrics.merge(worker_metrics)
+                if columns is not None:
+                    on_frame(pd.DataFrame(columns))
+            if failed and on_error is not None:
+                on_error(file_name)
+            if cancelled():
+                # Jobs not started yet are dropped, the running ones finish their table
+                for _, pending in jobs[done - 1:]:
+                    for future in pending or []:
+                        future.cancel()
+                break
+            on_file(file_name, done, len(file_tasks))
@@ -0,0 +1,176 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Stages of the report pipeline, in the order they are shown
+PIPELINE_STAGES = ['file discovery', 'result cache', 'DB open', 'query', 'Data split', 'int cast', 'datetime conversion',
+                   'dictionary encode', 'concat', 'to_sql', 'aggregate', 'report write', 'raw export']
+
+
+# Size (MB) at which the log file is rotated and number of rotated files kept (app.log.1 ... app.log.N)
+LOG_MAX_SIZE_MB = 5
+LOG_BACKUP_COUNT = 3
+
+
+# Function to read the peak memory (resident set high-water mark) of the process in bytes, None when unknown
+def peak_memory_bytes():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    return None
+
+
+# Totals of one stage: time spent, rows and bytes processed, number of calls and the peak memory
+# of the process when the stage last ended. Updates are locked, stages may run in several threads at once.
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.calls = 0
+        self.peak_memory = None
+
+    def add(self, rows=0, bytes=0):
+        with self.lock:
+            self.rows += int(rows)
+            self.bytes += int(bytes)
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else None
+
+    def to_dict(self):
+        return {'stage': self.name, 'seconds': round(self.seconds, 6), 'rows': self.rows, 'bytes': self.bytes,
+                'calls': self.calls, 'rows_per_second': None if self.rows_per_second is None else round(self.rows_per_second, 1),
+                'peak_memory': self.peak_memory}
+
+
+# Stage that records nothing, used when no metrics are collected
+class _IgnoredStage:
+    def add(self, rows=0, bytes=0):
+        pass
+
+
+# Metrics of one report run: totals per stage plus the timing of every (file, table) pair
+class PipelineMetrics:
+    def __init__(self):
+        self.stages = {}
+        self.tables = []
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+
+    # Function to return the totals of a stage, created on first use
+    def _stage(self, name):
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = StageMetrics(name)
+            return stage
+
+    @contextmanager
+    def stage(self, name):
+        stage = self._stage(name)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            seconds = time.perf_counter() - start
+            peak_memory = peak_memory_bytes()
+            with stage.lock:
+                stage.seconds += seconds
+                stage.calls += 1
+                stage.peak_memory = peak_memory
+
+    def add_table(self, line, file_name, table_name, seconds, rows):
+        self.tables.append({'line': line, 'file': file_name, 'table': table_name, 'seconds': round(seconds, 6), 'rows': rows})
+
+    # Function to add the metrics a worker process sent back (the dict of to_dict())
+    def merge(self, other):
+        for stage_dict in other['stages']:
+            stage = self._stage(stage_dict['stage'])
+            stage.seconds += stage_dict['seconds']
+            stage.rows += stage_dict['rows']
+            stage.bytes += stage_dict['bytes']
+            stage.calls += stage_dict['calls']
+            if stage_dict['peak_memory'] is not None:
+                stage.peak_memory = max(stage.peak_memory or 0, stage_dict['peak_memory'])
+        self.tables.extend(other['tables'])
+
+    # Function to list the stages in pipeline order (stages outside PIPELINE_STAGES come last)
+    def ordered_stages(self):
+        order = {name: index for index, name in enumerate(PIPELINE_STAGES)}
+        return sorted(self.stages.values(), key=lambda stage: order.get(stage.name, len(order)))
+
+    def to_dict(self):
+        return {'stages': [stage.to_dict() for stage in self.ordered_stages()], 'tables': list(self.tables),
+                'wall_seconds': round(time.perf_counter() - self.started, 6)}
+
+    # Function to append the run to the log file as JSON lines: one per stage, one per table and a summary.
+    # The file is rotated once it would grow past max_bytes, the last backup_count files are kept.
+    def write_log(self, log_file, max_bytes=LOG_MAX_SIZE_MB * 1024 * 1024, backup_count=LOG_BACKUP_COUNT, **context):
+        logged_at = datetime.now().isoformat(timespec='seconds')
+        metrics = self.to_dict()
+        entries = [{'time': logged_at, 'event': 'stage', **context, **stage} for stage in metrics['stages']]
+        entries += [{'time': logged_at, 'event': 'table', **context, **table} for table in metrics['tables']]
+        entries.append({'time': logged_at, 'event': 'run', **context, 'wall_seconds': metrics['wall_seconds'],
+                        'peak_memory': peak_memory_bytes()})
+        # Without a backup the handler would never rotate, so at least one is kept
+        log = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=max(backup_count, 1), encoding='utf-8')
+        try:
+            for entry in entries:
+                log.emit(logging.makeLogRecord({'msg': json.dumps(entry)}))
+        finally:
+            log.close()
+
+
+# Function to time a stage when metrics are collected: with timed_stage(metrics, 'query') as stage: ...
+@contextmanager
+def timed_stage(metrics, name):
+    if metrics is None:
+        yield _IgnoredStage()
+        return
+    with metrics.stage(name) as stage:
+        yield stage
+
+
+# Function to return the log file path next to the application (app.log)
+def default_log_file():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.log')
+
+
+# Function to read the [Logging] section of config.ini: (log file, max bytes, backup count).
+# A relative file is taken from the application folder, not from the working directory.
+def read_log_settings(config):
+    log_file = os.path.join(os.path.dirname(default_log_file()), config.get('Logging', 'file', fallback='app.log'))
+    max_size_mb = config.getfloat('Logging', 'max_size_mb', fallback=LOG_MAX_SIZE_MB)
+    return log_file, int(max_size_mb * 1024 * 1024), config.getint('Logging', 'backups', fallback=LOG_BACKUP_COUNT)
@@ -0,0 +1,251 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+import numpy as np
+from aggregation import MINUTE_NS, read_shift_starts, shift_bucket_starts
+from extraction import list_prod_tables, parse_data_payload, payload_positions
+from source_access import connect_source
+from source_catalog import list_source_files
+from time_pruning import table_time_range, window_id_range
+
+# Counters kept by the rolling windows, in the order of the ring buffer buckets
+live_counters = ['Parts_pickup_count', 'Rejected_parts_count', 'NoPickup_Number_of_parts_not_used', 'Error_parts_count']
+
+
+# Start of the minute indexes: minutes are counted from the Unix epoch, like the int64 timestamps of aggregation
+MINUTE_EPOCH = datetime(1970, 1, 1)
+
+
+# Function to turn a 'YYYY-MM-DD HH:MM...' DateTime into an integer minute index
+def minute_index(date_time):
+    moment = datetime.fromisoformat(date_time[:16])
+    return (moment - MINUTE_EPOCH) // timedelta(minutes=1)
+
+
+# Function to compute the minute index the shift of a minute index starts at (shift calendar of aggregation)
+def shift_start_minute(minute, shift_starts):
+    return int(shift_bucket_starts(np.array([minute * MINUTE_NS], dtype=np.int64), shift_starts)[0] // MINUTE_NS)
+
+
+# Rolling window over the last `size` minutes: one bucket per minute in a fixed-size ring buffer
+# and running totals, so adding a row and reading the totals are O(1)
+class RollingWindow:
+    def __init__(self, size):
+        self.size = size
+        self.buckets = [[0] * len(live_counters) for _ in range(size)]
+        self.totals = [0] * len(live_counters)
+        self.latest_minute = None
+        # Minute of the latest row added, to tell when the window has emptied
+        self.last_row_minute = None
+
+    # Function to move the window end to `minute`, clearing the buckets that fall out of it
+    def advance_to(self, minute):
+        if self.latest_minute is None:
+            self.latest_minute = minute
+            return
+        if minute <= self.latest_minute:
+            return
+        for expired in range(self.latest_minute + 1, min(minute, self.latest_minute + self.size) + 1):
+            bucket = self.buckets[expired % self.size]
+            for index, value in enumerate(bucket):
+                self.totals[index] -= value
+                bucket[index] = 0
+        self.latest_minute = minute
+
+    def add(self, minute, values):
+        self.advance_to(minute)
+        if minute <= self.latest_minute - self.size:
+            return  # Older than the window
+        bucket = self.buckets[minute % self.size]
+        for index, value in enumerate(values):
+            bucket[index] += value
+            self.totals[index] += value
+        if self.last_row_minute is None or minute > self.last_row_minute:
+            self.last_row_minute = minute
+
+    # Function to tell whether every row added has fallen out of the window
+    def is_empty(self):
+        return self.last_row_minute is None or self.last_row_minute <= self.latest_minute - self.size
+
+    # Function to compute (PickupCount, RejectRate, ErrorPickupRate, ErrorRate) of the window
+    def rates(self):
+        return _window_rates(self.totals)
+
+
+# Window of the current shift of the [Shifts] calendar: totals since the shift started, cleared when
+# the next shift starts. Shift starts come from shift_bucket_starts, like the shifts of the reports and trends.
+class ShiftWindow:
+    def __init__(self, shift_starts):
+        self.shift_starts = shift_starts
+        self.totals = [0] * len(live_counters)
+        # Minute indexes the current shift starts and ends at
+        self.shift_start = None
+        self.shift_end = None
+        self.last_row_minute = None
+
+    # Function to move the window to the shift of `minute`, clearing the totals when a new shift has started
+    def advance_to(self, minute):
+        if self.shift_start is not None and minute < self.shift_end:
+            return
+        shift_start = shift_start_minute(minute, self.shift_starts)
+        if self.shift_start is not None and shift_start <= self.shift_start:
+            return
+        self.shift_start = shift_start
+        self.shift_end = self._next_shift_start(shift_start)
+        self.totals = [0] * len(live_counters)
+
+    # Function to compute the minute index the shift after the one starting at shift_start starts at
+    def _next_shift_start(self, shift_start):
+        day_start = shift_start - shift_start % 1440
+        later_starts = [start for start in self.shift_starts if day_start + start > shift_start]
+        return day_start + later_starts[0] if later_starts else day_start + 1440 + self.shift_starts[0]
+
+    def add(self, minute, values):
+        self.advance_to(minute)
+        if minute < self.shift_start:
+            return  # Row of a previous shift
+        for index, value in enumerate(values):
+            self.totals[index] += value
+        if self.last_row_minute is None or minute > self.last_row_minute:
+            self.last_row_minute = minute
+
+    # Function to tell whether no row of the current shift was added
+    def is_empty(self):
+        return self.last_row_minute is None or self.last_row_minute < self.shift_start
+
+    def rates(self):
+        return _window_rates(self.totals)
+
+
+# Function to compute (PickupCount, RejectRate, ErrorPickupRate, ErrorRate) from the totals of a window
+def _window_rates(totals):
+    pickups, rejects, misses, errors = totals
+    if pickups == 0:
+        return pickups, None, None, None
+    return pickups, rejects / pickups * 100, misses / pickups * 100, errors / pickups * 100
+
+
+# Follows today's [COUNT].db file(s) of each line: only rows above the per-table id high-water mark
+# are read at each poll, and they are folded into rolling windows per (Line, Module, FIDL).
+# window_minutes maps each window name to its length in minutes, None naming the current shift of
+# the shift_starts calendar (minutes of the day). Keys whose windows have all emptied are dropped.
+class LiveTail:
+    def __init__(self, line_folders, window_minutes, shift_starts=None):
+        if shift_starts is None and None in window_minutes.values():
+            raise ValueError("A shift window needs the shift start times")
+        self.line_folders = line_folders
+        self.window_minutes = window_minutes
+        self.shift_starts = shift_starts
+        # (path, table) -> last id read
+        self.high_water_marks = {}
+        # (Line, Module, FIDL) -> {window name: RollingWindow}
+        self.windows = {}
+        self.latest_minute = None
+
+    # Function to read the rows added since the previous poll. Returns the number of new rows.
+    def poll(self, now=None):
+        now = now or datetime.now()
+        today = now.strftime('%Y%m%d')
+        new_rows = 0
+        followed = set()
+        for line, folder in self.line_folders.items():
+            for file_name in list_source_files(folder, today, today):
+                try:
+                    with closing(connect_source(file_name)) as db_conn:
+                        for table_name in list_prod_tables(db_conn):
+                            followed.add((file_name, table_name))
+                            new_rows += self._read_new_rows(db_conn, file_name, table_name, line, now)
+                except sqlite3.Error:
+                    continue
+        # Files of the previous days are no longer followed
+        for key in set(self.high_water_marks) - followed:
+            del self.high_water_marks[key]
+        if self.latest_minute is not None:
+            for key, key_windows in list(self.windows.items()):
+                for window in key_windows.values():
+                    window.advance_to(self.latest_minute)
+                if all(window.is_empty() for window in key_windows.values()):
+                    del self.windows[key]
+        return new_rows
+
+    # Function to compute the first moment the windows ending at `moment` can hold
+    def _window_start(self, moment):
+        starts = [moment - timedelta(minutes=size) for size in self.window_minutes.values() if size is not None]
+        if None in self.window_minutes.values():
+            minute = (moment - MINUTE_EPOCH) // timedelta(minutes=1)
+            starts.append(MINUTE_EPOCH + timedelta(minutes=shift_start_minute(minute, self.shift_starts)))
+        return min(starts)
+
+    def _read_new_rows(self, db_conn, file_name, table_name, line, now):
+        key = (file_name, table_name)
+        if key not in self.high_water_marks:
+            # First poll of this table: start at the beginning of the longest window ending at its last row
+            time_range = table_time_range(db_conn, table_name)
+            if time_range is None:
+                self.high_water_marks[key] = 0
+                return 0
+            last_minute = min(now, datetime.fromisoformat(time_range[3][:16]))
+            seed_start = self._window_start(last_minute)
+            id_range = window_id_range(db_conn, table_name, seed_start, now)
+            if id_range is None:
+                self.high_water_marks[key] = time_range[1]
+                return 0
+            self.high_water_marks[key] = id_range[0] - 1
+        rows = db_conn.execute(f"SELECT id, DateTime, Module, Data FROM {table_name} WHERE id > ? ORDER BY id",
+                               (self.high_water_marks[key],)).fetchall()
+        if not rows:
+            return 0
+        self.high_water_marks[key] = rows[-1][0]
+        columns = parse_data_payload([row[3] for row in rows])
+        if columns is None:
+            columns = self._split_rows(rows)
+        for index, row in enumerate(rows):
+            if columns['FIDL'][index] is None:
+                continue
+            minute = minute_index(row[1])
+            values = [int(columns[counter][index]) for counter in live_counters]
+            self._add(line, row[2], columns['FIDL'][index], minute, values)
+        return len(rows)
+
+    # Function to split rows one by one when a payload does not follow the layout (unreadable rows are skipped)
+    @staticmethod
+    def _split_rows(rows):
+        columns = {column: [] for column in live_counters + ['FIDL']}
+        for row in rows:
+            fields = row[3].split('\t')
+            try:
+                values = [int(fields[payload_positions[counter]]) for counter in live_counters]
+                fidl = fields[payload_positions['FIDL']]
+            except (IndexError, ValueError):
+                values, fidl = [0] * len(live_counters), None
+            for counter, value in zip(live_counters, values):
+                columns[counter].append(value)
+            columns['FIDL'].append(fidl)
+        return columns
+
+    def _add(self, line, module, fidl, minute, values):
+        key_windows = self.windows.get((line, module, fidl))
+        if key_windows is None:
+            key_windows = {name: RollingWindow(size) if size is not None else ShiftWindow(self.shift_starts)
+                           for name, size in self.window_minutes.items()}
+            self.windows[(line, module, fidl)] = key_windows
+        for window in key_windows.values():
+            window.add(minute, values)
+        if self.latest_minute is None or minute > self.latest_minute:
+            self.latest_minute = minute
+
+    # Function to list one row per (Line, Module, FIDL): the key, then (PickupCount, RejectRate,
+    # ErrorPickupRate, ErrorRate) of each window in the order of window_minutes
+    def snapshot(self):
+        rows = []
+        for key, key_windows in self.windows.items():
+            rows.append(key + tuple(key_windows[name].rates() for name in self.window_minutes))
+        return rows
+
+
+# Function to read the windows and poll interval from the [Live] section of config.ini: (window lengths,
+# None for the current shift, poll seconds, shift start times of the [Shifts] section)
+def read_live_settings(config):
+    window_minutes = {'15 min': 15, '1 h': 60, 'Shift': None}
+    poll_seconds = config.getfloat('Live', 'poll_seconds', fallback=10)
+    return window_minutes, poll_seconds, read_shift_starts(config)
@@ -9,6 +9,7 @@ import os
 import sqlite3
 import config
 import Function
+from extraction import split_columns
 import threading
 
 # Function to format StartTime column
@@ -75,7 +76,6 @@ def collect_data_thread():
                     df['Line_name'] = server
                     df['Type'] = 'XPF' if 'Prod_XPF' in table_name else 'NXT'
                     # Split the "Data" column into multiple columns using tabs
-                    split_columns = ['Last_Panel_ID_produced', 'Conveyor_name', 'Recipe_name', 'Operator_name', 'Stage_no', 'Group_key', 'Position_no', 'Sub-Position_no', 'Parts_pickup_count', 'Error_parts_count', 'Error_rejected_parts_count', 'Rejected_parts_count', 'Dislodged_parts_count', 'NoPickup_Number_of_parts_not_used', 'Used_parts_count', 'Rescan_count', 'PartName', 'Unit_position_ID', 'FIDL', 'Module_Number', 'vide']
                     split_data = df['Data'].str.split('\t', expand=True)
                     split_data.columns = split_columns[:len(split_data.columns)]  # Ensure correct number of columns
                     # Concatenate split data with original DataFrame
@@ -0,0 +1,106 @@
+import os
+import sqlite3
+import time
+import pandas as pd
+
+# Layout of the cached frames (PRAGMA user_version of the index), entries of another layout are dropped.
+# 2: DateTime/StartTime as datetime64, categorical strings, uint16 integers
+FRAME_LAYOUT_VERSION = 2
+
+
+# On-disk cache of the parsed, typed columns of each Prod_NXT*/Prod_XPF* table.
+# An entry is only reused while the source file keeps the same size, mtime and last id,
+# so closed files are read from the cache and files still being written are parsed again.
+class ParsedTableCache:
+    def __init__(self, cache_dir, max_size_bytes):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index_file = os.path.join(cache_dir, 'index.db')
+        with sqlite3.connect(self.index_file) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    path TEXT,
+                    table_name TEXT,
+                    size INTEGER,
+                    mtime REAL,
+                    last_id INTEGER,
+                    frame_file TEXT,
+                    nbytes INTEGER,
+                    last_used REAL,
+                    PRIMARY KEY (path, table_name)
+                )
+            """)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != FRAME_LAYOUT_VERSION:
+                for (frame_file,) in conn.execute("SELECT frame_file FROM entries").fetchall():
+                    self._remove_frame_file(frame_file)
+                conn.execute("DELETE FROM entries")
+                conn.execute(f"PRAGMA user_version = {FRAME_LAYOUT_VERSION}")
+
+    # Function to build the validity key of a table: (size, mtime, last id)
+    @staticmethod
+    def source_key(file_name, db_conn, table_name):
+        stat = os.stat(file_name)
+        last_id = db_conn.execute(f"SELECT MAX(id) FROM {table_name}").fetchone()[0]
+        return stat.st_size, stat.st_mtime, last_id
+
+    # Function to return the cached frame, or None when missing or stale
+    def get(self, file_name, table_name, key):
+        path = os.path.abspath(file_name)
+        with sqlite3.connect(self.index_file) as conn:
+            row = conn.execute(
+                "SELECT size, mtime, last_id, frame_file FROM entries WHERE path = ? AND table_name = ?",
+                (path, table_name)).fetchone()
+            if row is None or tuple(row[:3]) != tuple(key):
+                return None
+            frame_file = os.path.join(self.cache_dir, row[3])
+            try:
+                df = pd.read_pickle(frame_file)
+            except (OSError, EOFError, ValueError):
+                conn.execute("DELETE FROM entries WHERE path = ? AND table_name = ?", (path, table_name))
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE path = ? AND table_name = ?",
+                         (time.time(), path, table_name))
+        return df
+
+    # Function to store a parsed frame and evict the least recently used entries
+    def put(self, file_name, table_name, key, df):
+        path = os.path.abspath(file_name)
+        with sqlite3.connect(self.index_file) as conn:
+            row = conn.execute("SELECT frame_file FROM entries WHERE path = ? AND table_name = ?",
+                               (path, table_name)).fetchone()
+            if row is not None:
+                self._remove_frame_file(row[0])
+            frame_file = f"{abs(hash((path, table_name, key))):x}_{int(time.time() * 1000)}.pkl"
+            df.to_pickle(os.path.join(self.cache_dir, frame_file))
+            nbytes = os.path.getsize(os.path.join(self.cache_dir, frame_file))
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (path, table_name, key[0], key[1], key[2], frame_file, nbytes, time.time()))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        for path, table_name, frame_file, nbytes in conn.execute(
+                "SELECT path, table_name, frame_file, nbytes FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_size_bytes:
+                break
+            self._remove_frame_file(frame_file)
+            conn.execute("DELETE FROM entries WHERE path = ? AND table_name = ?", (path, table_name))
+            total -= nbytes
+
+    def _remove_frame_file(self, frame_file):
+        try:
+            os.remove(os.path.join(self.cache_dir, frame_file))
+        except OSError:
+            pass
+
+
+# Function to open the cache described by the [Cache] section of config.ini (None when disabled)
+def open_parsed_cache(config):
+    if not config.has_section('Cache') or not config.getboolean('Cache', 'enabled', fallback=False):
+        return None
+    cache_dir = config.get('Cache', 'directory', fallback='parsed_cache')
+    max_size_mb = config.getint('Cache', 'max_size_mb', fallback=512)
+    return ParsedTableCache(cache_dir, max_size_mb * 1024 * 1024)
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from aggregation import StreamingAggregator, group_columns, sum_columns
+from batch_reports import ReportSpec, run_report_batch
+from report_writers import write_report_file
+
+# Rows of a part usage export handed to pandas at once
+PUS_CHUNK_ROWS = 50000
+
+# First cell of the row naming the per-feeder columns: every row before it belongs to the preamble
+PUS_HEADER_START = 'MachineName'
+
+# Format of the dates of the preamble and of the recipe start / end times
+PUS_TIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+
+# (collected column, export column) pairs of the per-feeder rows
+PUS_COLUMNS = [
+    ('Recipe_name', 'RecipeName'),
+    ('PartName', 'PartNumber'),
+    ('Stage_no', 'Stage'),
+    ('Position_no', 'Pos'),
+    ('Parts_pickup_count', 'PickupCount'),
+    ('Used_parts_count', 'TotalPartsUsed'),
+    ('Rejected_parts_count', 'RejectParts'),
+    ('NoPickup_Number_of_parts_not_used', 'PickupMiss'),
+    ('Error_parts_count', 'ErrorParts'),
+    ('Dislodged_parts_count', 'DislodgedParts'),
+    ('FIDL', 'FIDL'),
+]
+text_export_columns = ['MachineName', 'RecipeName', 'RecipeStartTime', 'RecipeEndTime', 'PartNumber', 'Pos', 'FIDL']
+
+# Report measures compared by the reconciliation (the export has no Error_rejected_parts_count)
+reconciled_columns = ['PickupCount', 'TotalPartsUsed', 'RejectParts', 'PickupMiss', 'ErrorParts', 'Dislodged_parts_count']
+
+
+# Function to read the preamble of a part usage export: pairs of rows (names, values) such as
+# Title/CreateDate/CreateUser or FromDate/ToDate/LineName. Returns ({name: value}, preamble row count).
+def read_part_usage_preamble(path):
+    info = {}
+    names = None
+    with open(path, newline='', encoding='utf-8', errors='replace') as export:
+        for row_number, row in enumerate(csv.reader(export)):
+            if row and row[0] == PUS_HEADER_START:
+                return info, row_number
+            if names is None:
+                names = row
+            else:
+                info.update(zip(names, row))
+                names = None
+    raise ValueError(f"{path} is not a part usage export: no row starts with {PUS_HEADER_START}")
+
+
+# Function to read the window an export covers from its preamble, as (FromDate, ToDate) datetimes
+def part_usage_window(info):
+    return datetime.strptime(info['FromDate'], PUS_TIME_FORMAT), datetime.strptime(info['ToDate'], PUS_TIME_FORMAT)
+
+
+# Function to map a chunk of export rows onto the columns of the extracted frames (plus EndTime).
+# MachineName is split into Type and Module (NXT5 -> NXT, 5), the times are kept to the minute.
+def _collected_frame(chunk, line_name):
+    machine = chunk['MachineName'].str.extract(r'^(\D*)(\d*)$')
+    df = pd.DataFrame({
+        'Line_name': line_name,
+        'Type': machine[0],
+        'Module': pd.to_numeric(machine[1], errors='coerce').fillna(0).astype(np.int64),
+    }, index=chunk.index)
+    for collected_column, export_column in PUS_COLUMNS:
+        df[collected_column] = chunk[export_column]
+    # Tray positions (A1, B5...) have no slot number, they are counted as slot 0
+    df['Position_no'] = pd.to_numeric(chunk['Pos'], errors='coerce').fillna(0).astype(np.int64)
+    df['Error_rejected_parts_count'] = 0
+    df['StartTime'] = pd.to_datetime(chunk['RecipeStartTime'], format=PUS_TIME_FORMAT).dt.floor('min')
+    df['EndTime'] = pd.to_datetime(chunk['RecipeEndTime'], format=PUS_TIME_FORMAT).dt.floor('min')
+    return df
+
+
+# Function to stream the per-feeder rows of a part usage export, chunk_rows rows at a time, as frames with
+# the columns of the extracted frames. line_name fills Line_name (the LineName of the preamble when not given).
+def iter_part_usage_frames(path, line_name=None, chunk_rows=PUS_CHUNK_ROWS):
+    info, preamble_rows = read_part_usage_preamble(path)
+    line_name = line_name or info.get('LineName', '')
+    dtypes = {column: np.int64 for _, column in PUS_COLUMNS if column not in text_export_columns}
+    dtypes.update({column: str for column in text_export_columns})
+    # Empty cells stay '' (a tray feeder has no FIDL in the [COUNT].db files either) and part names like NA are kept
+    chunks = pd.read_csv(path, skiprows=preamble_rows, usecols=list(dtypes), dtype=dtypes, chunksize=chunk_rows,
+                         keep_default_na=False, encoding='utf-8', encoding_errors='replace')
+    for chunk in chunks:
+        yield _collected_frame(chunk, line_name)
+
+
+# Function to aggregate a part usage export into the report aggregate_data() produces: one row per
+# (line, machine, recipe, FIDL, part, day), the day being the one the recipe started.
+# The rows are folded chunk by chunk, memory is bounded by the number of groups.
+def read_part_usage_report(path, line_name=None, chunk_rows=PUS_CHUNK_ROWS):
+    aggregator = StreamingAggregator()
+    for df in iter_part_usage_frames(path, line_name, chunk_rows):
+        aggregator.add_frame(df, end_column='EndTime')
+    return aggregator.result()
+
+
+# Function to sum the reconciled measures of a frame per group key (the report key without the day).
+# Yields (key, values), NULL keys are None like in the reports.
+def _key_totals(df):
+    totals = df.groupby(group_columns, sort=False, dropna=False, observed=True)[reconciled_columns].sum()
+    for key, values in zip(totals.index, totals.to_numpy(np.int64)):
+        yield tuple(None if pd.isna(value) else value for value in key), values
+
+
+# Function to reconcile a part usage export with a report of the same window (any grouping, the
+# totals are compared per key over the whole window) by a hash join: the report totals are the
+# build side, the export is the probe side, streamed chunk by chunk and summed per key before the
+# lookup, so only one entry per key is kept however many rows the export has.
+# Returns one row per key with the report (_db) and export (_csv) totals, their difference (_delta) and a
+# Status: 'match', 'deviation' (a difference above tolerance, relative to the larger total), 'db only' or 'csv only'.
+def reconcile_report(report, path, line_name=None, tolerance=0.0, chunk_rows=PUS_CHUNK_ROWS):
+    # key -> [report totals, export totals, found in the report, found in the export]
+    joined = {}
+    if report is not None:
+        for key, values in _key_totals(report):
+            joined[key] = [values, np.zeros(len(reconciled_columns), dtype=np.int64), True, False]
+
+    collected_to_report = {collected_column: report_column for report_column, collected_column in sum_columns}
+    for df in iter_part_usage_frames(path, line_name, chunk_rows):
+        for key, values in _key_totals(df.rename(columns=collected_to_report)):
+            entry = joined.get(key)
+            if entry is None:
+                joined[key] = [np.zeros(len(reconciled_columns), dtype=np.int64), values, False, True]
+            else:
+                entry[1] = entry[1] + values
+                entry[3] = True
+
+    rows = []
+    for key, (db_values, csv_values, in_db, in_csv) in joined.items():
+        deltas = csv_values - db_values
+        if not in_csv:
+            status = 'db only'
+        elif not in_db:
+            status = 'csv only'
+        elif (np.abs(deltas) > tolerance * np.maximum(np.abs(db_values), np.abs(csv_values))).any():
+            status = 'deviation'
+        else:
+            status = 'match'
+        rows.append(key + tuple(db_values) + tuple(csv_values) + tuple(deltas) + (status,))
+    columns = group_columns + [f'{column}_db' for column in reconciled_columns] + \
+        [f'{column}_csv' for column in reconciled_columns] + [f'{column}_delta' for column in reconciled_columns] + ['Status']
+    result = pd.DataFrame(rows, columns=columns)
+    return result.sort_values(group_columns, na_position='first', kind='stable').reset_index(drop=True)
+
+
+# Function to reconcile a part usage export with the [COUNT].db files of a line over the export's window
+def reconcile_part_usage(config, path, line_name, tolerance=0.0, on_error=None):
+    info, _ = read_part_usage_preamble(path)
+    start_datetime, end_datetime = part_usage_window(info)
+    spec = ReportSpec('database', start_datetime, end_datetime, [line_name], 'window')
+    report = run_report_batch(config, [spec], on_error)['database']
+    return reconcile_report(report, path, line_name, tolerance)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile a Nexim part usage export (PUS*.CSV) with the [COUNT].db files")
+    parser.add_argument('export', help="part usage CSV export")
+    parser.add_argument('--line', required=True, help="line of the [Paths] section the export comes from")
+    parser.add_argument('--tolerance', type=float, default=0.0, help="relative difference still counted as a match")
+    parser.add_argument('--output', help="reconciliation CSV (default: Reconciliation_<export name>.csv)")
+    parser.add_argument('--report', help="only aggregate the export into this report CSV, without reconciling it")
+    args = parser.parse_args()
+
+    if args.report:
+        report = read_part_usage_report(args.export, args.line)
+        if report is None:
+            print("No row in the export")
+            return 1
+        write_report_file(report, args.report)
+        print(f"{len(report)} groups written to {args.report}")
+        return 0
+
+    from Function import read_config
+    result = reconcile_part_usage(read_config(), args.export, args.line, args.tolerance,
+                                  on_error=lambda file_name: print(f"Failed to open database file: {file_name}"))
+    output = args.output or f"Reconciliation_{os.path.splitext(os.path.basename(args.export))[0]}.csv"
+    write_report_file(result, output)
+    for status, count in result['Status'].value_counts().items():
+        print(f"{status:<10} {count:>8}")
+    print(f"Reconciliation written to {output}")
+    return 0 if (result['Status'] == 'match').all() else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+import sqlite3
+import pandas as pd
+from aggregation import StreamingAggregator, sum_columns
+from extraction import extract_files, list_prod_tables, payload_positions
+from source_access import source_uri, tune_source_connection
+from time_pruning import window_id_range
+
+# SQLite's default SQLITE_MAX_ATTACHED, used when the connection cannot report its limit
+DEFAULT_ATTACH_LIMIT = 10
+
+
+# Function to build the SQL extracting one payload field from the JSON array built out of "Data"
+def _payload_field(column):
+    return f"json_extract(Fields, '$[{payload_positions[column]}]')"
+
+
+# Function to build the SELECT reading the window of one attached Prod table
+def _table_select(schema, table_name, server, id_range=None):
+    table_type = 'XPF' if 'Prod_XPF' in table_name else 'NXT'
+    server = server.replace("'", "''")
+    id_filter = '' if id_range is None else f"id BETWEEN {int(id_range[0])} AND {int(id_range[1])} AND "
+    return (f"SELECT '{server}' AS Line_name, '{table_type}' AS Type, Module, DateTime, Data "
+            f"FROM {schema}.{table_name} WHERE {id_filter}DateTime >= ? AND DateTime <= ?")
+
+
+# Function to build the query aggregating the UNION ALL of the attached tables inside SQLite.
+# The tab-separated payload is turned into a JSON array once per row, the LIMIT -1 keeps SQLite
+# from flattening that subquery (and re-building the array for every extracted field).
+def _aggregate_query(selects):
+    sums = ",\n".join(f"    SUM(CAST({_payload_field(collected_column)} AS INTEGER)) AS {report_column}"
+                      for report_column, collected_column in sum_columns)
+    return f"""
+SELECT
+    Line_name,
+    Type,
+    Module,
+    {_payload_field('Recipe_name')} AS Recipe_name,
+    {_payload_field('FIDL')} AS FIDL,
+    {_payload_field('PartName')} AS PartName,
+    substr(DateTime, 1, 10) AS day,
+    MIN(substr(DateTime, 1, 16)) AS StartTime,
+    MAX(substr(DateTime, 1, 16)) AS EndTime,
+    MAX(CAST({_payload_field('Position_no')} AS INTEGER)) AS Slot,
+    MIN(CAST({_payload_field('Stage_no')} AS INTEGER)) AS Stage_no,
+{sums}
+FROM (
+    SELECT Line_name, Type, Module, DateTime,
+           '["' || replace(replace(replace(Data, '\\', '\\\\'), '"', '\\"'), char(9), '","') || '"]' AS Fields
+    FROM ({' UNION ALL '.join(selects)})
+    LIMIT -1
+)
+GROUP BY 1, 2, 3, 4, 5, 6, 7
+"""
+
+
+# Function to read how many databases one connection may attach
+def _attach_limit(conn):
+    try:
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    except AttributeError:
+        return DEFAULT_ATTACH_LIMIT
+
+
+# Function to aggregate the (server, file_name) pairs inside SQLite: the files are ATTACHed in
+# batches that respect the attach limit, each batch runs one UNION ALL + GROUP BY and only the
+# aggregated rows reach Python, where the partial aggregates of the batches are merged.
+# on_file(file_name, done, total) is called for the files of each batch once it is merged into aggregator
+# (given by callers that want to look at the partial report), cancelled() is checked before each batch query.
+def aggregate_attached(file_tasks, start_datetime, end_datetime, on_error=None, pruning=False, on_file=None, cancelled=None,
+                       aggregator=None):
+    if aggregator is None:
+        aggregator = StreamingAggregator()
+    # uri=True lets ATTACH open the sources read-only (and immutable when closed)
+    conn = sqlite3.connect(':memory:', uri=True)
+    try:
+        batch_size = _attach_limit(conn)
+        for batch_start in range(0, len(file_tasks), batch_size):
+            if cancelled is not None and cancelled():
+                break
+            batch = file_tasks[batch_start:batch_start + batch_size]
+            attached = []
+            readable = []
+            selects = []
+            params = []
+            try:
+                # Step 1: Attach the files of the batch and discover their Prod tables
+                for server, file_name in batch:
+                    schema = f"src{len(attached)}"
+                    file_selects = []
+                    try:
+                        conn.execute(f"ATTACH DATABASE ? AS {schema}", (source_uri(file_name),))
+                        attached.append(schema)
+                        tune_source_connection(conn, schema)
+                        for table_name in list_prod_tables(conn, schema):
+                            id_range = None
+                            if pruning:
+                                id_range = window_id_range(conn, f"{schema}.{table_name}", start_datetime, end_datetime, file_name)
+                                if id_range is None:
+                                    continue
+                            file_selects.append(_table_select(schema, table_name, server, id_range))
+                    except sqlite3.Error:
+                        if on_error is not None:
+                            on_error(file_name)
+                        continue
+                    readable.append((server, file_name))
+                    selects.extend(file_selects)
+                    params.extend([start_datetime, end_datetime] * len(file_selects))
+
+                # Step 2: Aggregate the whole batch in SQLite
+                if cancelled is not None and cancelled():
+                    break
+                if selects:
+                    try:
+                        partial = pd.read_sql_query(_aggregate_query(selects), conn, params=params)
+                    except (sqlite3.Error, pd.errors.DatabaseError):
+                        # Payloads JSON cannot hold: extract this batch in Python instead
+                        extract_files(readable, start_datetime, end_datetime, on_error=on_error,
+                                      on_frame=aggregator.add_frame, pruning=pruning)
+                    else:
+                        aggregator.add_partial(partial)
+            finally:
+                for schema in attached:
+                    conn.execute(f"DETACH DATABASE {schema}")
+            if on_file is not None:
+                for done, (server, file_name) in enumerate(batch, start=batch_start + 1):
+                    on_file(file_name, done, len(file_tasks))
+    finally:
+        conn.close()
+    # Step 3: Merged partial aggregates become the report
+    return aggregator.result()
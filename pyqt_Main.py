@@ -1,16 +1,22 @@
 import sys
 import os
-import sqlite3
 from datetime import datetime
-import pandas as pd
 from PyQt5.QtWidgets import (
      QApplication, QMainWindow, QLabel, QVBoxLayout, 
     QCalendarWidget, QPushButton, QWidget, QListWidget, QListView, QHBoxLayout, 
-    QDateTimeEdit, QMessageBox, QScrollArea, QFileDialog
+    QDateTimeEdit, QMessageBox, QScrollArea, QFileDialog, QTableWidget, QTableWidgetItem, QProgressBar,
+    QTableView, QHeaderView, QLineEdit, QComboBox, QSpinBox
 )
-from PyQt5.QtCore import  QDateTime, QThread, pyqtSignal, pyqtSlot, QTimer
+from PyQt5.QtCore import  Qt, QDateTime, QModelIndex, QThread, pyqtSignal, pyqtSlot, QTimer
 from PyQt5.QtGui import QIcon
 import configparser
+import Function
+from source_catalog import list_source_files
+from live_tail import LiveTail, read_live_settings
+from instrumentation import PipelineMetrics
+from report_writers import OUTPUT_FORMATS, read_output_format, report_file_name
+from report_model import FrameTableModel, drilldown_mask
+from top_feeders import RANKING_LEVELS, RANKING_METRICS, read_top_n_settings, top_n
 
 class DataProcessor:
     def __init__(self, start_date=None, end_date=None, start_time=None, end_time=None, selected_servers=None):
@@ -19,6 +25,12 @@ class DataProcessor:
         self.start_time = start_time
         self.end_time = end_time
         self.selected_servers = selected_servers
+        # Timings of the last run, per stage and per (file, table)
+        self.metrics = PipelineMetrics()
+        # Report of the last run, None until it is complete
+        self.aggregated_data = None
+        # Extracted rows of the last run (memory and sqlite aggregation only), for the drilldown
+        self.collected_data = None
 
     @staticmethod
     def read_config():
@@ -28,151 +40,42 @@ class DataProcessor:
 
     @staticmethod
     def collect_database_files(server_path, start_date, end_date):
-        file_names = []
-        if os.path.exists(server_path):
-            for file_name in os.listdir(server_path):
-                if file_name.endswith("[COUNT].db"):
-                    date_fichier = file_name.split("_")[0]
-                    if start_date <= date_fichier <= end_date:
-                        fichier_db = os.path.join(server_path, file_name)
-                        file_names.append(fichier_db)
-        return file_names
-
-    def process_collected_data(self):
-        # Read configuration from config.ini
-        config = self.read_config()
-        collected_data_frames = []
-
-        # Step 1: Iterate through each server
-        for server in self.selected_servers:
-            # Step 2: Collect database files
-            server_path = config['Paths'][server]
-            collected_files = self.collect_database_files(server_path, self.start_date, self.end_date)
-
-            # Step 3: For each database file
-            for file_name in collected_files:
-                print(f"file name = {file_name}\n ")
-                try:
-                    # Step 4: Get all tables starting with "Prod_NXT" or "Prod_XPF"
-                    with sqlite3.connect(file_name) as db_conn:
-                        cursor = db_conn.cursor()
-                        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND (name LIKE 'Prod_NXT%' OR name LIKE 'Prod_XPF%')")
-                        tables = cursor.fetchall()
-
-                        # Step 5: For each table
-                        for table in tables:
-                            table_name = table[0]
-                            # Step 6: Execute SQL query to select data
-                            query = f"SELECT DateTime, Module, Data FROM {table_name} WHERE DateTime >= ? AND DateTime <= ?"
-                            start_datetime = datetime.strptime(f"{self.start_date} {self.start_time}", "%Y%m%d %H:%M")
-                            end_datetime = datetime.strptime(f"{self.end_date} {self.end_time}", "%Y%m%d %H:%M")
-
-                            params = (start_datetime, end_datetime)
-                            df = pd.read_sql_query(query, db_conn, params=params)
-
-                            # Step 7: Add Line_name and Type columns
-                            df['Line_name'] = server
-                            df['Type'] = 'XPF' if 'Prod_XPF' in table_name else 'NXT'
-
-                            # Step 8: Split the "Data" column into multiple columns using tabs
-                            split_columns = ['Last_Panel_ID_produced', 'Conveyor_name', 'Recipe_name', 'Operator_name', 'Stage_no', 'Group_key', 'Position_no', 'Sub-Position_no', 'Parts_pickup_count', 'Error_parts_count', 'Error_rejected_parts_count', 'Rejected_parts_count', 'Dislodged_parts_count', 'NoPickup_Number_of_parts_not_used', 'Used_parts_count', 'Rescan_count', 'PartName', 'Unit_position_ID', 'FIDL', 'Module_Number', 'vide']
-                            split_data = df['Data'].str.split('\t', expand=True)
-                            split_data.columns = split_columns[:len(split_data.columns)]  # Ensure correct number of columns
-                            # Concatenate split data with original DataFrame
-                            df = pd.concat([df, split_data], axis=1)
-                            # Drop the original "Data" column and other unwanted columns
-                            columns_to_drop = ['Data', 'Last_Panel_ID_produced', 'Conveyor_name', 'Operator_name', 'Group_key', 'Sub-Position_no', 'Rescan_count', 'Unit_position_ID', 'Module_Number']
-                            columns_to_drop = [col for col in columns_to_drop if col in df.columns]  # Filter existing columns
-                            df.drop(columns=columns_to_drop, inplace=True)
-                            # Convert specified columns to integers
-                            int_columns = ['Position_no','Stage_no', 'Parts_pickup_count', 'Error_parts_count', 'Error_rejected_parts_count', 'Rejected_parts_count', 'Dislodged_parts_count', 'NoPickup_Number_of_parts_not_used', 'Used_parts_count']
-                            df[int_columns] = df[int_columns].astype(int)
-                            # Add StartTime column with proper formatting
-                            df['StartTime'] = pd.to_datetime(df['DateTime']).dt.strftime('%Y-%m-%d %H:%M')
-                            # Append the DataFrame to the list
-                            collected_data_frames.append(df)
-                except sqlite3.Error:
-                    # Display warning if the database file cannot be opened
-                    QMessageBox.warning(None, "Database Error", f"Failed to open database file: {file_name}. Skipping...")
-                    continue
-
-        # Step 5: Concatenate collected data frames
-        if collected_data_frames:
-            collected_data = pd.concat(collected_data_frames, ignore_index=True)
-
-            # Step 6: Define the desired column order and reorder columns
-            desired_columns = ["Line_name", "Type", "Module", "Recipe_name", "StartTime", "Stage_no",'Position_no', "Parts_pickup_count", "Error_parts_count", "Error_rejected_parts_count", "Rejected_parts_count", "Dislodged_parts_count", "NoPickup_Number_of_parts_not_used", "Used_parts_count", "PartName", "FIDL"]
-            collected_data = collected_data.reindex(columns=desired_columns)
-
-            # Step 7: Format the StartTime column
-            collected_data['StartTime'] = pd.to_datetime(collected_data['StartTime']).dt.strftime('%Y-%m-%d %H:%M:%S')
-
-            # Step 8: Save collected data to a SQLite database
-            db_file = f'collected_data_{self.start_date}_{self.end_date}.db'
-            conn = sqlite3.connect(db_file)
-            collected_data.to_sql('collected_data', conn, if_exists='replace', index=False)
-            conn.close()
-
-            # Step 9: Execute SQL query to aggregate the data
-            aggregated_data = self.aggregate_data(db_file)
-            
-            # Step 9.1 Get the folder path where the CSV file will be saved
-            folder_path = os.path.dirname(os.path.abspath(__file__))
-            
-            # Step 10: Save the aggregated data to a CSV file
-            csv_file_path = os.path.join(folder_path, f'Report_generate_{self.start_date}_{self.end_date}{self.selected_servers}.csv')
-            aggregated_data.to_csv(csv_file_path, index=False)
-            
-            # Step 11: remove db file collected
-            os.remove(db_file)
-            return  csv_file_path
-    
+        return list_source_files(server_path, start_date, end_date)
+
     @staticmethod
-    def aggregate_data(db_file):
-        conn = sqlite3.connect(db_file)
-        query = """
-        SELECT
-            Line_name,
-            Type,
-            Module,
-            Recipe_name,
-            PartName,
-            MIN(StartTime) AS StartTime,
-            MAX(StartTime) AS EndTime,
-            MAX(Position_no) AS Slot,
-            MIN(Stage_no) AS Stage_no,
-            SUM(Parts_pickup_count) AS PickupCount,
-            SUM(Used_parts_count) AS TotalPartsUsed,
-            SUM(Rejected_parts_count) AS RejectParts,
-            SUM(NoPickup_Number_of_parts_not_used) AS PickupMiss,
-            SUM(Error_parts_count) AS ErrorParts,
-            SUM(Error_rejected_parts_count) AS Error_rejected_parts_count,
-            SUM(Dislodged_parts_count) AS Dislodged_parts_count,
-            FIDL
-        FROM collected_data
-        GROUP BY Line_name, Type, Module, Recipe_name, FIDL, PartName, strftime('%Y%m%d', StartTime);
-        """
-
-        aggregated_data = pd.read_sql_query(query, conn)
-        conn.close()
-
-        # Calculate errorPickupRate and ErrorRate
-        aggregated_data['ErrorPickupRate'] = (aggregated_data['PickupMiss'] / aggregated_data['PickupCount']) * 100
-        aggregated_data['ErrorRate'] = (aggregated_data['ErrorParts'] / aggregated_data['PickupCount']) * 100
-        aggregated_data['RejectRate'] = (aggregated_data['RejectParts'] / aggregated_data['PickupCount']) * 100
-
-        # Define the desired column order
-        column_order = ["Line_name", "Type", "Module", "Recipe_name", "StartTime", "EndTime", "PartName", "Slot",
-                        "Stage_no", "PickupCount", "TotalPartsUsed", "RejectParts", "PickupMiss", "ErrorParts",
-                        "Error_rejected_parts_count", "Dislodged_parts_count","RejectRate", "ErrorPickupRate", "ErrorRate", "FIDL"]
-
-        # Reorder the columns
-        aggregated_data = aggregated_data[column_order]
-
-        return aggregated_data
+    def warn_database_error(file_name):
+        # Display warning if the database file cannot be opened
+        QMessageBox.warning(None, "Database Error", f"Failed to open database file: {file_name}. Skipping...")
+
+    # Function to keep the report of the run and its extracted rows
+    def keep_result(self, aggregated_data, collected_data):
+        self.aggregated_data = aggregated_data
+        self.collected_data = collected_data
+
+    # Function to run the report with Function.process_collected_data, saved next to this script in the [Output] format.
+    # on_file(file_name, done, total) is called as each file is scanned into the source catalog, then as each
+    # file is finished, on_partial(report) with the report of the files read so far. cancelled() is checked
+    # at every file and table boundary, a cancelled run returns None without writing the report.
+    def process_collected_data(self, on_file=None, on_partial=None, cancelled=None):
+        def forward_progress(stage, details):
+            if on_file is not None and stage in ('scan', 'file'):
+                on_file(details['file'], details['done'], details['total'])
+
+        folder_path = os.path.dirname(os.path.abspath(__file__))
+        output_format = read_output_format(self.read_config())
+        output_file = os.path.join(folder_path, report_file_name(self.start_date, self.end_date, self.selected_servers, output_format))
+        return Function.process_collected_data(self.start_date, self.end_date, self.start_time, self.end_time, self.selected_servers,
+                                               self.warn_database_error, output_file, forward_progress, self.metrics,
+                                               output_format, on_partial=on_partial, cancelled=cancelled,
+                                               on_report=self.keep_result)
 
 class DataCollectionThread(QThread):
     finished = pyqtSignal(str)  # Change the signal type to str
+    metrics_ready = pyqtSignal(object)
+    file_progress = pyqtSignal(str, int, int)
+    partial_results = pyqtSignal(object)
+    raw_rows = pyqtSignal(object)
+    stopped = pyqtSignal()
 
     def __init__(self, start_date, end_date, start_time, end_time, selected_servers, parent=None):
         super(DataCollectionThread, self).__init__(parent)
@@ -181,14 +84,50 @@ class DataCollectionThread(QThread):
         self.start_time = start_time
         self.end_time = end_time
         self.selected_servers = selected_servers
+        self.cancel_requested = False
+
+    # Function to ask the run to stop at the next file or table boundary
+    def cancel(self):
+        self.cancel_requested = True
 
     def run(self):
         
         processor = DataProcessor(self.start_date, self.end_date, self.start_time, self.end_time, self.selected_servers)
-        csv_file_path = processor.process_collected_data()
+        csv_file_path = processor.process_collected_data(self.file_progress.emit, self.partial_results.emit,
+                                                         lambda: self.cancel_requested)
+        self.metrics_ready.emit(processor.metrics)
+        if self.cancel_requested:
+            self.stopped.emit()
+            return
+        if processor.aggregated_data is not None:
+            self.partial_results.emit(processor.aggregated_data)
+        if processor.collected_data is not None:
+            self.raw_rows.emit(processor.collected_data)
         if csv_file_path is not None:
             self.finished.emit(csv_file_path)
 
+class LiveTailThread(QThread):
+    updated = pyqtSignal(list)
+
+    def __init__(self, line_folders, window_minutes, poll_seconds, shift_starts, parent=None):
+        super(LiveTailThread, self).__init__(parent)
+        self.live_tail = LiveTail(line_folders, window_minutes, shift_starts)
+        self.poll_seconds = poll_seconds
+        self.stopped = False
+
+    def run(self):
+        while not self.stopped:
+            self.live_tail.poll()
+            self.updated.emit(self.live_tail.snapshot())
+            # Sleep in small steps so Stop Live is taken into account quickly
+            for _ in range(int(self.poll_seconds * 10)):
+                if self.stopped:
+                    break
+                self.msleep(100)
+
+    def stop(self):
+        self.stopped = True
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -269,6 +208,12 @@ class MainWindow(QMainWindow):
         self.sync_button.clicked.connect(self.sync_files)
         main_layout.addWidget(self.sync_button)
 
+        # Cancel Button, stops the running collection at the next file or table
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_collection)
+        main_layout.addWidget(self.cancel_button)
+
         # File List
         file_list_label = QLabel("Files Found:")
         main_layout.addWidget(file_list_label)
@@ -284,10 +229,91 @@ class MainWindow(QMainWindow):
         self.processing_label.setStyleSheet("color: blue")
         main_layout.addWidget(self.processing_label)
 
+        # Files read so far
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("%v / %m files")
+        self.progress_bar.setVisible(False)
+        main_layout.addWidget(self.progress_bar)
+
         # Execution Time Label
         self.execution_time_label = QLabel()
         main_layout.addWidget(self.execution_time_label)
 
+        # Report of the files read so far, then the final report, and the extracted rows behind it.
+        # The view is virtual: only the visible rows are formatted, whatever the number of rows.
+        results_layout = QHBoxLayout()
+        main_layout.addLayout(results_layout)
+        self.results_label = QLabel()
+        results_layout.addWidget(self.results_label)
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filter rows...")
+        self.filter_edit.textChanged.connect(self.apply_results_filter)
+        results_layout.addWidget(self.filter_edit)
+        self.filter_column = QComboBox()
+        self.filter_column.currentIndexChanged.connect(self.apply_results_filter)
+        results_layout.addWidget(self.filter_column)
+        self.raw_button = QPushButton("Raw Rows")
+        self.raw_button.setEnabled(False)
+        self.raw_button.clicked.connect(self.toggle_raw_rows)
+        results_layout.addWidget(self.raw_button)
+        self.report_data = None
+        self.raw_data = None
+        self.showing_raw = False
+        self.results_model = FrameTableModel()
+        self.results_view = QTableView()
+        self.results_view.setModel(self.results_model)
+        self.results_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.results_view.setSortingEnabled(True)
+        self.results_view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.results_view.verticalHeader().setDefaultSectionSize(self.results_view.fontMetrics().height() + 6)
+        self.results_view.doubleClicked.connect(self.drill_down)
+        self.results_view.setVisible(False)
+        main_layout.addWidget(self.results_view)
+
+        # Worst feeders, slots or parts of the report on the chosen rate or count
+        top_count, top_min_pickups = read_top_n_settings(config)
+        top_layout = QHBoxLayout()
+        main_layout.addLayout(top_layout)
+        top_layout.addWidget(QLabel("Worst:"))
+        self.top_count = QSpinBox()
+        self.top_count.setRange(1, 1000)
+        self.top_count.setValue(top_count)
+        top_layout.addWidget(self.top_count)
+        self.top_level = QComboBox()
+        self.top_level.addItems(list(RANKING_LEVELS))
+        self.top_level.setCurrentText('feeder')
+        top_layout.addWidget(self.top_level)
+        top_layout.addWidget(QLabel("by"))
+        self.top_metric = QComboBox()
+        self.top_metric.addItems(RANKING_METRICS)
+        top_layout.addWidget(self.top_metric)
+        top_layout.addWidget(QLabel("Min PickupCount:"))
+        self.top_min_pickups = QSpinBox()
+        self.top_min_pickups.setRange(0, 10**9)
+        self.top_min_pickups.setValue(top_min_pickups)
+        top_layout.addWidget(self.top_min_pickups)
+        for control in (self.top_count, self.top_min_pickups):
+            control.valueChanged.connect(self.update_top_n)
+        for control in (self.top_level, self.top_metric):
+            control.currentIndexChanged.connect(self.update_top_n)
+        self.top_model = FrameTableModel()
+        self.top_view = QTableView()
+        self.top_view.setModel(self.top_model)
+        self.top_view.setVisible(False)
+        main_layout.addWidget(self.top_view)
+
+        # Stage Breakdown of the last run and its slowest tables
+        self.stage_table = QTableWidget()
+        self.stage_table.setColumnCount(7)
+        self.stage_table.setHorizontalHeaderLabels(["Stage", "Seconds", "Share %", "Rows", "Rows/s", "MB", "Peak MB"])
+        self.stage_table.setVisible(False)
+        main_layout.addWidget(self.stage_table)
+        self.slowest_tables = QTableWidget()
+        self.slowest_tables.setColumnCount(5)
+        self.slowest_tables.setHorizontalHeaderLabels(["Line", "File", "Table", "Seconds", "Rows"])
+        self.slowest_tables.setVisible(False)
+        main_layout.addWidget(self.slowest_tables)
+
         # File Generation Label
         self.file_generation_label = QLabel()
         self.file_generation_label.setStyleSheet("color: green")
@@ -297,6 +323,15 @@ class MainWindow(QMainWindow):
         self.save_button = QPushButton("Save")
         self.save_button.setEnabled(False)  # Initially disabled
         main_layout.addWidget(self.save_button)
+
+        # Live Button and rolling reject rates of today's files
+        self.live_button = QPushButton("Start Live")
+        self.live_button.clicked.connect(self.toggle_live)
+        main_layout.addWidget(self.live_button)
+        self.live_table = QTableWidget()
+        self.live_table.setVisible(False)
+        main_layout.addWidget(self.live_table)
+        self.live_thread = None
         
 
         # Set Application Icon
@@ -318,6 +353,19 @@ class MainWindow(QMainWindow):
         self.processing_label.clear()
         self.execution_time_label.clear()
         self.file_generation_label.clear()
+        self.stage_table.setVisible(False)
+        self.slowest_tables.setVisible(False)
+        self.progress_bar.setVisible(False)
+        self.results_label.clear()
+        self.results_view.setVisible(False)
+        self.report_data = None
+        self.raw_data = None
+        self.showing_raw = False
+        self.raw_button.setEnabled(False)
+        self.raw_button.setText("Raw Rows")
+        self.show_frame(None)
+        self.top_model.set_frame(None)
+        self.top_view.setVisible(False)
 
     @pyqtSlot()
     def sync_files(self):
@@ -369,11 +417,11 @@ class MainWindow(QMainWindow):
             return
 
         file_names = []
+        config = DataProcessor.read_config()
         for server in selected_servers:
-            config = configparser.ConfigParser()
-            config.read('config.ini')
             path = config['Paths'].get(server, "")
             if os.path.exists(path):  # Check if the path exists
+                # Only the folder is listed here, the files are opened (and the source catalog refreshed) by the worker
                 files = DataProcessor.collect_database_files(path, start_date, end_date)
                 if files:
                     file_names.extend(files)
@@ -393,13 +441,22 @@ class MainWindow(QMainWindow):
         # Start data collection in a separate thread
         self.data_collection_thread = DataCollectionThread(start_date, end_date, start_time, end_time, selected_servers)
         self.data_collection_thread.finished.connect(self.process_execution_time)
+        self.data_collection_thread.metrics_ready.connect(self.show_stage_breakdown)
+        self.data_collection_thread.file_progress.connect(self.update_file_progress)
+        self.data_collection_thread.partial_results.connect(self.show_results)
+        self.data_collection_thread.raw_rows.connect(self.keep_raw_rows)
+        self.data_collection_thread.stopped.connect(self.collection_stopped)
         self.data_collection_thread.start()
 
         # Update file count label
         self.file_count_label.setText(f"Files Found: {len(file_names)}")
 
-        # Disable collect data button
+        # Disable collect data button, the run can be cancelled instead
         self.sync_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.progress_bar.setRange(0, len(file_names))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
 
         # Start QTimer to update processing label text
         self.processing_label.setText("Data Processing...")  # Moved here to start only after valid inputs
@@ -434,6 +491,8 @@ class MainWindow(QMainWindow):
 
         # Enable the collect data button
         self.sync_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.progress_bar.setVisible(False)
 
         # Update the file generation label
         self.file_generation_label.setText("File Generation Complete")
@@ -448,6 +507,110 @@ class MainWindow(QMainWindow):
         self.csv_file_path = csv_file_path
 
 
+    @pyqtSlot()
+    def cancel_collection(self):
+        self.data_collection_thread.cancel()
+        self.cancel_button.setEnabled(False)
+        self.processing_timer.stop()
+        self.processing_label.setText("Cancelling...")
+
+    @pyqtSlot()
+    def collection_stopped(self):
+        self.processing_label.setText(f"Cancelled after {self.progress_bar.value()} of {self.progress_bar.maximum()} files")
+        self.progress_bar.setVisible(False)
+        self.sync_button.setEnabled(True)
+
+    @pyqtSlot(str, int, int)
+    def update_file_progress(self, file_name, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    # Function to put a frame in the results view, keeping the sort and the filter when the columns are the same
+    def show_frame(self, frame, row_mask=None):
+        same_columns = frame is not None and [str(column) for column in frame.columns] == self.results_model.column_names
+        self.results_model.set_frame(frame)
+        if not same_columns:
+            self.filter_column.blockSignals(True)
+            self.filter_column.clear()
+            self.filter_column.addItems(["All columns"] + self.results_model.column_names)
+            self.filter_column.blockSignals(False)
+            self.results_view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        else:
+            header = self.results_view.horizontalHeader()
+            self.results_model.sort(header.sortIndicatorSection(), header.sortIndicatorOrder())
+        self.results_model.set_row_filter(row_mask)
+        self.apply_results_filter()
+
+    @pyqtSlot()
+    def apply_results_filter(self):
+        column = self.filter_column.currentIndex() - 1
+        self.results_model.set_text_filter(self.filter_edit.text(), column if column >= 0 else None)
+        if self.results_model.frame.empty:
+            return
+        shown = f"{self.results_model.rowCount():,} of {len(self.results_model.frame):,}"
+        self.results_label.setText(f"Raw rows: {shown}" if self.showing_raw else f"Groups: {shown}")
+
+    @pyqtSlot(object)
+    def show_results(self, report):
+        self.report_data = report
+        if not self.showing_raw:
+            self.show_frame(report)
+        self.results_view.setVisible(True)
+        self.update_top_n()
+
+    @pyqtSlot()
+    def update_top_n(self):
+        if self.report_data is None:
+            return
+        worst = top_n(self.report_data, self.top_metric.currentText(), self.top_count.value(),
+                      self.top_min_pickups.value(), self.top_level.currentText())
+        self.top_model.set_frame(worst)
+        self.top_view.setVisible(True)
+
+    @pyqtSlot(object)
+    def keep_raw_rows(self, collected_data):
+        self.raw_data = collected_data
+        self.raw_button.setEnabled(True)
+
+    @pyqtSlot()
+    def toggle_raw_rows(self):
+        self.show_rows(not self.showing_raw)
+
+    # Function to switch the view between the report and the extracted rows (only those of row_mask when given)
+    def show_rows(self, raw, row_mask=None):
+        self.showing_raw = raw
+        self.raw_button.setText("Report" if raw else "Raw Rows")
+        self.show_frame(self.raw_data if raw else self.report_data, row_mask)
+
+    # Function to show the extracted rows of the double-clicked report group
+    @pyqtSlot(QModelIndex)
+    def drill_down(self, index):
+        if self.showing_raw or self.raw_data is None:
+            return
+        self.show_rows(True, drilldown_mask(self.raw_data, self.results_model.row(index.row())))
+
+    @pyqtSlot(object)
+    def show_stage_breakdown(self, metrics):
+        stages = metrics.ordered_stages()
+        total_seconds = sum(stage.seconds for stage in stages) or 1
+        self.stage_table.setRowCount(len(stages))
+        for row_index, stage in enumerate(stages):
+            cells = [stage.name, f"{stage.seconds:.3f}", f"{stage.seconds / total_seconds * 100:.1f}", str(stage.rows),
+                     "" if stage.rows_per_second is None else f"{stage.rows_per_second:,.0f}",
+                     f"{stage.bytes / 2**20:.1f}", "" if stage.peak_memory is None else f"{stage.peak_memory / 2**20:.0f}"]
+            for column_index, cell in enumerate(cells):
+                self.stage_table.setItem(row_index, column_index, QTableWidgetItem(cell))
+        self.stage_table.setVisible(True)
+
+        # The ten tables that took the longest, to spot the line or file dominating a slow run
+        tables = sorted(metrics.tables, key=lambda table: table['seconds'], reverse=True)[:10]
+        self.slowest_tables.setRowCount(len(tables))
+        for row_index, table in enumerate(tables):
+            cells = [table['line'], os.path.basename(table['file']), table['table'], f"{table['seconds']:.3f}", str(table['rows'])]
+            for column_index, cell in enumerate(cells):
+                self.slowest_tables.setItem(row_index, column_index, QTableWidgetItem(cell))
+        self.slowest_tables.setVisible(bool(tables))
+
     @pyqtSlot()
     def update_processing_label(self):
         current_text = self.processing_label.text()
@@ -459,7 +622,8 @@ class MainWindow(QMainWindow):
     @pyqtSlot(bool)
     def save_csv(self, clicked):
         # Prompt the user to select the destination folder and enter the new file name
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Report File", "", "Report Files (*.csv)")
+        extension = next(extension for extension, _ in OUTPUT_FORMATS.values() if self.csv_file_path.endswith(extension))
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Report File", "", f"Report Files (*{extension})")
         if file_path:
             # Move the CSV file to the selected destination folder with the specified name
             try:
@@ -468,6 +632,50 @@ class MainWindow(QMainWindow):
             except Exception as e:
                 QMessageBox.warning(self, "Error", f"Failed to move the CSV file: {str(e)}")
 
+    @pyqtSlot()
+    def toggle_live(self):
+        if self.live_thread is not None:
+            self.live_thread.stop()
+            self.live_thread.wait()
+            self.live_thread = None
+            self.live_button.setText("Start Live")
+            return
+
+        # Follow the selected lines, all of them when none is selected
+        config = DataProcessor.read_config()
+        selected_servers = [item.text() for item in self.server_list.selectedItems()] or list(config['Paths'].keys())
+        line_folders = {server: config['Paths'].get(server, "") for server in selected_servers}
+        window_minutes, poll_seconds, shift_starts = read_live_settings(config)
+
+        headers = ["Line", "Module", "FIDL"]
+        for name in window_minutes:
+            headers += [f"PickupCount {name}", f"RejectRate {name}"]
+        self.live_table.setColumnCount(len(headers))
+        self.live_table.setHorizontalHeaderLabels(headers)
+        self.live_table.setRowCount(0)
+        self.live_table.setVisible(True)
+
+        self.live_thread = LiveTailThread(line_folders, window_minutes, poll_seconds, shift_starts)
+        self.live_thread.updated.connect(self.update_live_table)
+        self.live_thread.start()
+        self.live_button.setText("Stop Live")
+
+    @pyqtSlot(list)
+    def update_live_table(self, rows):
+        self.live_table.setRowCount(len(rows))
+        for row_index, row in enumerate(sorted(rows, key=lambda row: tuple(str(value) for value in row[:3]))):
+            cells = [str(value) for value in row[:3]]
+            for pickups, reject_rate, _, _ in row[3:]:
+                cells += [str(pickups), "" if reject_rate is None else f"{reject_rate:.2f}"]
+            for column_index, cell in enumerate(cells):
+                self.live_table.setItem(row_index, column_index, QTableWidgetItem(cell))
+
+    def closeEvent(self, event):
+        if self.live_thread is not None:
+            self.live_thread.stop()
+            self.live_thread.wait()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
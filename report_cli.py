@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+from report_writers import OUTPUT_FORMATS
+
+# Exit codes of the runner
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_DATA = 3
+EXIT_PARTIAL = 4
+
+# Import time allowed for the runner and the pipeline entry module, before any report is run
+IMPORT_BUDGET_SECONDS = 0.25
+
+# Modules that must not be loaded by importing the runner and the pipeline entry module
+HEAVY_MODULES = ['PyQt5', 'pandas', 'numpy']
+
+
+# Function to write one progress event as a JSON line on stdout
+def emit(event, **details):
+    details = {'event': event, 'time': datetime.now().isoformat(timespec='seconds'), **details}
+    print(json.dumps(details), flush=True)
+
+
+# Function to check the import budget in a fresh interpreter. Returns the exit code.
+def check_imports():
+    probe = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import report_cli, Function\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"loaded = [name for name in {HEAVY_MODULES!r} if name in sys.modules]\n"
+        "print(json.dumps({'seconds': elapsed, 'loaded': loaded}))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        emit('error', message=result.stderr.strip())
+        return EXIT_FAILED
+    measured = json.loads(result.stdout)
+    within_budget = measured['seconds'] <= IMPORT_BUDGET_SECONDS and not measured['loaded']
+    emit('imports', seconds=round(measured['seconds'], 4), budget=IMPORT_BUDGET_SECONDS,
+         loaded=measured['loaded'], ok=within_budget)
+    return EXIT_OK if within_budget else EXIT_FAILED
+
+
+# Function to check a YYYYMMDD / HH:MM argument
+def _checked(value, date_format):
+    try:
+        datetime.strptime(value, date_format)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' does not match {date_format}")
+    return value
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Generate the reject report without the GUI (JSON lines progress on stdout)")
+    parser.add_argument('--start-date', type=lambda value: _checked(value, '%Y%m%d'), help="first day, YYYYMMDD")
+    parser.add_argument('--end-date', type=lambda value: _checked(value, '%Y%m%d'), help="last day, YYYYMMDD")
+    parser.add_argument('--start-time', type=lambda value: _checked(value, '%H:%M'), default='00:00', help="HH:MM (default 00:00)")
+    parser.add_argument('--end-time', type=lambda value: _checked(value, '%H:%M'), default='23:59', help="HH:MM (default 23:59)")
+    parser.add_argument('--lines', nargs='+', help="lines of the [Paths] section (default: all of them)")
+    parser.add_argument('--output', help="report path (default: Report_generate_<dates>_<lines>.<format extension>)")
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), help="report format (default: the [Output] format of config.ini)")
+    parser.add_argument('--raw-output', help="also export every extracted row to this CSV file, gzip-compressed when it ends with .gz")
+    parser.add_argument('--check-imports', action='store_true', help="only check the import time budget")
+    args = parser.parse_args(argv)
+    if not args.check_imports:
+        if args.start_date is None or args.end_date is None:
+            parser.error("--start-date and --end-date are required")
+        if (args.start_date, args.start_time) >= (args.end_date, args.end_time):
+            parser.error("the start must be before the end")
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.check_imports:
+        return check_imports()
+
+    import Function
+    lines = args.lines or list(Function.read_config()['Paths'].keys())
+    emit('start', start=f"{args.start_date} {args.start_time}", end=f"{args.end_date} {args.end_time}", lines=lines)
+    failed_files = []
+
+    def on_error(file_name):
+        failed_files.append(file_name)
+        emit('warning', message="Failed to open database file", file=file_name)
+
+    def on_progress(stage, details):
+        emit(stage, **details)
+
+    from instrumentation import PipelineMetrics
+    metrics = PipelineMetrics()
+    started = time.perf_counter()
+    try:
+        output_file = Function.process_collected_data(args.start_date, args.end_date, args.start_time, args.end_time, lines,
+                                                      on_error=on_error, output_file=args.output, on_progress=on_progress,
+                                                      metrics=metrics, output_format=args.format, raw_output=args.raw_output)
+    except Exception as e:
+        emit('error', message=f"{type(e).__name__}: {e}")
+        return EXIT_FAILED
+    seconds = round(time.perf_counter() - started, 3)
+    emit('metrics', stages=metrics.to_dict()['stages'])
+    if output_file is None:
+        emit('done', status='no_data', seconds=seconds, failed_files=len(failed_files))
+        return EXIT_NO_DATA
+    status = 'partial' if failed_files else 'ok'
+    emit('done', status=status, output=output_file, seconds=seconds, failed_files=len(failed_files))
+    return EXIT_PARTIAL if failed_files else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from aggregation import group_columns
+
+
+# Function to format one cell for display
+def _format_cell(value):
+    if value is None or value != value:
+        return ""
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.2f}"
+    if isinstance(value, np.datetime64):
+        return np.datetime_as_string(value, unit='s').replace('T', ' ')
+    return str(value)
+
+
+# Virtual table model over a DataFrame (a report or the raw extracted rows). Nothing is copied into
+# the view: the columns are kept as arrays (categoricals as codes + categories) and a cell is only
+# formatted when the view asks for it, i.e. for the visible rows. Sorting and filtering build an
+# array of row positions: the sort permutation of a column is computed once and kept, a filter is
+# a boolean mask over the rows, and the rows shown are the sort permutation restricted to the mask.
+class FrameTableModel(QAbstractTableModel):
+    def __init__(self, frame=None, parent=None):
+        super().__init__(parent)
+        self.set_frame(frame)
+
+    def set_frame(self, frame):
+        self.beginResetModel()
+        self.frame = frame if frame is not None else pd.DataFrame()
+        self.column_names = [str(column) for column in self.frame.columns]
+        self.arrays = [self._column_array(self.frame[column]) for column in self.frame.columns]
+        # column -> argsort of all rows, column -> (codes, lowercase unique texts) for the text filter
+        self.sort_permutations = {}
+        self.factorized = {}
+        self.sort_column = None
+        self.sort_ascending = True
+        self.filter_text = ''
+        self.filter_column = None
+        self.text_mask = None
+        self.row_mask = None
+        self.order = np.arange(len(self.frame))
+        self.endResetModel()
+
+    # Function to keep a column as (codes, categories) for categoricals, as its numpy array otherwise
+    @staticmethod
+    def _column_array(column):
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            return column.cat.codes.to_numpy(), np.asarray(column.cat.categories, dtype=object)
+        return column.to_numpy(), None
+
+    def _value(self, column, position):
+        values, categories = self.arrays[column]
+        if categories is None:
+            return values[position]
+        code = values[position]
+        return None if code < 0 else categories[code]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.order)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.column_names)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return _format_cell(self._value(index.column(), self.order[index.row()]))
+        if role == Qt.TextAlignmentRole and self.arrays[index.column()][1] is None \
+                and np.issubdtype(self.arrays[index.column()][0].dtype, np.number):
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.column_names[section]
+        return str(section + 1)
+
+    # Function to return the source row shown at a view row, as a Series
+    def row(self, view_row):
+        return self.frame.iloc[self.order[view_row]]
+
+    # Function to return the stable argsort of a column over all rows (NULL first), computed once per column
+    def _sort_permutation(self, column):
+        permutation = self.sort_permutations.get(column)
+        if permutation is None:
+            values, categories = self.arrays[column]
+            if categories is not None:
+                # Rank the categories by their text, NULL (code -1) first
+                ranks = np.empty(len(categories) + 1, dtype=np.int64)
+                ranks[0] = -1
+                ranks[1:] = np.argsort(np.argsort(categories.astype(str), kind='stable'), kind='stable')
+                keys = ranks[values.astype(np.int64) + 1]
+            elif values.dtype == object:
+                keys, _ = pd.factorize(pd.Series(values), sort=True)
+            elif np.issubdtype(values.dtype, np.datetime64):
+                keys = values.view(np.int64)
+            else:
+                keys = values
+            permutation = self.sort_permutations[column] = np.argsort(keys, kind='stable')
+        return permutation
+
+    # Function to return (codes, lowercase unique texts) of a column, computed once per column
+    def _factorize(self, column):
+        if column not in self.factorized:
+            values, categories = self.arrays[column]
+            if categories is None:
+                values, categories = pd.factorize(values)
+            texts = np.array([_format_cell(value).lower() for value in categories], dtype=object)
+            self.factorized[column] = (values, texts)
+        return self.factorized[column]
+
+    # Function to rebuild the rows shown from the sort permutation and the masks
+    def _refresh(self):
+        self.layoutAboutToBeChanged.emit()
+        if self.sort_column is None:
+            order = np.arange(len(self.frame))
+        else:
+            order = self._sort_permutation(self.sort_column)
+            if not self.sort_ascending:
+                order = order[::-1]
+        mask = self.text_mask
+        if self.row_mask is not None:
+            mask = self.row_mask if mask is None else mask & self.row_mask
+        self.order = order if mask is None else order[mask[order]]
+        self.layoutChanged.emit()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column if 0 <= column < len(self.column_names) else None
+        self.sort_ascending = order == Qt.AscendingOrder
+        self._refresh()
+
+    # Function to keep the rows whose text contains text (case-insensitive), in one column or in any of them
+    def set_text_filter(self, text, column=None):
+        self.filter_text = text
+        self.filter_column = column
+        text = text.strip().lower()
+        if not text:
+            self.text_mask = None
+        else:
+            mask = np.zeros(len(self.frame), dtype=bool)
+            for index in range(len(self.column_names)) if column is None else [column]:
+                codes, texts = self._factorize(index)
+                hits = np.fromiter((text in value for value in texts), dtype=bool, count=len(texts))
+                # Code -1 (NULL) never matches
+                mask |= np.append(hits, False)[codes]
+            self.text_mask = mask
+        self._refresh()
+
+    # Function to keep the rows of a boolean mask over the frame (None shows every row)
+    def set_row_filter(self, mask):
+        self.row_mask = None if mask is None else np.asarray(mask, dtype=bool)
+        self._refresh()
+
+
+# Function to select the extracted rows of one report group: same group key and same day
+def drilldown_mask(collected_data, report_row):
+    mask = np.ones(len(collected_data), dtype=bool)
+    for column in group_columns:
+        value = report_row[column]
+        if value is None or value != value:
+            mask &= collected_data[column].isna().to_numpy()
+        else:
+            mask &= (collected_data[column] == value).fillna(False).to_numpy(dtype=bool)
+    day = str(report_row['StartTime'])[:10]
+    start_times = collected_data['StartTime']
+    if pd.api.types.is_datetime64_any_dtype(start_times):
+        mask &= (start_times.dt.floor('D') == pd.Timestamp(day)).to_numpy()
+    else:
+        mask &= (start_times.str[:10] == day).to_numpy(dtype=bool)
+    return mask
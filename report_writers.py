@@ -0,0 +1,202 @@
+import gzip
+import os
+import re
+import zipfile
+from html import escape
+
+# Excel template the XLSX writer fills, next to this script
+TEMPLATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'TEMPLATE NXT REJECT - V1.xlsx')
+
+# Sheet and table of the template receiving the rows
+TEMPLATE_SHEET = 'xl/worksheets/sheet1.xml'
+TEMPLATE_TABLE = 'xl/tables/table1.xml'
+
+# Columns of the template table with the report column (or function of the report) filling each of them
+TEMPLATE_COLUMNS = [
+    (' Machine Name', lambda report: report['Type'].astype(str) + report['Module'].astype(str)),
+    ('job', lambda report: report['Recipe_name']),
+    ('StartTime', lambda report: report['StartTime']),
+    ('PartName', lambda report: report['PartName']),
+    ('Stage', lambda report: report['Stage_no']),
+    ('Pos', lambda report: report['Slot'].astype(str)),
+    ('Class', lambda report: 'Feeder'),
+    ('PickupCount', lambda report: report['PickupCount']),
+    ('TotalPartsUsed', lambda report: report['TotalPartsUsed']),
+    ('RejectParts', lambda report: report['RejectParts']),
+    ('PickupMiss', lambda report: report['PickupMiss']),
+    ('ErrorParts', lambda report: report['ErrorParts']),
+    ('DislodgedParts', lambda report: report['Dislodged_parts_count']),
+    ('FIDL', lambda report: report['FIDL']),
+]
+
+# Rows handed to pandas at once by the CSV writer
+CSV_CHUNK_ROWS = 100000
+
+
+# Writer of plain or gzip-compressed CSV. write() can be called once per chunk, the header is
+# written with the first one, so exports larger than memory are written frame by frame.
+class CsvWriter:
+    def __init__(self, path, compress=False, compress_level=1):
+        self.path = path
+        if compress:
+            # Level 1 compresses several times faster than the default 9 for a slightly larger file
+            self.file = gzip.open(path, 'wt', compresslevel=compress_level, encoding='utf-8', newline='')
+        else:
+            self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.file, index=False, header=self.header, chunksize=CSV_CHUNK_ROWS)
+        self.header = False
+
+    def close(self):
+        self.file.close()
+
+
+# Function to import pyarrow, which the columnar writers need
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("The parquet and arrow report formats need pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+# Writer of Parquet or Arrow IPC files: the dtypes of the report are kept, so the file reloads
+# without any parsing. Each write() appends a row group (Parquet) or record batches (Arrow).
+class ColumnarWriter:
+    def __init__(self, path, file_format='parquet'):
+        self.path = path
+        self.file_format = file_format
+        self.pyarrow = _pyarrow()
+        self.schema = None
+        self.writer = None
+
+    def write(self, df):
+        pa = self.pyarrow
+        if self.writer is None:
+            self.schema = pa.Schema.from_pandas(df, preserve_index=False)
+            if self.file_format == 'parquet':
+                self.writer = pa.parquet.ParquetWriter(self.path, self.schema)
+            else:
+                self.writer = pa.ipc.new_file(self.path, self.schema)
+        self.writer.write_table(pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def close(self):
+        if self.writer is None:
+            # Nothing written: still leave a readable file with no row
+            self.schema = self.pyarrow.schema([])
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, self.schema) if self.file_format == 'parquet' \
+                else self.pyarrow.ipc.new_file(self.path, self.schema)
+        self.writer.close()
+
+
+# Function to return the spreadsheet name of a 0-based column (0 -> A, 26 -> AA)
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+# Write-only writer filling the table of the XLSX template. The rows are streamed into the sheet
+# entry of the new archive as they come, every other part of the template is copied as is and the
+# table range is set once the row count is known. No workbook is ever held in memory.
+class XlsxTemplateWriter:
+    def __init__(self, path, template=TEMPLATE_FILE):
+        self.path = path
+        self.template = zipfile.ZipFile(template)
+        sheet = self.template.read(TEMPLATE_SHEET).decode('utf-8')
+        # The template's sheet without its sample rows: everything before <sheetData> and after </sheetData>
+        header_row = re.search(r'<row r="1".*?</row>', sheet).group(0)
+        self.sheet_tail = sheet[sheet.index('</sheetData>'):]
+        sheet_head = re.sub(r'<dimension ref="[^"]*"/>', '', sheet[:sheet.index('<sheetData>')])
+
+        self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        for item in self.template.infolist():
+            if item.filename not in (TEMPLATE_SHEET, TEMPLATE_TABLE):
+                self.archive.writestr(item, self.template.read(item.filename))
+        self.sheet = self.archive.open(TEMPLATE_SHEET, 'w', force_zip64=True)
+        self.sheet.write((sheet_head + '<sheetData>' + header_row).encode('utf-8'))
+        self.letters = [_column_letter(index) for index in range(len(TEMPLATE_COLUMNS))]
+        self.row_count = 1
+
+    def write(self, report):
+        columns = []
+        for _, value in TEMPLATE_COLUMNS:
+            column = value(report)
+            if isinstance(column, str):
+                column = [column] * len(report)
+            columns.append(list(column))
+        rows = []
+        for values in zip(*columns):
+            self.row_count += 1
+            cells = []
+            for letter, value in zip(self.letters, values):
+                reference = f"{letter}{self.row_count}"
+                if value is None or value != value:
+                    continue
+                if isinstance(value, str):
+                    cells.append(f'<c r="{reference}" s="1" t="inlineStr"><is><t>{escape(value, quote=False)}</t></is></c>')
+                else:
+                    cells.append(f'<c r="{reference}"><v>{value}</v></c>')
+            rows.append(f'<row r="{self.row_count}">{"".join(cells)}</row>')
+        self.sheet.write(''.join(rows).encode('utf-8'))
+
+    def close(self):
+        self.sheet.write(self.sheet_tail.encode('utf-8'))
+        self.sheet.close()
+        # A table needs at least one row below its header
+        reference = f"A1:{self.letters[-1]}{max(self.row_count, 2)}"
+        table = self.template.read(TEMPLATE_TABLE).decode('utf-8')
+        self.archive.writestr(TEMPLATE_TABLE, re.sub(r'ref="[^"]*"', f'ref="{reference}"', table))
+        self.archive.close()
+        self.template.close()
+
+
+# Output formats: file extension and function opening the writer of a path
+OUTPUT_FORMATS = {
+    'csv': ('.csv', lambda path: CsvWriter(path)),
+    'csv.gz': ('.csv.gz', lambda path: CsvWriter(path, compress=True)),
+    'parquet': ('.parquet', lambda path: ColumnarWriter(path, 'parquet')),
+    'arrow': ('.arrow', lambda path: ColumnarWriter(path, 'arrow')),
+    'xlsx': ('.xlsx', lambda path: XlsxTemplateWriter(path)),
+}
+
+
+# Function to check a report format before a run, so a missing pyarrow fails before the extraction
+def check_output_format(output_format):
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of {list(OUTPUT_FORMATS)}")
+    if output_format in ('parquet', 'arrow'):
+        _pyarrow()
+    return output_format
+
+
+# Function to read the report format from the [Output] section of config.ini
+def read_output_format(config):
+    return check_output_format(config.get('Output', 'format', fallback='csv').strip().lower())
+
+
+# Function to build the default report file name, e.g. Report_generate_20240309_20240311_Ligne2_Ligne3.csv
+def report_file_name(start_date, end_date, servers, output_format='csv'):
+    return f"Report_generate_{start_date}_{end_date}_{'_'.join(servers)}{OUTPUT_FORMATS[output_format][0]}"
+
+
+# Function to open the writer of a format, to write a report (or an export) chunk by chunk
+def open_report_writer(path, output_format='csv'):
+    return OUTPUT_FORMATS[output_format][1](path)
+
+
+# Function to write a whole report in one of the output formats
+def write_report_file(report, path, output_format='csv'):
+    writer = open_report_writer(path, output_format)
+    try:
+        writer.write(report)
+    finally:
+        writer.close()
+    return path
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+import pandas as pd
+from extraction import list_prod_tables
+from source_access import connect_source
+
+# Layout of the cached reports (PRAGMA user_version of the index), entries of another layout are dropped
+REPORT_LAYOUT_VERSION = 1
+
+# Memory tiers of the open caches, per cache directory: they outlive a run so a repeated request is
+# answered without reading the disk. key -> (fingerprints, report), least recently used first.
+_memory_tiers = {}
+_memory_lock = threading.Lock()
+
+
+# Function to fingerprint a source file: (size, mtime, max id of its Prod tables).
+# The max id changes with every appended row even when the size and the mtime do not.
+def source_fingerprint(file_name):
+    stat = os.stat(file_name)
+    max_id = None
+    try:
+        with closing(connect_source(file_name)) as db_conn:
+            for table_name in list_prod_tables(db_conn):
+                table_max = db_conn.execute(f"SELECT MAX(id) FROM {table_name}").fetchone()[0]
+                if table_max is not None and (max_id is None or table_max > max_id):
+                    max_id = table_max
+    except sqlite3.Error:
+        pass
+    return stat.st_size, stat.st_mtime, max_id
+
+
+# Function to fingerprint the files of a report, {absolute path: (size, mtime, max id)}
+def fingerprint_files(file_tasks):
+    return {os.path.abspath(file_name): source_fingerprint(file_name) for _, file_name in file_tasks}
+
+
+# Cache of finished reports, keyed on the request (lines, window, grouping). Each entry records the
+# fingerprint of every source file it was computed from and is only returned while the files of the
+# request still have exactly those fingerprints. A changed file drops the entries built from it, and
+# only those. Reports are kept in a memory tier (a few entries) and an on-disk tier (bounded in bytes),
+# both evicting the least recently used entries.
+class ResultCache:
+    def __init__(self, cache_dir, max_size_bytes, memory_entries=8):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.memory_entries = memory_entries
+        os.makedirs(cache_dir, exist_ok=True)
+        with _memory_lock:
+            self.memory = _memory_tiers.setdefault(os.path.abspath(cache_dir), OrderedDict())
+        self.index_file = os.path.join(cache_dir, 'index.db')
+        with sqlite3.connect(self.index_file) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    report_file TEXT,
+                    nbytes INTEGER,
+                    last_used REAL
+                );
+                CREATE TABLE IF NOT EXISTS sources (
+                    key TEXT,
+                    path TEXT,
+                    size INTEGER,
+                    mtime REAL,
+                    max_id INTEGER,
+                    PRIMARY KEY (key, path)
+                );
+                CREATE INDEX IF NOT EXISTS sources_path ON sources (path);
+            """)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != REPORT_LAYOUT_VERSION:
+                for (report_file,) in conn.execute("SELECT report_file FROM entries").fetchall():
+                    self._remove_report_file(report_file)
+                conn.execute("DELETE FROM entries")
+                conn.execute("DELETE FROM sources")
+                conn.execute(f"PRAGMA user_version = {REPORT_LAYOUT_VERSION}")
+
+    # Function to build the key of a request
+    @staticmethod
+    def request_key(lines, start_datetime, end_datetime, grouping='day'):
+        request = repr((list(lines), str(start_datetime), str(end_datetime), grouping))
+        return hashlib.sha1(request.encode('utf-8')).hexdigest()
+
+    # Function to return the cached report of a request, None when missing or stale.
+    # fingerprints are the current ones of the files the request reads (fingerprint_files).
+    def get(self, key, fingerprints):
+        self.invalidate_changed(fingerprints)
+        with _memory_lock:
+            entry = self.memory.get(key)
+            if entry is not None and entry[0] == fingerprints:
+                self.memory.move_to_end(key)
+                return entry[1].copy()
+
+        with sqlite3.connect(self.index_file) as conn:
+            row = conn.execute("SELECT report_file FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            sources = {path: (size, mtime, max_id) for path, size, mtime, max_id in conn.execute(
+                "SELECT path, size, mtime, max_id FROM sources WHERE key = ?", (key,))}
+            if sources != fingerprints:
+                # Files were added to or removed from the window since the entry was stored
+                self._delete(conn, [key])
+                return None
+            try:
+                report = pd.read_pickle(os.path.join(self.cache_dir, row[0]))
+            except (OSError, EOFError, ValueError):
+                self._delete(conn, [key])
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._remember(key, fingerprints, report.copy())
+        return report
+
+    # Function to store the report of a request with the fingerprints of its files
+    def put(self, key, fingerprints, report):
+        with sqlite3.connect(self.index_file) as conn:
+            self._delete(conn, [key])
+            report_file = f"{key}_{int(time.time() * 1000)}.pkl"
+            report.to_pickle(os.path.join(self.cache_dir, report_file))
+            nbytes = os.path.getsize(os.path.join(self.cache_dir, report_file))
+            conn.execute("INSERT INTO entries VALUES (?, ?, ?, ?)", (key, report_file, nbytes, time.time()))
+            conn.executemany("INSERT INTO sources VALUES (?, ?, ?, ?, ?)",
+                             [(key, path) + tuple(fingerprint) for path, fingerprint in fingerprints.items()])
+            self._evict(conn)
+        # Remembered once the previous entry of the key is deleted, which also drops it from the memory tier
+        self._remember(key, fingerprints, report.copy())
+
+    # Function to drop every entry built from one of the files whose fingerprint is no longer the given one
+    def invalidate_changed(self, fingerprints):
+        with sqlite3.connect(self.index_file) as conn:
+            stale = set()
+            for path, (size, mtime, max_id) in fingerprints.items():
+                stale.update(key for key, in conn.execute(
+                    "SELECT key FROM sources WHERE path = ? AND NOT (size IS ? AND mtime IS ? AND max_id IS ?)",
+                    (path, size, mtime, max_id)))
+            if stale:
+                self._delete(conn, stale)
+        with _memory_lock:
+            for key, (sources, _) in list(self.memory.items()):
+                if any(path in fingerprints and fingerprints[path] != fingerprint for path, fingerprint in sources.items()):
+                    del self.memory[key]
+
+    # Function to drop every entry built from a file (e.g. a file that was rewritten or deleted)
+    def invalidate_file(self, file_name):
+        path = os.path.abspath(file_name)
+        with sqlite3.connect(self.index_file) as conn:
+            self._delete(conn, [key for key, in conn.execute("SELECT key FROM sources WHERE path = ?", (path,))])
+        with _memory_lock:
+            for key, (sources, _) in list(self.memory.items()):
+                if path in sources:
+                    del self.memory[key]
+
+    def _remember(self, key, fingerprints, report):
+        with _memory_lock:
+            self.memory[key] = (fingerprints, report)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def _delete(self, conn, keys):
+        for key in keys:
+            row = conn.execute("SELECT report_file FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._remove_report_file(row[0])
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            conn.execute("DELETE FROM sources WHERE key = ?", (key,))
+            with _memory_lock:
+                self.memory.pop(key, None)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_size_bytes:
+            return
+        for key, nbytes in conn.execute("SELECT key, nbytes FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_size_bytes:
+                break
+            self._delete(conn, [key])
+            total -= nbytes
+
+    def _remove_report_file(self, report_file):
+        try:
+            os.remove(os.path.join(self.cache_dir, report_file))
+        except OSError:
+            pass
+
+
+# Function to open the cache described by the [ResultCache] section of config.ini (None when disabled)
+def open_result_cache(config):
+    if not config.has_section('ResultCache') or not config.getboolean('ResultCache', 'enabled', fallback=False):
+        return None
+    cache_dir = config.get('ResultCache', 'directory', fallback='result_cache')
+    max_size_mb = config.getint('ResultCache', 'max_size_mb', fallback=64)
+    memory_entries = config.getint('ResultCache', 'memory_entries', fallback=8)
+    return ResultCache(cache_dir, max_size_mb * 1024 * 1024, memory_entries)
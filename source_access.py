@@ -0,0 +1,66 @@
+import os
+import re
+import sqlite3
+from datetime import datetime
+from urllib.request import pathname2url
+
+# Source file names: <YYYYMMDD>_<line>[COUNT].db, rotated files carry a suffix: [COUNT].<suffix>.db
+SOURCE_NAME_PATTERN = re.compile(r'^(\d{8})_.*\[COUNT\](?:\.(\d+))?\.db$')
+
+# PRAGMAs applied to every source connection: memory-mapped reads, a larger page cache
+# (negative = KiB), temporary b-trees in memory and no write of any kind
+SOURCE_PRAGMAS = {
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+    'query_only': 'ON',
+}
+
+
+# Function to read the (date, rotation suffix) of a source file name, None when it is not a [COUNT].db file
+def parse_source_name(file_name):
+    match = SOURCE_NAME_PATTERN.match(file_name)
+    if match is None:
+        return None
+    return match.group(1), match.group(2) or ''
+
+
+# Function to tell whether a source file is closed: files of the previous days and rotated files
+# are never written again, today's [COUNT].db still is
+def is_closed_source(file_name, today=None):
+    parsed_name = parse_source_name(os.path.basename(file_name))
+    if parsed_name is None:
+        return False
+    file_date, rotation = parsed_name
+    return rotation != '' or file_date < (today or datetime.now().strftime('%Y%m%d'))
+
+
+# Function to build the read-only URI of a source file. Closed files are also opened as immutable,
+# SQLite then skips the locks and the journal / change checks on every read.
+def source_uri(file_name, today=None):
+    uri = 'file:' + pathname2url(os.path.abspath(file_name)) + '?mode=ro'
+    if is_closed_source(file_name, today):
+        uri += '&immutable=1'
+    return uri
+
+
+# Function to apply the read PRAGMAs to a connection (or to one of its attached schemas)
+def tune_source_connection(db_conn, schema=None):
+    prefix = '' if schema is None else f'{schema}.'
+    for name, value in SOURCE_PRAGMAS.items():
+        if name in ('temp_store', 'query_only'):
+            # Connection-wide settings, they take no schema
+            db_conn.execute(f"PRAGMA {name} = {value}")
+        else:
+            db_conn.execute(f"PRAGMA {prefix}{name} = {value}")
+    return db_conn
+
+
+# Function to open a source file read-only with the read PRAGMAs applied
+def connect_source(file_name, today=None):
+    db_conn = sqlite3.connect(source_uri(file_name, today), uri=True)
+    try:
+        return tune_source_connection(db_conn)
+    except sqlite3.Error:
+        db_conn.close()
+        raise
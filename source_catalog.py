@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import time
+from extraction import list_prod_tables
+from source_access import connect_source, parse_source_name
+from time_pruning import table_time_range
+
+
+# Function to list the [COUNT].db files of a folder (rotated ones included) dated within [start_date, end_date]
+def list_source_files(folder, start_date, end_date):
+    file_names = []
+    if os.path.exists(folder):
+        for entry_name in os.listdir(folder):
+            parsed_name = parse_source_name(entry_name)
+            if parsed_name is not None and start_date <= parsed_name[0] <= end_date:
+                file_names.append(os.path.join(folder, entry_name))
+    return file_names
+
+
+# Persistent manifest of the [COUNT].db source files of every line: date, rotation suffix,
+# size/mtime, Prod tables with their row counts and DateTime range. Folders are refreshed
+# incrementally (only new or changed files are opened) and a report is planned with one query.
+class SourceCatalog:
+    def __init__(self, catalog_file):
+        self.catalog_file = catalog_file
+        with sqlite3.connect(catalog_file) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    line TEXT,
+                    file_date TEXT,
+                    rotation TEXT,
+                    size INTEGER,
+                    mtime REAL,
+                    scanned_at REAL
+                );
+                CREATE TABLE IF NOT EXISTS tables (
+                    path TEXT,
+                    table_name TEXT,
+                    row_count INTEGER,
+                    min_id INTEGER,
+                    max_id INTEGER,
+                    min_datetime TEXT,
+                    max_datetime TEXT,
+                    PRIMARY KEY (path, table_name)
+                );
+                CREATE INDEX IF NOT EXISTS files_line_date ON files (line, file_date);
+            """)
+
+    # Function to bring the entries of one line folder up to date
+    # With start_date / end_date (YYYYMMDD), only the new or changed files dated within them are opened,
+    # the others are scanned once a report needs them. on_file(path, done, total) is called after each
+    # file opened. Returns the list of files that could not be read
+    def refresh(self, line, folder, start_date=None, end_date=None, on_file=None):
+        failed_files = []
+        on_disk = {}
+        if os.path.exists(folder):
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    parsed_name = parse_source_name(entry.name)
+                    if parsed_name is not None and entry.is_file():
+                        on_disk[entry.path] = (parsed_name, entry.stat())
+
+        with sqlite3.connect(self.catalog_file) as conn:
+            known = {path: (size, mtime) for path, size, mtime in conn.execute(
+                "SELECT path, size, mtime FROM files WHERE line = ?", (line,))}
+
+            # Step 1: Forget the files that disappeared from the folder
+            for path in set(known) - set(on_disk):
+                conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                conn.execute("DELETE FROM tables WHERE path = ?", (path,))
+
+            # Step 2: Scan the new and changed files only (of the dates asked for)
+            to_scan = [(path, file_date, rotation, stat) for path, ((file_date, rotation), stat) in on_disk.items()
+                       if known.get(path) != (stat.st_size, stat.st_mtime)
+                       and (start_date is None or start_date <= file_date) and (end_date is None or file_date <= end_date)]
+            for done, (path, file_date, rotation, stat) in enumerate(to_scan, start=1):
+                try:
+                    table_rows = self._scan_tables(path)
+                except sqlite3.Error:
+                    failed_files.append(path)
+                else:
+                    conn.execute("DELETE FROM tables WHERE path = ?", (path,))
+                    conn.executemany("INSERT INTO tables VALUES (?, ?, ?, ?, ?, ?, ?)", table_rows)
+                    conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 (path, line, file_date, rotation, stat.st_size, stat.st_mtime, time.time()))
+                if on_file is not None:
+                    on_file(path, done, len(to_scan))
+        return failed_files
+
+    @staticmethod
+    def _scan_tables(path):
+        table_rows = []
+        db_conn = connect_source(path)
+        try:
+            for table_name in list_prod_tables(db_conn):
+                row_count = db_conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+                time_range = table_time_range(db_conn, table_name) or (None, None, None, None)
+                table_rows.append((path, table_name, row_count) + tuple(time_range))
+        finally:
+            db_conn.close()
+        return table_rows
+
+    # Function to list the (line, path) pairs a report needs, in the order of the given lines.
+    # With a window, files whose tables hold no row of it are left out.
+    def plan(self, lines, start_date, end_date, start_datetime=None, end_datetime=None):
+        if not lines:
+            return []
+        query = f"""
+            SELECT DISTINCT files.line, files.path
+            FROM files JOIN tables ON tables.path = files.path
+            WHERE files.line IN ({', '.join('?' * len(lines))}) AND files.file_date BETWEEN ? AND ?
+        """
+        params = list(lines) + [start_date, end_date]
+        if start_datetime is not None and end_datetime is not None:
+            query += " AND tables.max_datetime >= ? AND tables.min_datetime <= ?"
+            params += [str(start_datetime), str(end_datetime)]
+        query += " ORDER BY files.file_date, files.rotation, files.path"
+        with sqlite3.connect(self.catalog_file) as conn:
+            rows = conn.execute(query, params).fetchall()
+        line_order = {line: index for index, line in enumerate(lines)}
+        return sorted(rows, key=lambda row: line_order[row[0]])
+
+
+# Function to open the catalog described by the [Catalog] section of config.ini (None when disabled)
+def open_source_catalog(config):
+    if not config.has_section('Catalog') or not config.getboolean('Catalog', 'enabled', fallback=False):
+        return None
+    return SourceCatalog(config.get('Catalog', 'file', fallback='source_catalog.db'))
+
+
+# Function to list the (line, path) pairs of a report: from the catalog when it is enabled (refreshing
+# the files of the report's dates, on_scan(path, done, total) being called after each file scanned),
+# otherwise by listing the folder of each line
+def plan_file_tasks(config, servers, start_date, end_date, start_datetime=None, end_datetime=None, on_error=None,
+                    on_scan=None):
+    catalog = open_source_catalog(config)
+    if catalog is None:
+        file_tasks = []
+        for server in servers:
+            file_tasks.extend((server, file_name) for file_name in
+                              list_source_files(config['Paths'].get(server, ""), start_date, end_date))
+        return file_tasks
+    for server in servers:
+        for file_name in catalog.refresh(server, config['Paths'].get(server, ""), start_date, end_date, on_scan):
+            if on_error is not None:
+                on_error(file_name)
+    return catalog.plan(servers, start_date, end_date, start_datetime, end_datetime)
@@ -0,0 +1,122 @@
+import argparse
+import os
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+# Schema of a [COUNT].db file, as written by the machines ({table} is the Prod table name)
+SCHEMA = """
+CREATE TABLE [LINE] ([ID] INTEGER PRIMARY KEY AUTOINCREMENT,[NAME] TEXT,[BOARD_FLOW] TEXT);
+CREATE TABLE [MACHINE] ([ID] INTEGER PRIMARY KEY AUTOINCREMENT,[LINE_ID] INTEGER,[NAME] TEXT,[TYPE] TEXT,[BOARD_FLOW] TEXT,[LANE] INTEGER,[MODEL] TEXT,[PROD_MODE] TEXT);
+CREATE TABLE [BASE] ([ID] INTEGER PRIMARY KEY AUTOINCREMENT,[MACHINE_ID] INTEGER,[NAME] TEXT,[TYPE] TEXT,[WIDTH] INTEGER);
+CREATE TABLE [MODULE] ([ID] INTEGER PRIMARY KEY AUTOINCREMENT,[BASE_ID] INTEGER,[NAME] TEXT,[LOGICAL] INTEGER,[PHYSICAL] INTEGER,[TYPE] INTEGER,[CONVEYOR] INTEGER);
+CREATE TABLE [_FILE_] ([id] INTEGER PRIMARY KEY AUTOINCREMENT,[DateTime] VARCHAR(24),[Name] TEXT,[UpdateTime] VARCHAR(20),[Size] INTEGER NOT NULL DEFAULT '0',[Data] BLOB);
+"""
+PROD_SCHEMA = """
+CREATE TABLE [{table}] ([id] INTEGER PRIMARY KEY AUTOINCREMENT,[DateTime] VARCHAR(24),[Module] INTEGER,[Lane] INTEGER,[Msg] TEXT,[Data] TEXT);
+CREATE INDEX [Index_{table}_1] ON [{table}]([Msg]);
+"""
+
+# Number of modules per base, as on the NXT bases of the sample files
+MODULES_PER_BASE = 2
+
+
+# Feeder set-up of one module: (slot, part name, feeder id) for each feeder
+def _module_feeders(rng, module, feeders):
+    return [(slot, f"PART{module:02d}{slot:03d}", f"KT{rng.randrange(1000):03d} {rng.randrange(1000000):06d}")
+            for slot in range(1, feeders + 1)]
+
+
+# Function to build one tab-separated PDCOUNT2 payload (the layout of extraction.split_columns)
+def _payload(rng, recipe, stage, slot, part_name, fidl, module, reject_rate):
+    pickups = rng.randint(1, 40)
+    rejected = sum(rng.random() < reject_rate for _ in range(pickups))
+    errors = rng.random() < reject_rate / 4
+    no_pickup = rng.random() < reject_rate / 2
+    used = pickups - rejected
+    fields = ['0', 'LANE1', recipe, ' ', stage, 0, slot, 0, pickups, int(errors), 0, rejected, 0, int(no_pickup),
+              used, 0, part_name, 0, fidl, module, 0]
+    return '\t'.join(str(field) for field in fields)
+
+
+# Function to write one [COUNT].db file of a line for one day
+# rows_per_day rows are spread over panels produced through the day, each panel writes one row
+# per feeder of the module that placed it. Ids increase with DateTime like in the real files.
+def generate_day_file(folder, line, day, modules=6, feeders=20, rows_per_day=20000, seed=0, machine_type='NXT',
+                      reject_rate=0.01):
+    rng = random.Random(f"{seed}-{line}-{day:%Y%m%d}")
+    machine = f"{machine_type}{line.upper()}"
+    table = f"Prod_{machine}"
+    file_name = os.path.join(folder, f"{day:%Y%m%d}_{line}[COUNT].db")
+    if os.path.exists(file_name):
+        os.remove(file_name)
+
+    setup = {module: _module_feeders(rng, module, feeders) for module in range(1, modules + 1)}
+    recipe = f"RECIPE_{line.upper()}_{rng.randrange(100):02d}"
+    panel_count = max(1, rows_per_day // feeders)
+    panel_times = sorted(rng.uniform(0, 86400) for _ in range(panel_count))
+
+    rows = []
+    for seconds in panel_times:
+        date_time = (day + timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S.%f')[:23]
+        module = rng.randint(1, modules)
+        stage = (module - 1) // MODULES_PER_BASE + 1
+        for slot, part_name, fidl in setup[module]:
+            rows.append((date_time, module, 1, 'PDCOUNT2',
+                         _payload(rng, recipe, stage, slot, part_name, fidl, module, reject_rate)))
+
+    db_conn = sqlite3.connect(file_name)
+    try:
+        db_conn.executescript(SCHEMA + PROD_SCHEMA.format(table=table))
+        db_conn.execute("INSERT INTO LINE (NAME, BOARD_FLOW) VALUES (?, 'Left->Right')", (line,))
+        db_conn.execute("INSERT INTO MACHINE (LINE_ID, NAME, TYPE, BOARD_FLOW, LANE, MODEL, PROD_MODE) "
+                        "VALUES (1, ?, ?, 'Left->Right', 1, ?, 'Normal')", (machine, machine_type, f"{machine_type}2"))
+        for base in range((modules + MODULES_PER_BASE - 1) // MODULES_PER_BASE):
+            db_conn.execute("INSERT INTO BASE (MACHINE_ID, NAME, TYPE, WIDTH) VALUES (1, ?, ?, 4)",
+                            (f"10.200.8.{base + 1}", machine_type))
+        for module in range(1, modules + 1):
+            db_conn.execute("INSERT INTO MODULE (BASE_ID, NAME, LOGICAL, PHYSICAL, TYPE, CONVEYOR) VALUES (?, ?, ?, ?, 602, 0)",
+                            ((module - 1) // MODULES_PER_BASE + 1, str(module), module, module))
+        db_conn.executemany(f"INSERT INTO {table} (DateTime, Module, Lane, Msg, Data) VALUES (?, ?, ?, ?, ?)", rows)
+        db_conn.commit()
+    finally:
+        db_conn.close()
+    return file_name
+
+
+# Function to write the files of several lines over several days, one folder per line.
+# Returns {line: folder}, ready to be used as the [Paths] section.
+def generate_dataset(root, lines=2, days=3, first_day='20240301', modules=6, feeders=20, rows_per_day=20000, seed=0):
+    start = datetime.strptime(first_day, '%Y%m%d')
+    folders = {}
+    for line_index in range(1, lines + 1):
+        line = f"Ligne{line_index}"
+        folder = os.path.join(root, line)
+        os.makedirs(folder, exist_ok=True)
+        for day_index in range(days):
+            generate_day_file(folder, line, start + timedelta(days=day_index), modules, feeders, rows_per_day, seed)
+        folders[line] = folder
+    return folders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic [COUNT].db files")
+    parser.add_argument('root', help="folder receiving one sub-folder per line")
+    parser.add_argument('--lines', type=int, default=2)
+    parser.add_argument('--days', type=int, default=3)
+    parser.add_argument('--first-day', default='20240301', help="YYYYMMDD")
+    parser.add_argument('--modules', type=int, default=6)
+    parser.add_argument('--feeders', type=int, default=20, help="feeders per module")
+    parser.add_argument('--rows-per-day', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    folders = generate_dataset(args.root, args.lines, args.days, args.first_day, args.modules, args.feeders,
+                               args.rows_per_day, args.seed)
+    # Print a [Paths] section pointing at the generated folders
+    print("[Paths]")
+    for line, folder in folders.items():
+        print(f"{line} = {os.path.abspath(folder)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+import pushdown
+from aggregation import StreamingAggregator, aggregate_connection, aggregate_frame
+from extraction import concat_frames, extract_files
+from pushdown import aggregate_attached
+from synthetic_data import generate_dataset
+
+# Column order of the collected rows handed to the aggregation (as in Function.process_collected_data)
+desired_columns = ["Line_name", "Type", "Module", "Recipe_name", "StartTime", "Stage_no", 'Position_no', "Parts_pickup_count",
+                   "Error_parts_count", "Error_rejected_parts_count", "Rejected_parts_count", "Dislodged_parts_count",
+                   "NoPickup_Number_of_parts_not_used", "Used_parts_count", "PartName", "FIDL"]
+
+START = datetime(2024, 3, 1)
+END = datetime(2024, 3, 3, 23, 59)
+
+
+# Function to append rows to the Prod table of a synthetic file: copies of its first rows moved to the given
+# times, and rows whose payload stops before PartName / FIDL (read back as NULL)
+def _append_rows(file_name, moments):
+    with closing(sqlite3.connect(file_name)) as db_conn:
+        table_name = db_conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'Prod_%'").fetchone()[0]
+        rows = db_conn.execute(f"SELECT Module, Lane, Msg, Data FROM {table_name} ORDER BY id LIMIT 12").fetchall()
+        appended = []
+        for moment in moments:
+            for module, lane, msg, data in rows:
+                appended.append((moment, module, lane, msg, data))
+                appended.append((moment, module, lane, msg, '\t'.join(data.split('\t')[:16])))
+                appended.append((moment, module, lane, msg, '\t'.join(data.split('\t')[:18])))
+        db_conn.executemany(f"INSERT INTO {table_name} (DateTime, Module, Lane, Msg, Data) VALUES (?, ?, ?, ?, ?)", appended)
+        db_conn.commit()
+
+
+@pytest.fixture(scope='module')
+def file_tasks(tmp_path_factory):
+    root = tmp_path_factory.mktemp('parity')
+    folders = generate_dataset(str(root), lines=2, days=3, first_day='20240301', modules=12, feeders=4, rows_per_day=1500)
+    file_tasks = []
+    for line, folder in folders.items():
+        for file_name in sorted(os.listdir(folder)):
+            file_tasks.append((line, os.path.join(folder, file_name)))
+    # Rows on both sides of the day boundaries, with NULL PartName / FIDL among them
+    for day, (_, file_name) in zip(['2024-03-01', '2024-03-02'], file_tasks):
+        _append_rows(file_name, [f'{day} 23:59:59.990', f'{day} 23:59:00.000'])
+    for day, (_, file_name) in zip(['2024-03-02', '2024-03-03'], file_tasks[1:]):
+        _append_rows(file_name, [f'{day} 00:00:00.000', f'{day} 00:00:30.500'])
+    return file_tasks
+
+
+@pytest.fixture(scope='module')
+def frames(file_tasks):
+    return extract_files(file_tasks, START, END)
+
+
+def _collected_data(frames):
+    return concat_frames(frames).reindex(columns=desired_columns)
+
+
+def _sqlite_report(collected_data):
+    collected_data = collected_data.copy()
+    collected_data['StartTime'] = collected_data['StartTime'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    with closing(sqlite3.connect(':memory:')) as conn:
+        collected_data.to_sql('collected_data', conn, index=False)
+        return aggregate_connection(conn)
+
+
+def _streaming_report(frames):
+    aggregator = StreamingAggregator()
+    for df in frames:
+        aggregator.add_frame(df)
+    return aggregator.result()
+
+
+# Function to compare two reports value by value (categorical / string text columns compared as plain text)
+def assert_same_report(actual, expected):
+    actual = actual.reset_index(drop=True)
+    expected = expected.reset_index(drop=True)
+    for report in (actual, expected):
+        for column in report.columns:
+            if not pd.api.types.is_numeric_dtype(report[column]):
+                report[column] = report[column].astype(object).where(report[column].notna(), None)
+    pdt.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+def test_dataset_covers_the_edge_cases(frames):
+    collected_data = _collected_data(frames)
+    assert collected_data['Module'].nunique() >= 10
+    assert collected_data['PartName'].isna().any()
+    assert collected_data['FIDL'].isna().any()
+    assert (collected_data['FIDL'].isna() & collected_data['PartName'].notna()).any()
+    minutes = collected_data['StartTime'].dt.strftime('%H:%M')
+    assert (minutes == '23:59').any() and (minutes == '00:00').any()
+
+
+def test_memory_matches_sqlite(frames):
+    collected_data = _collected_data(frames)
+    expected = _sqlite_report(collected_data)
+    assert_same_report(aggregate_frame(collected_data), expected)
+
+
+def test_streaming_matches_sqlite(frames):
+    expected = _sqlite_report(_collected_data(frames))
+    assert_same_report(_streaming_report(frames), expected)
+
+
+def test_modules_sort_as_numbers(frames):
+    report = aggregate_frame(_collected_data(frames))
+    modules = report.loc[report['Line_name'] == 'Ligne1', 'Module'].drop_duplicates().tolist()
+    assert modules == sorted(modules) and max(modules) >= 10
+    assert pd.api.types.is_integer_dtype(pd.Series(modules))
+
+
+def test_split_frames_give_the_same_report(frames):
+    # Folding the frames row block by row block must not change the groups crossing them
+    pieces = [df.iloc[start:start + 500].reset_index(drop=True) for df in frames for start in range(0, len(df), 500)]
+    assert_same_report(_streaming_report(pieces), _streaming_report(frames))
+
+
+@pytest.mark.parametrize('pruning', [False, True])
+def test_pushdown_matches_sqlite(file_tasks, frames, monkeypatch, pruning):
+    # Two files per ATTACH batch: the six files take three batches whose partial aggregates are merged
+    monkeypatch.setattr(pushdown, '_attach_limit', lambda conn: 2)
+    done = []
+    report = aggregate_attached(file_tasks, START, END, pruning=pruning, on_file=lambda file_name, index, total: done.append(index))
+    assert done == list(range(1, len(file_tasks) + 1))
+    assert_same_report(report, _sqlite_report(_collected_data(frames)))
+
+
+@pytest.mark.parametrize('pruning', [False, True])
+def test_pushdown_skips_the_tables_outside_the_window(file_tasks, monkeypatch, pruning):
+    # The window ends on the second day, the tables of the third day hold no row of it. The rows appended at
+    # the day boundaries break the id order pruning relies on, so both sides prune the same way.
+    monkeypatch.setattr(pushdown, '_attach_limit', lambda conn: 4)
+    start_datetime, end_datetime = datetime(2024, 3, 1, 5, 30), datetime(2024, 3, 2, 17, 45)
+    expected = aggregate_frame(_collected_data(extract_files(file_tasks, start_datetime, end_datetime, pruning=pruning)))
+    report = aggregate_attached(file_tasks, start_datetime, end_datetime, pruning=pruning)
+    assert set(report['StartTime'].str[:10]) == {'2024-03-01', '2024-03-02'}
+    assert_same_report(report, expected)
+
+
+def test_pushdown_reports_unreadable_files(file_tasks, frames, monkeypatch, tmp_path):
+    monkeypatch.setattr(pushdown, '_attach_limit', lambda conn: 3)
+    broken_file = str(tmp_path / '20240302_Ligne1[COUNT].db')
+    with open(broken_file, 'wb') as broken:
+        broken.write(b'not a database' * 512)
+    failed = []
+    report = aggregate_attached(file_tasks[:2] + [('Ligne1', broken_file)] + file_tasks[2:], START, END, on_error=failed.append)
+    assert failed == [broken_file]
+    assert_same_report(report, _sqlite_report(_collected_data(frames)))
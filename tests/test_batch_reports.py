@@ -0,0 +1,85 @@
+import configparser
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import Function
+from aggregation import group_columns, sum_columns
+from batch_reports import ReportSpec, run_report_batch
+from extraction import concat_frames, extract_files
+from report_writers import write_report_file
+from synthetic_data import generate_dataset
+
+SPECS = [
+    ReportSpec('all', datetime(2024, 3, 1), datetime(2024, 3, 3, 23, 59), ['Ligne1', 'Ligne2']),
+    ReportSpec('ligne1', datetime(2024, 3, 1, 5, 30), datetime(2024, 3, 2, 17, 45), ['Ligne1']),
+    ReportSpec('ligne2 night', datetime(2024, 3, 2, 21, 0), datetime(2024, 3, 3, 7, 0), ['Ligne2']),
+    ReportSpec('hours', datetime(2024, 3, 2, 9, 10), datetime(2024, 3, 2, 15, 50), ['Ligne1', 'Ligne2'], 'hour'),
+    ReportSpec('shifts', datetime(2024, 3, 1, 4, 0), datetime(2024, 3, 3, 23, 0), ['Ligne1'], 'shift'),
+    ReportSpec('window', datetime(2024, 3, 1, 12, 0), datetime(2024, 3, 3, 12, 0), ['Ligne2'], 'window'),
+]
+
+
+@pytest.fixture(scope='module')
+def folders(tmp_path_factory):
+    return generate_dataset(str(tmp_path_factory.mktemp('batch')), lines=2, days=3, first_day='20240301', modules=4,
+                            feeders=3, rows_per_day=600)
+
+
+@pytest.fixture(scope='module')
+def reports(folders):
+    config = configparser.ConfigParser()
+    config.read_string('[Paths]\n' + ''.join(f'{line} = {folder}\n' for line, folder in folders.items()))
+    return run_report_batch(config, SPECS)
+
+
+# Function to read the rows of a spec the way a single report does
+def _spec_rows(folders, spec):
+    file_tasks = [(line, os.path.join(folders[line], file_name)) for line in spec.lines for file_name in sorted(os.listdir(folders[line]))]
+    return concat_frames(extract_files(file_tasks, spec.start_datetime, spec.end_datetime))
+
+
+# Function to compute the shift start of a moment with the default [Shifts] calendar (06:00, 14:00, 22:00)
+def _shift_start(moment):
+    for hour in (22, 14, 6):
+        if moment.hour >= hour:
+            return moment.replace(hour=hour, minute=0)
+    return (moment - timedelta(days=1)).replace(hour=22, minute=0)
+
+
+@pytest.mark.parametrize('spec', [spec for spec in SPECS if spec.grouping == 'day'], ids=lambda spec: spec.name)
+def test_day_spec_matches_a_single_report(folders, reports, spec, tmp_path, monkeypatch):
+    with open(tmp_path / 'config.ini', 'w') as config_file:
+        config_file.write('[Paths]\n' + ''.join(f'{line} = {folder}\n' for line, folder in folders.items()))
+        config_file.write(f'[Logging]\nfile = {tmp_path / "app.log"}\n')
+    monkeypatch.chdir(tmp_path)
+    single_file = Function.process_collected_data(spec.start_datetime.strftime('%Y%m%d'), spec.end_datetime.strftime('%Y%m%d'),
+                                                  spec.start_datetime.strftime('%H:%M'), spec.end_datetime.strftime('%H:%M'),
+                                                  spec.lines, on_error=print, output_file=str(tmp_path / 'single.csv'))
+    batch_file = write_report_file(reports[spec.name], str(tmp_path / 'batch.csv'))
+    with open(single_file, 'rb') as single, open(batch_file, 'rb') as batch:
+        assert batch.read() == single.read()
+
+
+@pytest.mark.parametrize('spec', [spec for spec in SPECS if spec.grouping != 'day'], ids=lambda spec: spec.name)
+def test_bucketed_spec_sums_the_rows_of_each_bucket(folders, reports, spec):
+    rows = _spec_rows(folders, spec)
+    report = reports[spec.name]
+    start_times = pd.to_datetime(report['StartTime'])
+    if spec.grouping == 'hour':
+        row_bucket, report_bucket = rows['StartTime'].dt.floor('h'), start_times.dt.floor('h')
+        assert (pd.to_datetime(report['EndTime']).dt.floor('h') == report_bucket).all()
+    elif spec.grouping == 'shift':
+        row_bucket, report_bucket = rows['StartTime'].map(_shift_start), start_times.map(_shift_start)
+    else:
+        row_bucket, report_bucket = pd.Series(0, index=rows.index), pd.Series(0, index=report.index)
+    expected = rows.groupby([rows[column].astype(object) for column in group_columns] + [row_bucket.rename('bucket')], dropna=False)[
+        [collected for _, collected in sum_columns]].sum()
+    expected.columns = [report_column for report_column, _ in sum_columns]
+    actual = report.groupby([report[column].astype(object) for column in group_columns] + [report_bucket.rename('bucket')], dropna=False)[
+        [report_column for report_column, _ in sum_columns]].sum()
+    # One report row per (group, bucket)
+    assert len(report) == len(expected)
+    pd.testing.assert_frame_equal(actual.sort_index(), expected.sort_index(), check_dtype=False)
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime
+
+import pandas.testing as pdt
+import pytest
+
+import extraction
+from extraction import concat_frames, extract_files
+from source_access import connect_source
+from synthetic_data import generate_dataset
+
+START = datetime(2024, 3, 1, 5, 30)
+END = datetime(2024, 3, 3, 17, 45)
+
+
+# Function to overwrite the pages of the Prod table of a file: its schema still lists the table,
+# so the file opens, but reading the table fails
+def corrupt_prod_table(file_name):
+    with closing(sqlite3.connect(file_name)) as db_conn:
+        page_size = db_conn.execute("PRAGMA page_size").fetchone()[0]
+        root_page = db_conn.execute("SELECT rootpage FROM sqlite_master WHERE name LIKE 'Prod_%' AND type = 'table'").fetchone()[0]
+    with open(file_name, 'r+b') as source:
+        source.seek((root_page - 1) * page_size)
+        source.write(b'\xff' * (os.path.getsize(file_name) - (root_page - 1) * page_size))
+
+
+@pytest.fixture(scope='module')
+def file_tasks(tmp_path_factory):
+    root = tmp_path_factory.mktemp('modes')
+    folders = generate_dataset(str(root), lines=2, days=3, first_day='20240301', modules=4, feeders=6, rows_per_day=1500)
+    file_tasks = [(line, os.path.join(folder, file_name)) for line, folder in folders.items() for file_name in sorted(os.listdir(folder))]
+    broken_file = os.path.join(folders['Ligne2'], '20240302_Ligne2[COUNT].1.db')
+    generate_dataset(str(root / 'broken'), lines=2, days=2, first_day='20240301', modules=2, feeders=2, rows_per_day=50)
+    os.replace(os.path.join(root, 'broken', 'Ligne2', '20240302_Ligne2[COUNT].db'), broken_file)
+    corrupt_prod_table(broken_file)
+    # The broken file sits between two readable ones
+    return file_tasks[:4] + [('Ligne2', broken_file)] + file_tasks[4:]
+
+
+# Function to extract the files, returns (frames, failed files, finished files)
+def _extract(file_tasks, **options):
+    failed = []
+    finished = []
+    frames = extract_files(file_tasks, START, END, on_error=failed.append,
+                           on_file=lambda file_name, done, total: finished.append((file_name, done, total)), **options)
+    return frames, failed, finished
+
+
+def assert_same_frames(actual, expected):
+    assert len(actual) == len(expected)
+    for actual_frame, expected_frame in zip(actual, expected):
+        pdt.assert_frame_equal(actual_frame, expected_frame)
+
+
+@pytest.fixture(scope='module')
+def serial(file_tasks):
+    return _extract(file_tasks)
+
+
+def test_serial_reports_the_unreadable_table(file_tasks, serial):
+    frames, failed, finished = serial
+    assert failed == [file_tasks[4][1]]
+    assert [done for _, done, _ in finished] == list(range(1, len(file_tasks) + 1))
+    assert len(frames) == len(file_tasks) - 1
+
+
+@pytest.mark.parametrize('pruning', [False, True])
+def test_pool_matches_serial(file_tasks, pruning):
+    frames, failed, finished = _extract(file_tasks, workers=2, pruning=pruning)
+    serial_frames = _extract(file_tasks, pruning=pruning)[0]
+    assert_same_frames(frames, serial_frames)
+    # The categories built in the workers union into the same collected rows
+    pdt.assert_frame_equal(concat_frames(frames), concat_frames(serial_frames))
+    # The failure happened inside a worker, it still reaches on_error in file order
+    assert failed == [file_tasks[4][1]]
+    assert finished == [(file_name, done, len(file_tasks)) for done, (_, file_name) in enumerate(file_tasks, start=1)]
+
+
+@pytest.mark.parametrize('read_threads, queue_depth', [(1, 1), (2, 1), (3, 4)])
+def test_pipelined_matches_serial(file_tasks, serial, read_threads, queue_depth):
+    frames, failed, finished = _extract(file_tasks, read_threads=read_threads, queue_depth=queue_depth)
+    assert_same_frames(frames, serial[0])
+    assert (failed, finished) == (serial[1], serial[2])
+
+
+def test_pipelined_reads_ahead_a_bounded_number_of_files(file_tasks, monkeypatch):
+    opened = []
+    handed = []
+    monkeypatch.setattr(extraction, 'connect_source', lambda file_name: opened.append(file_name) or connect_source(file_name))
+
+    def slow_frame(df):
+        # Files opened but not handed over yet: the ones in both queues, the one each stage holds
+        # and the one submitted while the feeder waits for room
+        assert len(opened) - len(handed) <= 2 * 2 + 3
+        time.sleep(0.01)
+
+    readable_tasks = [task for task in file_tasks if task != file_tasks[4]] * 3
+    extract_files(readable_tasks, START, END, on_frame=slow_frame, read_threads=3, queue_depth=2,
+                  on_file=lambda file_name, done, total: handed.append(file_name))
+    assert len(handed) == len(readable_tasks)
+
+
+def test_pipelined_stops_when_cancelled(file_tasks, serial):
+    threads = set(threading.enumerate())
+    handed = []
+    # Many files ahead: the readers are blocked on full queues when the run is cancelled
+    frames = extract_files(file_tasks * 4, START, END, read_threads=2, queue_depth=1, on_error=lambda file_name: None,
+                           cancelled=lambda: len(handed) >= 2, on_file=lambda file_name, done, total: handed.append(file_name))
+    assert set(threading.enumerate()) <= threads
+    assert len(handed) == 2
+    assert_same_frames(frames, serial[0][:2])
+
+
+@pytest.mark.parametrize('stage', ['parse', 'frame'])
+def test_pipelined_raises_the_error_of_a_stage(file_tasks, monkeypatch, stage):
+    threads = set(threading.enumerate())
+    calls = []
+
+    def fail_third(*args):
+        calls.append(args)
+        if len(calls) == 3:
+            raise ValueError(stage)
+        return parse_fetched(*args) if stage == 'parse' else None
+
+    parse_fetched = extraction._parse_fetched
+    if stage == 'parse':
+        # Raised in the parse thread, it must reach the calling thread
+        monkeypatch.setattr(extraction, '_parse_fetched', fail_third)
+        on_frame = None
+    else:
+        on_frame = fail_third
+    with pytest.raises(ValueError, match=stage):
+        extract_files(file_tasks * 4, START, END, read_threads=2, queue_depth=1, on_error=lambda file_name: None,
+                      on_frame=on_frame)
+    assert set(threading.enumerate()) <= threads
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import pytest
+
+import time_pruning
+from extraction import concat_frames, extract_files
+from parsed_cache import ParsedTableCache
+from synthetic_data import generate_day_file
+
+
+# Function to stamp the first rows of a file exactly at a minute, at the window end and just before it
+def _stamp_rows(file_name, moments):
+    with closing(sqlite3.connect(file_name)) as db_conn:
+        table_name = db_conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'Prod_%'").fetchone()[0]
+        for row_id, moment in enumerate(moments, start=1):
+            db_conn.execute(f"UPDATE {table_name} SET DateTime = ? WHERE id = ?", (moment, row_id))
+        db_conn.commit()
+
+
+# Function to extract the rows of a window as one frame (None when no row is found)
+def _extract(file_name, start, end, cache=None, pruning=False):
+    frames = extract_files([('Ligne1', file_name)], start, end, cache, pruning=pruning)
+    return concat_frames(frames) if frames else None
+
+
+@pytest.fixture
+def closed_file(tmp_path):
+    file_name = generate_day_file(str(tmp_path), 'Ligne1', datetime(2024, 3, 1), modules=2, feeders=3, rows_per_day=600)
+    # Ids increase with DateTime: the first rows are rewritten just after midnight
+    _stamp_rows(file_name, ['2024-03-01 00:00:59.999', '2024-03-01 00:01:00.000', '2024-03-01 00:01:00.000'])
+    return file_name
+
+
+def test_cached_window_keeps_the_exclusive_end(closed_file, tmp_path):
+    start, end = datetime(2024, 3, 1), datetime(2024, 3, 1, 0, 1)
+    cache = ParsedTableCache(str(tmp_path / 'cache'), 64 * 1024 * 1024)
+    direct = _extract(closed_file, start, end)
+    cached = _extract(closed_file, start, end, cache)
+    assert len(direct) == 1
+    assert cached['DateTime'].tolist() == direct['DateTime'].tolist()
+
+
+def test_open_files_are_read_by_id_range_and_not_cached(tmp_path):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    file_name = generate_day_file(str(tmp_path), 'Ligne1', today, modules=2, feeders=3, rows_per_day=600)
+    cache = ParsedTableCache(str(tmp_path / 'cache'), 64 * 1024 * 1024)
+    start, end = today + timedelta(hours=6), today + timedelta(hours=14)
+    cached = _extract(file_name, start, end, cache, pruning=True)
+    assert cached['DateTime'].tolist() == _extract(file_name, start, end)['DateTime'].tolist()
+    with closing(sqlite3.connect(cache.index_file)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0
+
+
+def test_closed_files_are_cached(closed_file, tmp_path):
+    cache = ParsedTableCache(str(tmp_path / 'cache'), 64 * 1024 * 1024)
+    _extract(closed_file, datetime(2024, 3, 1, 6), datetime(2024, 3, 1, 14), cache, pruning=True)
+    with closing(sqlite3.connect(cache.index_file)) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 1
+
+
+def test_recorded_ranges_keep_one_entry_per_table(closed_file):
+    before = len(time_pruning._recorded_ranges)
+    window = datetime(2024, 3, 1, 6), datetime(2024, 3, 1, 14)
+    for minute in range(5):
+        os.utime(closed_file, (0, 1000000 + minute))
+        _extract(closed_file, *window, pruning=True)
+    assert len(time_pruning._recorded_ranges) == before + 1
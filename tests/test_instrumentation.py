@@ -0,0 +1,40 @@
+import configparser
+import json
+import os
+
+from instrumentation import PipelineMetrics, default_log_file, read_log_settings
+
+
+def _metrics(tables):
+    metrics = PipelineMetrics()
+    with metrics.stage('query') as stage:
+        stage.add(rows=10)
+    for index in range(tables):
+        metrics.add_table('Ligne1', f'{index}.db', 'Prod_NXT1', 0.01, 10)
+    return metrics
+
+
+def test_log_settings_default_to_the_application_folder():
+    assert read_log_settings(configparser.ConfigParser()) == (default_log_file(), 5 * 1024 * 1024, 3)
+    config = configparser.ConfigParser()
+    config.read_string("[Logging]\nfile = logs/metrics.log\nmax_size_mb = 0.5\nbackups = 2\n")
+    log_file, max_bytes, backup_count = read_log_settings(config)
+    assert log_file == os.path.join(os.path.dirname(default_log_file()), 'logs', 'metrics.log')
+    assert (max_bytes, backup_count) == (512 * 1024, 2)
+
+
+def test_log_lines_are_json(tmp_path):
+    log_file = str(tmp_path / 'app.log')
+    _metrics(2).write_log(log_file, report='window', lines=['Ligne1'])
+    with open(log_file, encoding='utf-8') as log:
+        entries = [json.loads(line) for line in log]
+    assert [entry['event'] for entry in entries] == ['stage', 'table', 'table', 'run']
+    assert all(entry['report'] == 'window' and entry['lines'] == ['Ligne1'] for entry in entries)
+
+
+def test_log_is_rotated_at_its_size_cap(tmp_path):
+    log_file = str(tmp_path / 'app.log')
+    for _ in range(30):
+        _metrics(20).write_log(log_file, max_bytes=8 * 1024, backup_count=2, report='window')
+    assert sorted(os.listdir(tmp_path)) == ['app.log', 'app.log.1', 'app.log.2']
+    assert all(os.path.getsize(tmp_path / name) <= 8 * 1024 for name in os.listdir(tmp_path))
@@ -0,0 +1,52 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pytest
+
+from extraction import extract_files
+from live_tail import LiveTail
+from synthetic_data import generate_day_file
+from trends import TrendAggregator
+
+SHIFT_STARTS = [360, 840, 1320]
+WINDOWS = {'15 min': 15, '1 h': 60, 'Shift': None}
+
+
+@pytest.fixture
+def day_file(tmp_path):
+    return generate_day_file(str(tmp_path), 'Ligne1', datetime(2024, 3, 1), modules=2, feeders=3, rows_per_day=1200)
+
+
+def test_shift_window_matches_the_shift_trend(day_file, tmp_path):
+    live_tail = LiveTail({'Ligne1': str(tmp_path)}, WINDOWS, SHIFT_STARTS)
+    live_tail.poll(now=datetime(2024, 3, 1, 23, 59, 59))
+    live = {key: windows['Shift'].totals[0] for key, windows in live_tail.windows.items()}
+
+    aggregator = TrendAggregator('shift', SHIFT_STARTS)
+    for df in extract_files([('Ligne1', day_file)], datetime(2024, 3, 1), datetime(2024, 3, 2)):
+        aggregator.add_frame(df)
+    trends = aggregator.result()
+    last_shift = trends[trends['Bucket'] == '2024-03-01 22:00']
+    expected = last_shift.groupby(['Line_name', 'Module', 'FIDL'], observed=True)['PickupCount'].sum()
+    assert live == {(line, int(module), fidl): pickups for (line, module, fidl), pickups in expected.items()}
+
+
+def test_emptied_keys_are_dropped(day_file, tmp_path):
+    live_tail = LiveTail({'Ligne1': str(tmp_path)}, WINDOWS, SHIFT_STARTS)
+    now = datetime(2024, 3, 1, 23, 59, 59)
+    live_tail.poll(now=now)
+    assert len(live_tail.windows) > 1
+
+    # One feeder keeps producing in the next morning shift, every other key has left its windows
+    with closing(sqlite3.connect(day_file)) as db_conn:
+        table_name = db_conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'Prod_%'").fetchone()[0]
+        module, data = db_conn.execute(f"SELECT Module, Data FROM {table_name} ORDER BY id DESC LIMIT 1").fetchone()
+        db_conn.execute(f"INSERT INTO {table_name} (DateTime, Module, Lane, Msg, Data) VALUES (?, ?, 1, 'PDCOUNT2', ?)",
+                        ('2024-03-02 06:30:00.000', module, data))
+        db_conn.commit()
+    live_tail.poll(now=now)
+    key = ('Ligne1', module, data.split('\t')[18])
+    assert list(live_tail.windows) == [key]
+    # The new shift only holds the new row
+    assert live_tail.windows[key]['Shift'].totals[0] == int(data.split('\t')[8])
@@ -0,0 +1,127 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from extraction import concat_frames, extract_files
+from parsed_cache import FRAME_LAYOUT_VERSION, ParsedTableCache
+from source_access import connect_source
+from synthetic_data import generate_day_file
+
+START = datetime(2024, 3, 1)
+END = datetime(2024, 3, 2)
+
+
+@pytest.fixture
+def closed_file(tmp_path):
+    return generate_day_file(str(tmp_path), 'Ligne1', datetime(2024, 3, 1), modules=2, feeders=3, rows_per_day=600)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ParsedTableCache(str(tmp_path / 'cache'), 64 * 1024 * 1024)
+
+
+def _table_name(file_name):
+    with closing(sqlite3.connect(file_name)) as db_conn:
+        return db_conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'Prod_%' AND type = 'table'").fetchone()[0]
+
+
+def _entries(cache):
+    with closing(sqlite3.connect(cache.index_file)) as conn:
+        return conn.execute("SELECT path, table_name, size, mtime, last_id FROM entries").fetchall()
+
+
+def _entries_bytes(cache):
+    with closing(sqlite3.connect(cache.index_file)) as conn:
+        return conn.execute("SELECT SUM(nbytes) FROM entries").fetchone()[0]
+
+
+def _extract(file_name, cache=None, pruning=False):
+    return concat_frames(extract_files([('Ligne1', file_name)], START, END, cache, pruning=pruning))
+
+
+def test_key_is_size_mtime_and_last_id(closed_file, cache):
+    table_name = _table_name(closed_file)
+    with closing(connect_source(closed_file)) as db_conn:
+        key = cache.source_key(closed_file, db_conn, table_name)
+        last_id = db_conn.execute(f"SELECT MAX(id) FROM {table_name}").fetchone()[0]
+    assert key == (os.path.getsize(closed_file), os.path.getmtime(closed_file), last_id)
+    frame = pd.DataFrame({'Module': [1, 2]})
+    cache.put(closed_file, table_name, key, frame)
+    pdt.assert_frame_equal(cache.get(closed_file, table_name, key), frame)
+    # Any part of the key that changes makes the entry stale
+    for stale_key in [(key[0] + 1, key[1], key[2]), (key[0], key[1] + 1, key[2]), (key[0], key[1], key[2] + 1)]:
+        assert cache.get(closed_file, table_name, stale_key) is None
+    assert cache.get(closed_file, 'Prod_NXTOTHER', key) is None
+
+
+def test_closed_file_is_read_from_the_cache(closed_file, cache):
+    direct = _extract(closed_file)
+    pdt.assert_frame_equal(_extract(closed_file, cache), direct)
+    assert [entry[:2] for entry in _entries(cache)] == [(os.path.abspath(closed_file), _table_name(closed_file))]
+    # The second read comes from the cache: a payload rewritten in place under the same key is not seen
+    stat = os.stat(closed_file)
+    with closing(sqlite3.connect(closed_file)) as db_conn:
+        db_conn.execute(f"UPDATE {_table_name(closed_file)} SET Data = 'changed' WHERE id = 1")
+        db_conn.commit()
+    os.utime(closed_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    pdt.assert_frame_equal(_extract(closed_file, cache), direct)
+
+
+def test_appended_row_invalidates_the_entry(closed_file, cache):
+    table_name = _table_name(closed_file)
+    before = _extract(closed_file, cache)
+    stat = os.stat(closed_file)
+    with closing(sqlite3.connect(closed_file)) as db_conn:
+        db_conn.execute(f"INSERT INTO {table_name} (DateTime, Module, Lane, Msg, Data) "
+                        f"SELECT '2024-03-01 23:59:59.500', Module, Lane, Msg, Data FROM {table_name} ORDER BY id DESC LIMIT 1")
+        db_conn.commit()
+    # Only the last id tells the new row apart: the file keeps its size and mtime
+    os.utime(closed_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.path.getsize(closed_file) == stat.st_size
+    after = _extract(closed_file, cache)
+    assert len(after) == len(before) + 1
+    pdt.assert_frame_equal(after, _extract(closed_file))
+    with closing(sqlite3.connect(closed_file)) as db_conn:
+        assert _entries(cache)[0][4] == db_conn.execute(f"SELECT MAX(id) FROM {table_name}").fetchone()[0]
+
+
+@pytest.mark.parametrize('pruning', [False, True])
+def test_open_file_bypasses_the_cache(tmp_path, cache, pruning):
+    # Today's file is still being written
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    open_file = generate_day_file(str(tmp_path), 'Ligne1', today, modules=2, feeders=3, rows_per_day=300)
+    frames = extract_files([('Ligne1', open_file)], today, today + timedelta(days=1), cache, pruning=pruning)
+    direct = extract_files([('Ligne1', open_file)], today, today + timedelta(days=1), pruning=pruning)
+    pdt.assert_frame_equal(concat_frames(frames), concat_frames(direct))
+    assert _entries(cache) == []
+
+
+def test_least_recently_used_entries_are_evicted(closed_file, tmp_path):
+    frame = pd.DataFrame({'Data': ['x' * 200] * 50})
+    probe = ParsedTableCache(str(tmp_path / 'probe'), 64 * 1024 * 1024)
+    probe.put(closed_file, 'Prod_NXT0', (1, 1.0, 1), frame)
+    entry_bytes = _entries_bytes(probe)
+    cache = ParsedTableCache(str(tmp_path / 'cache'), int(entry_bytes * 2.5))
+    for table_name in ['Prod_NXT0', 'Prod_NXT1']:
+        cache.put(closed_file, table_name, (1, 1.0, 1), frame)
+    # Using the first entry makes the second the least recently used one
+    assert cache.get(closed_file, 'Prod_NXT0', (1, 1.0, 1)) is not None
+    cache.put(closed_file, 'Prod_NXT2', (1, 1.0, 1), frame)
+    assert sorted(entry[1] for entry in _entries(cache)) == ['Prod_NXT0', 'Prod_NXT2']
+    assert len([name for name in os.listdir(cache.cache_dir) if name.endswith('.pkl')]) == 2
+
+
+def test_other_layout_is_dropped(closed_file, cache):
+    _extract(closed_file, cache)
+    with closing(sqlite3.connect(cache.index_file)) as conn:
+        conn.execute(f"PRAGMA user_version = {FRAME_LAYOUT_VERSION - 1}")
+        conn.commit()
+    cache = ParsedTableCache(cache.cache_dir, cache.max_size_bytes)
+    assert _entries(cache) == []
+    assert [name for name in os.listdir(cache.cache_dir) if name.endswith('.pkl')] == []
@@ -0,0 +1,72 @@
+import os
+from datetime import datetime
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from aggregation import group_columns
+from part_usage import (part_usage_window, read_part_usage_preamble, read_part_usage_report, reconcile_report,
+                        reconciled_columns)
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'PUS20220725060000000.CSV')
+
+# Export columns of the reconciled measures, in the order of reconciled_columns
+EXPORT_MEASURES = ['PickupCount', 'TotalPartsUsed', 'RejectParts', 'PickupMiss', 'ErrorParts', 'DislodgedParts']
+
+
+@pytest.fixture(scope='module')
+def export_rows():
+    _, preamble_rows = read_part_usage_preamble(SAMPLE_FILE)
+    return pd.read_csv(SAMPLE_FILE, skiprows=preamble_rows, dtype=str, keep_default_na=False)
+
+
+@pytest.fixture(scope='module')
+def report():
+    return read_part_usage_report(SAMPLE_FILE, 'Ligne1')
+
+
+def test_sample_preamble_and_window():
+    info, preamble_rows = read_part_usage_preamble(SAMPLE_FILE)
+    assert preamble_rows == 4
+    assert info['Title'] == 'Part usage'
+    assert part_usage_window(info) == (datetime(2022, 7, 25, 6), datetime(2022, 8, 1, 6))
+
+
+def test_report_does_not_depend_on_the_chunk_size(report):
+    pdt.assert_frame_equal(read_part_usage_report(SAMPLE_FILE, 'Ligne1', chunk_rows=1000), report)
+
+
+def test_sample_matches_its_own_report(export_rows, report):
+    result = reconcile_report(report, SAMPLE_FILE, 'Ligne1', chunk_rows=1000)
+    # One row per (machine, recipe, FIDL, part) of the export, all of them matching
+    keys = export_rows.groupby(['MachineName', 'RecipeName', 'FIDL', 'PartNumber']).ngroups
+    assert len(result) == keys
+    assert result['Status'].value_counts().to_dict() == {'match': keys}
+    for report_column, export_column in zip(reconciled_columns, EXPORT_MEASURES):
+        assert result[f'{report_column}_csv'].sum() == export_rows[export_column].astype(int).sum()
+        assert (result[f'{report_column}_delta'] == 0).all()
+
+
+def test_reconcile_counts_each_status(report):
+    row_keys = list(report[group_columns].itertuples(index=False, name=None))
+    keys = list(dict.fromkeys(row_keys))
+    missing = set(keys[:10])
+    pickups = report.groupby(group_columns, observed=True)['PickupCount'].sum()
+    deviating = [key for key in keys[10:] if pickups[key] > 100][:5]
+    changed = report[[key not in missing for key in row_keys]].copy()
+    # One more pickup on the first row of each deviating key
+    for key in deviating:
+        changed.loc[row_keys.index(key), 'PickupCount'] += 1
+    extra = changed.iloc[:1].copy()
+    extra['Recipe_name'] = 'RECIPE_ONLY_IN_DB'
+    changed = pd.concat([changed, extra], ignore_index=True)
+
+    result = reconcile_report(changed, SAMPLE_FILE, 'Ligne1')
+    assert result['Status'].value_counts().to_dict() == {'match': len(keys) - 15, 'csv only': 10, 'deviation': 5, 'db only': 1}
+    deviations = result[result['Status'] == 'deviation']
+    assert (deviations['PickupCount_delta'] == -1).all()
+    assert sorted(deviations[group_columns].itertuples(index=False, name=None)) == sorted(deviating)
+    # A relative tolerance above one pickup in a hundred turns the deviations back into matches
+    tolerant = reconcile_report(changed, SAMPLE_FILE, 'Ligne1', tolerance=0.01)
+    assert tolerant['Status'].value_counts().to_dict() == {'match': len(keys) - 10, 'csv only': 10, 'db only': 1}
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from extraction import _split_table_frame, int_columns, parse_data_payload, parse_table_frame, payload_columns, split_columns
+
+
+# Function to build one payload of the layout, with some fields replaced
+def _payload(**fields):
+    values = {column: '0' for column in split_columns}
+    values.update({'Recipe_name': 'RECIPE_A', 'PartName': 'PART001', 'FIDL': 'KT123 456789', 'Parts_pickup_count': '12'})
+    values.update(fields)
+    return '\t'.join(str(values[column]) for column in split_columns)
+
+
+def test_counters_are_decoded_as_int64():
+    columns = parse_data_payload([_payload(Parts_pickup_count=3000000000), _payload(Used_parts_count=123456789012345678)])
+    for column in int_columns:
+        assert columns[column].dtype == np.int64
+    assert columns['Parts_pickup_count'].tolist() == [3000000000, 12]
+    assert columns['Used_parts_count'].tolist() == [0, 123456789012345678]
+
+
+def test_text_fields_keep_their_bytes():
+    columns = parse_data_payload([_payload(PartName='PIÈCE-é', FIDL=''), _payload(PartName='P' * 100), _payload()])
+    assert columns['PartName'].tolist() == ['PIÈCE-é', 'P' * 100, 'PART001']
+    assert columns['FIDL'].tolist() == ['', 'KT123 456789', 'KT123 456789']
+    assert set(columns) == set(payload_columns)
+
+
+def test_payloads_off_the_layout_are_left_to_the_generic_split():
+    short = '\t'.join(_payload().split('\t')[:18])
+    long = _payload() + '\t0'
+    assert parse_data_payload([_payload(), short]) is None
+    # One field too many and one too few balance the separator count, the row breaks do not line up
+    assert parse_data_payload([long, _payload()[:-2]]) is None
+    assert parse_data_payload([_payload(), None]) is None
+    assert parse_data_payload([_payload(PartName='a\nb')]) is None
+
+
+def test_signed_and_padded_integers_decode_like_astype_int():
+    columns = parse_data_payload([_payload(Error_parts_count='-3', Position_no=' 7')])
+    assert columns['Error_parts_count'].tolist() == [-3]
+    assert columns['Position_no'].tolist() == [7]
+
+
+def test_projected_parser_matches_the_generic_split():
+    payloads = [_payload(Position_no=slot, Parts_pickup_count=slot * 70000, PartName=f'PART{slot % 7}') for slot in range(200)]
+    df = pd.DataFrame({'DateTime': ['2024-03-01 10:00:00.000'] * len(payloads), 'Module': 3, 'Data': payloads})
+    projected = parse_table_frame(df.copy())
+    generic = _split_table_frame(df.copy())
+    for column in payload_columns:
+        assert projected[column].tolist() == generic[column].tolist(), column
@@ -0,0 +1,57 @@
+import os
+
+import pandas as pd
+import pytest
+
+import Function
+from synthetic_data import generate_dataset
+
+
+@pytest.fixture(scope='module')
+def folders(tmp_path_factory):
+    return generate_dataset(str(tmp_path_factory.mktemp('hooks')), lines=2, days=2, first_day='20240301', modules=4,
+                            feeders=4, rows_per_day=800)
+
+
+# Function to run a report from a folder holding its config.ini, returns (report path, partial reports, final report)
+def _run(folders, folder, monkeypatch, aggregation='memory', cancel_after=None, **hooks):
+    with open(folder / 'config.ini', 'w') as config_file:
+        config_file.write('[Paths]\n' + ''.join(f'{line} = {path}\n' for line, path in folders.items()))
+        config_file.write(f'[Processing]\naggregation = {aggregation}\n[Logging]\nfile = {folder / "app.log"}\n')
+    monkeypatch.chdir(folder)
+    partials = []
+    reports = []
+    files_done = []
+
+    def on_progress(stage, details):
+        if stage == 'file':
+            files_done.append(details['file'])
+
+    cancelled = None if cancel_after is None else (lambda: len(files_done) >= cancel_after)
+    output_file = Function.process_collected_data('20240301', '20240302', '00:00', '23:59', list(folders), on_error=print,
+                                                  output_file=str(folder / 'report.csv'), on_progress=on_progress,
+                                                  on_partial=partials.append, cancelled=cancelled,
+                                                  on_report=lambda report, rows: reports.append(report), **hooks)
+    return output_file, partials, reports
+
+
+@pytest.mark.parametrize('aggregation', ['memory', 'sqlite', 'streaming', 'pushdown'])
+def test_partial_reports_do_not_change_the_report(folders, tmp_path, monkeypatch, aggregation):
+    (tmp_path / 'quiet').mkdir()
+    (tmp_path / 'partial').mkdir()
+    expected, partials, _ = _run(folders, tmp_path / 'quiet', monkeypatch, aggregation)
+    assert partials == []
+    monkeypatch.setattr(Function, 'PARTIAL_INTERVAL_SECONDS', 0)
+    output_file, partials, reports = _run(folders, tmp_path / 'partial', monkeypatch, aggregation)
+    assert len(partials) == 4
+    assert len(partials[0]) <= len(partials[-1])
+    assert len(reports) == 1
+    pd.testing.assert_frame_equal(partials[-1].reset_index(drop=True), reports[0].reset_index(drop=True))
+    pd.testing.assert_frame_equal(pd.read_csv(output_file), pd.read_csv(expected))
+
+
+def test_cancelled_run_writes_no_report(folders, tmp_path, monkeypatch):
+    output_file, _, reports = _run(folders, tmp_path, monkeypatch, cancel_after=1)
+    assert output_file is None and reports == []
+    assert not os.path.exists(tmp_path / 'report.csv')
+    assert '"cancelled": true' in (tmp_path / 'app.log').read_text()
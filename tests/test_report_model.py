@@ -0,0 +1,104 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+from PyQt5.QtCore import Qt
+
+from aggregation import aggregate_frame, sum_columns
+from extraction import concat_frames, extract_files
+from report_model import FrameTableModel, drilldown_mask
+from synthetic_data import generate_dataset
+from test_aggregation_parity import _append_rows, desired_columns
+
+START = datetime(2024, 3, 1)
+END = datetime(2024, 3, 2, 23, 59)
+
+
+@pytest.fixture(scope='module')
+def collected_data(tmp_path_factory):
+    folders = generate_dataset(str(tmp_path_factory.mktemp('model')), lines=2, days=2, first_day='20240301', modules=3,
+                               feeders=4, rows_per_day=300)
+    file_tasks = [(line, os.path.join(folder, file_name)) for line, folder in folders.items() for file_name in sorted(os.listdir(folder))]
+    # Rows with a NULL PartName / FIDL
+    _append_rows(file_tasks[0][1], ['2024-03-01 12:00:00.000'])
+    return concat_frames(extract_files(file_tasks, START, END)).reindex(columns=desired_columns)
+
+
+@pytest.fixture(scope='module')
+def report(collected_data):
+    return aggregate_frame(collected_data)
+
+
+# Function to read the rows shown by a model, as the displayed texts
+def _shown(model):
+    return [tuple(model.data(model.index(row, column)) for column in range(model.columnCount()))
+            for row in range(model.rowCount())]
+
+
+# Function to build the displayed texts of frame rows, one cell at a time through an unfiltered model
+def _texts(frame, positions):
+    model = FrameTableModel(frame)
+    return [tuple(model.data(model.index(position, column)) for column in range(model.columnCount())) for position in positions]
+
+
+def test_model_shows_every_row(report):
+    model = FrameTableModel(report)
+    assert (model.rowCount(), model.columnCount()) == report.shape
+    assert [model.headerData(column, Qt.Horizontal) for column in range(model.columnCount())] == list(report.columns)
+    assert model.data(model.index(0, report.columns.get_loc('RejectRate'))) == f"{report['RejectRate'].iloc[0]:.2f}"
+    assert _shown(FrameTableModel(None)) == []
+
+
+def test_text_filter_matches_the_displayed_texts(report):
+    model = FrameTableModel(report)
+    texts = _texts(report, range(len(report)))
+    fidl = report['FIDL'].astype(str).iloc[0].split()[0].lower()
+    model.set_text_filter(fidl)
+    assert _shown(model) == [row for row in texts if any(fidl in cell.lower() for cell in row)]
+    # In one column only: 'ligne1' is found in Line_name but not in PartName
+    model.set_text_filter(' LIGNE1 ', report.columns.get_loc('Line_name'))
+    assert model.rowCount() == (report['Line_name'] == 'Ligne1').sum()
+    model.set_text_filter('ligne1', report.columns.get_loc('PartName'))
+    assert model.rowCount() == 0
+    model.set_text_filter('')
+    assert model.rowCount() == len(report)
+
+
+def test_sort_and_filters_match_pandas(collected_data):
+    model = FrameTableModel(collected_data)
+    part_column = collected_data.columns.get_loc('PartName')
+    model.sort(part_column, Qt.DescendingOrder)
+    # Stable sort with NULL first, reversed as a whole for a descending order
+    ascending = collected_data['PartName'].astype(object).fillna('').sort_values(kind='stable').index
+    assert _shown(model) == _texts(collected_data, ascending[::-1])
+    assert model.data(model.index(model.rowCount() - 1, part_column)) == ''
+
+    model.sort(collected_data.columns.get_loc('Parts_pickup_count'), Qt.AscendingOrder)
+    row_mask = (collected_data['Module'] == 2).to_numpy()
+    model.set_row_filter(row_mask)
+    model.set_text_filter('ligne2')
+    expected = collected_data['Parts_pickup_count'].sort_values(kind='stable').index
+    expected = [position for position in expected if row_mask[position] and collected_data['Line_name'].iloc[position] == 'Ligne2']
+    assert _shown(model) == _texts(collected_data, expected)
+    assert model.row(0).equals(collected_data.iloc[expected[0]])
+    model.set_row_filter(None)
+    assert model.rowCount() == (collected_data['Line_name'] == 'Ligne2').sum()
+
+
+@pytest.mark.parametrize('start_time', ['datetime', 'text'])
+def test_drilldown_selects_the_rows_of_a_report_row(collected_data, report, start_time):
+    rows = collected_data
+    if start_time == 'text':
+        # The sqlite path keeps StartTime as text
+        rows = collected_data.assign(StartTime=collected_data['StartTime'].dt.strftime('%Y-%m-%d %H:%M:%S'))
+    selected = np.zeros(len(rows), dtype=int)
+    for _, report_row in report.iterrows():
+        mask = drilldown_mask(rows, report_row)
+        assert mask.any()
+        selected += mask
+        for report_column, collected_column in sum_columns:
+            assert rows.loc[mask, collected_column].sum() == report_row[report_column]
+    # Each extracted row belongs to exactly one report row, the NULL PartName rows included
+    assert (selected == 1).all()
+    assert report['PartName'].isna().any()
@@ -0,0 +1,122 @@
+import gzip
+import os
+import re
+import zipfile
+from datetime import datetime
+from xml.etree import ElementTree
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from aggregation import aggregate_frame
+from extraction import concat_frames, extract_files
+from report_writers import (TEMPLATE_COLUMNS, TEMPLATE_SHEET, TEMPLATE_TABLE, open_report_writer, report_file_name,
+                            write_report_file)
+from synthetic_data import generate_dataset
+from test_aggregation_parity import desired_columns
+
+SHEET_NAMESPACE = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+@pytest.fixture(scope='module')
+def report(tmp_path_factory):
+    folders = generate_dataset(str(tmp_path_factory.mktemp('writers')), lines=2, days=2, first_day='20240301', modules=2,
+                               feeders=3, rows_per_day=200)
+    file_tasks = [(line, os.path.join(folder, file_name)) for line, folder in folders.items() for file_name in sorted(os.listdir(folder))]
+    collected_data = concat_frames(extract_files(file_tasks, datetime(2024, 3, 1), datetime(2024, 3, 2, 23, 59)))
+    return aggregate_frame(collected_data.reindex(columns=desired_columns))
+
+
+# Function to write a report in two chunks, as the exports do
+def _write_chunks(report, path, output_format):
+    writer = open_report_writer(path, output_format)
+    try:
+        writer.write(report.iloc[:len(report) // 2])
+        writer.write(report.iloc[len(report) // 2:])
+    finally:
+        writer.close()
+    return path
+
+
+# Function to compare a reloaded text report with the written one, the categories coming back as plain strings
+def _assert_same_values(reloaded, report):
+    expected = report.astype({column: object for column in report.columns if isinstance(report[column].dtype, pd.CategoricalDtype)})
+    pdt.assert_frame_equal(reloaded, expected.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'csv.gz'])
+def test_csv_round_trip(report, tmp_path, output_format):
+    path = _write_chunks(report, str(tmp_path / report_file_name('20240301', '20240302', ['Ligne1', 'Ligne2'], output_format)),
+                         output_format)
+    assert path.endswith('.csv.gz' if output_format == 'csv.gz' else '.csv')
+    if output_format == 'csv.gz':
+        with gzip.open(path, 'rt', encoding='utf-8') as source:
+            assert source.readline().rstrip('\n') == ','.join(report.columns)
+    # One header, then the rows of both chunks
+    _assert_same_values(pd.read_csv(path, dtype={'StartTime': str, 'EndTime': str}), report)
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'arrow'])
+def test_columnar_round_trip_keeps_the_dtypes(report, tmp_path, output_format):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    ipc = pytest.importorskip('pyarrow.ipc')
+    path = _write_chunks(report, str(tmp_path / f'report.{output_format}'), output_format)
+    if output_format == 'parquet':
+        assert parquet.ParquetFile(path).num_row_groups == 2
+        table = parquet.read_table(path)
+    else:
+        with ipc.open_file(path) as source:
+            table = source.read_all()
+    pdt.assert_frame_equal(table.to_pandas(), report.reset_index(drop=True))
+
+
+def test_columnar_writer_without_rows_leaves_a_readable_file(tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    writer = open_report_writer(str(tmp_path / 'empty.parquet'), 'parquet')
+    writer.close()
+    assert parquet.read_table(writer.path).num_rows == 0
+
+
+# Function to read back the rows below the header of the template sheet, as text keyed by column letter
+def _sheet_rows(path):
+    with zipfile.ZipFile(path) as archive:
+        sheet = ElementTree.fromstring(archive.read(TEMPLATE_SHEET))
+        table = archive.read(TEMPLATE_TABLE).decode('utf-8')
+    rows = []
+    for row in sheet.iterfind('x:sheetData/x:row', SHEET_NAMESPACE):
+        if row.get('r') == '1':
+            continue
+        cells = {}
+        for cell in row.iterfind('x:c', SHEET_NAMESPACE):
+            letter = re.match(r'[A-Z]+', cell.get('r')).group(0)
+            if cell.get('t') == 'inlineStr':
+                cells[letter] = cell.find('x:is/x:t', SHEET_NAMESPACE).text
+            else:
+                cells[letter] = cell.find('x:v', SHEET_NAMESPACE).text
+        rows.append(cells)
+    return rows, table
+
+
+def test_xlsx_round_trip(report, tmp_path):
+    report = report.astype({'PartName': object})
+    # Markup characters in a text cell are escaped, a missing value leaves its cell out
+    report.loc[0, 'PartName'] = 'PART <A&B>'
+    report.loc[1, 'PartName'] = None
+    path = _write_chunks(report, str(tmp_path / 'report.xlsx'), 'xlsx')
+    rows, table = _sheet_rows(path)
+    assert len(rows) == len(report)
+    assert re.findall(r'ref="([^"]*)"', table) == [f'A1:N{len(report) + 1}'] * 2
+    letters = 'ABCDEFGHIJKLMN'
+    for position, (_, value) in enumerate(TEMPLATE_COLUMNS):
+        column = value(report)
+        expected = [column] * len(report) if isinstance(column, str) else [None if item is None else str(item) for item in column]
+        assert [row.get(letters[position]) for row in rows] == expected
+    assert rows[0]['D'] == 'PART <A&B>' and 'D' not in rows[1]
+
+
+def test_xlsx_without_rows_keeps_a_valid_table(report, tmp_path):
+    path = write_report_file(report.iloc[:0], str(tmp_path / 'empty.xlsx'), 'xlsx')
+    rows, table = _sheet_rows(path)
+    assert rows == []
+    assert 'ref="A1:N2"' in table
@@ -0,0 +1,128 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from result_cache import ResultCache, fingerprint_files
+from synthetic_data import generate_dataset
+
+START = datetime(2024, 3, 1)
+END = datetime(2024, 3, 2, 23, 59)
+
+
+@pytest.fixture
+def file_tasks(tmp_path):
+    folders = generate_dataset(str(tmp_path / 'sources'), lines=2, days=2, first_day='20240301', modules=2, feeders=2,
+                               rows_per_day=50)
+    return [(line, os.path.join(folder, file_name)) for line, folder in folders.items() for file_name in sorted(os.listdir(folder))]
+
+
+# Function to open a cache whose memory tier holds no entry, so every lookup goes through the disk tier
+def _disk_cache(tmp_path, max_size_bytes=1024 * 1024):
+    return ResultCache(str(tmp_path / 'cache'), max_size_bytes, memory_entries=0)
+
+
+def _report(rows=3):
+    return pd.DataFrame({'Line_name': ['Ligne1'] * rows, 'Module': range(rows), 'PickupCount': range(100, 100 + rows)})
+
+
+# Function to append a copy of the last row of each Prod table of a source file
+def _append_row(file_name):
+    with closing(sqlite3.connect(file_name)) as db_conn:
+        for (table_name,) in db_conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'Prod_%'").fetchall():
+            db_conn.execute(f"INSERT INTO {table_name} (DateTime, Module, Lane, Msg, Data) "
+                            f"SELECT DateTime, Module, Lane, Msg, Data FROM {table_name} ORDER BY id DESC LIMIT 1")
+        db_conn.commit()
+
+
+def test_identical_request_is_a_hit(file_tasks, tmp_path):
+    cache = _disk_cache(tmp_path)
+    key = cache.request_key(['Ligne1', 'Ligne2'], START, END)
+    assert cache.get(key, fingerprint_files(file_tasks)) is None
+    cache.put(key, fingerprint_files(file_tasks), _report())
+    pdt.assert_frame_equal(cache.get(key, fingerprint_files(file_tasks)), _report())
+    # Another grouping or window is another request
+    assert cache.get(cache.request_key(['Ligne1', 'Ligne2'], START, END, 'hour'), fingerprint_files(file_tasks)) is None
+    assert cache.get(cache.request_key(['Ligne1', 'Ligne2'], START, datetime(2024, 3, 2)), fingerprint_files(file_tasks)) is None
+
+
+def test_memory_tier_answers_without_the_disk(file_tasks, tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), 1024 * 1024, memory_entries=2)
+    key = cache.request_key(['Ligne1'], START, END)
+    cache.put(key, fingerprint_files(file_tasks), _report())
+    for file_name in os.listdir(cache.cache_dir):
+        if file_name.endswith('.pkl'):
+            os.remove(os.path.join(cache.cache_dir, file_name))
+    pdt.assert_frame_equal(cache.get(key, fingerprint_files(file_tasks)), _report())
+
+
+@pytest.mark.parametrize('memory_entries', [0, 8])
+def test_appended_row_is_a_miss(file_tasks, tmp_path, memory_entries):
+    cache = ResultCache(str(tmp_path / 'cache'), 1024 * 1024, memory_entries)
+    key = cache.request_key(['Ligne1', 'Ligne2'], START, END)
+    cache.put(key, fingerprint_files(file_tasks), _report())
+    before = fingerprint_files(file_tasks)
+    _append_row(file_tasks[0][1])
+    after = fingerprint_files(file_tasks)
+    assert before[os.path.abspath(file_tasks[0][1])][2] < after[os.path.abspath(file_tasks[0][1])][2]
+    assert cache.get(key, after) is None
+    # The stale entry is gone, even for a lookup with the old fingerprints
+    assert cache.get(key, before) is None
+
+
+def test_entry_of_other_files_survives_a_change(file_tasks, tmp_path):
+    cache = _disk_cache(tmp_path)
+    line1_tasks = [task for task in file_tasks if task[0] == 'Ligne1']
+    line2_tasks = [task for task in file_tasks if task[0] == 'Ligne2']
+    line1_key = cache.request_key(['Ligne1'], START, END)
+    line2_key = cache.request_key(['Ligne2'], START, END)
+    cache.put(line1_key, fingerprint_files(line1_tasks), _report(2))
+    cache.put(line2_key, fingerprint_files(line2_tasks), _report(4))
+    _append_row(line1_tasks[-1][1])
+    # A lookup that sees the changed file drops the Ligne1 entry, and only that one
+    assert cache.get(line1_key, fingerprint_files(line1_tasks)) is None
+    pdt.assert_frame_equal(cache.get(line2_key, fingerprint_files(line2_tasks)), _report(4))
+    cache.invalidate_file(line2_tasks[0][1])
+    assert cache.get(line2_key, fingerprint_files(line2_tasks)) is None
+
+
+def test_file_joining_the_window_is_a_miss(file_tasks, tmp_path):
+    cache = _disk_cache(tmp_path)
+    key = cache.request_key(['Ligne1', 'Ligne2'], START, END)
+    cache.put(key, fingerprint_files(file_tasks[:-1]), _report())
+    assert cache.get(key, fingerprint_files(file_tasks)) is None
+    cache.put(key, fingerprint_files(file_tasks), _report())
+    assert cache.get(key, fingerprint_files(file_tasks[:-1])) is None
+
+
+def test_least_recently_used_entries_are_evicted(file_tasks, tmp_path):
+    fingerprints = fingerprint_files(file_tasks)
+    cache = _disk_cache(tmp_path)
+    keys = [cache.request_key(['Ligne1'], START, datetime(2024, 3, 2, hour)) for hour in range(3)]
+    cache.put(keys[0], fingerprints, _report())
+    entry_bytes = sum(os.path.getsize(os.path.join(cache.cache_dir, name)) for name in os.listdir(cache.cache_dir)
+                      if name.endswith('.pkl'))
+    # Room for two entries: using the first one makes the second the least recently used
+    cache = _disk_cache(tmp_path, int(entry_bytes * 2.5))
+    cache.put(keys[1], fingerprints, _report())
+    assert cache.get(keys[0], fingerprints) is not None
+    cache.put(keys[2], fingerprints, _report())
+    assert cache.get(keys[1], fingerprints) is None
+    assert cache.get(keys[0], fingerprints) is not None and cache.get(keys[2], fingerprints) is not None
+    assert len([name for name in os.listdir(cache.cache_dir) if name.endswith('.pkl')]) == 2
+
+
+def test_other_layout_is_dropped(file_tasks, tmp_path):
+    cache = _disk_cache(tmp_path)
+    key = cache.request_key(['Ligne1'], START, END)
+    cache.put(key, fingerprint_files(file_tasks), _report())
+    with closing(sqlite3.connect(cache.index_file)) as conn:
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+    cache = _disk_cache(tmp_path)
+    assert cache.get(key, fingerprint_files(file_tasks)) is None
+    assert [name for name in os.listdir(cache.cache_dir) if name.endswith('.pkl')] == []
@@ -0,0 +1,43 @@
+import configparser
+import os
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from source_catalog import SourceCatalog, plan_file_tasks
+from synthetic_data import generate_dataset
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    return generate_dataset(str(tmp_path / 'lines'), lines=1, days=4, first_day='20240301', modules=2, feeders=2, rows_per_day=200)
+
+
+# Function to read the date of a source file from its name
+def _file_date(path):
+    return os.path.basename(path)[:8]
+
+
+def test_refresh_only_opens_the_files_of_the_dates(dataset, tmp_path):
+    catalog = SourceCatalog(str(tmp_path / 'catalog.db'))
+    progress = []
+    catalog.refresh('Ligne1', dataset['Ligne1'], '20240302', '20240303', lambda *event: progress.append(event))
+    with closing(sqlite3.connect(catalog.catalog_file)) as conn:
+        assert sorted(file_date for file_date, in conn.execute("SELECT file_date FROM files")) == ['20240302', '20240303']
+    assert sorted(_file_date(path) for path, _, _ in progress) == ['20240302', '20240303']
+    assert [(done, total) for _, done, total in progress] == [(1, 2), (2, 2)]
+
+    # Unchanged files are not opened again
+    progress.clear()
+    catalog.refresh('Ligne1', dataset['Ligne1'], '20240301', '20240303', lambda *event: progress.append(event))
+    assert [(_file_date(path), done, total) for path, done, total in progress] == [('20240301', 1, 1)]
+
+
+def test_plan_file_tasks_scans_the_files_of_the_window(dataset, tmp_path):
+    config = configparser.ConfigParser()
+    config.read_dict({'Paths': dataset, 'Catalog': {'enabled': 'yes', 'file': str(tmp_path / 'catalog.db')}})
+    scans = []
+    file_tasks = plan_file_tasks(config, ['Ligne1'], '20240303', '20240304', on_scan=lambda *event: scans.append(event))
+    assert [_file_date(file_name) for _, file_name in file_tasks] == ['20240303', '20240304']
+    assert sorted(_file_date(path) for path, _, _ in scans) == ['20240303', '20240304']
@@ -0,0 +1,69 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from aggregation import add_rates, aggregate_frame, sum_columns
+from extraction import concat_frames, extract_files
+from synthetic_data import generate_dataset
+from test_aggregation_parity import desired_columns
+from top_feeders import RANKING_LEVELS, RANKING_METRICS, top_n
+
+
+@pytest.fixture(scope='module')
+def report(tmp_path_factory):
+    folders = generate_dataset(str(tmp_path_factory.mktemp('top')), lines=2, days=3, first_day='20240301', modules=3,
+                               feeders=5, rows_per_day=400)
+    file_tasks = [(line, os.path.join(folder, file_name)) for line, folder in folders.items() for file_name in sorted(os.listdir(folder))]
+    collected_data = concat_frames(extract_files(file_tasks, datetime(2024, 3, 1), datetime(2024, 3, 3, 23, 59)))
+    return aggregate_frame(collected_data.reindex(columns=desired_columns))
+
+
+# Function to rank the entities the plain way: a stable descending sort of the eligible rows
+def _sorted_reference(rows, metric, n, min_pickups):
+    eligible = rows[(rows['PickupCount'] >= min_pickups) & rows[metric].notna()]
+    worst = eligible.sort_values(metric, ascending=False, kind='stable').head(n).reset_index(drop=True)
+    worst.insert(0, 'Rank', range(1, len(worst) + 1))
+    return worst
+
+
+@pytest.mark.parametrize('metric', RANKING_METRICS)
+def test_ties_keep_the_report_order(report, metric):
+    tied = report.copy()
+    # Three distinct values only, a row without pickup (NaN rates) and rows under the pickup threshold
+    tied[metric] = (tied.index % 3).astype(float)
+    tied.loc[0, 'PickupCount'] = 0
+    if metric != 'Dislodged_parts_count':
+        tied.loc[0, metric] = np.nan
+    tied.loc[tied.index % 7 == 0, 'PickupCount'] = 5
+    for n in [1, 5, len(tied) // 3 + 2, len(tied) + 10]:
+        pdt.assert_frame_equal(top_n(tied, metric, n, min_pickups=10), _sorted_reference(tied, metric, n, 10))
+
+
+@pytest.mark.parametrize('level', [level for level in RANKING_LEVELS if level != 'group'])
+@pytest.mark.parametrize('metric', ['RejectRate', 'Dislodged_parts_count'])
+def test_entities_are_ranked_on_their_summed_counters(report, level, metric):
+    columns = RANKING_LEVELS[level]
+    counters = report.groupby(columns, sort=False, dropna=False, observed=True)[[column for column, _ in sum_columns]].sum()
+    expected = _sorted_reference(add_rates(counters.reset_index()), metric, 4, 100)
+    worst = top_n(report, metric, 4, min_pickups=100, level=level)
+    pdt.assert_frame_equal(worst, expected)
+    # The rate of an entity comes from its summed counters, not from the rates of its report rows
+    first = report[(report[columns] == worst.loc[0, columns]).all(axis=1)]
+    assert worst.loc[0, 'PickupCount'] == first['PickupCount'].sum()
+    if metric == 'RejectRate':
+        assert worst.loc[0, 'RejectRate'] == pytest.approx(first['RejectParts'].sum() / first['PickupCount'].sum() * 100)
+
+
+def test_nothing_to_rank(report):
+    assert top_n(None, 'RejectRate') is None
+    assert top_n(report, 'RejectRate', 0) is None
+    assert top_n(report, 'RejectRate', min_pickups=int(report['PickupCount'].max()) + 1) is None
+    assert top_n(pd.DataFrame(columns=report.columns), 'RejectRate') is None
+    with pytest.raises(ValueError, match='ranking metric'):
+        top_n(report, 'PickupCount')
+    with pytest.raises(ValueError, match='ranking level'):
+        top_n(report, 'RejectRate', level='recipe')
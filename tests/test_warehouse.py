@@ -0,0 +1,80 @@
+import os
+import shutil
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from aggregation import aggregate_frame
+from extraction import concat_frames, extract_files
+from synthetic_data import generate_dataset
+from test_aggregation_parity import assert_same_report, desired_columns
+from test_extraction_modes import corrupt_prod_table
+from warehouse import WAREHOUSE_LAYOUT_VERSION, Warehouse
+
+# Windows with partial hours at both edges, whole hours and a whole day, and one not spanning a whole hour
+WINDOWS = [
+    (datetime(2024, 3, 1, 5, 30), datetime(2024, 3, 3, 17, 45)),
+    (datetime(2024, 3, 1, 0, 0), datetime(2024, 3, 4, 0, 0)),
+    (datetime(2024, 3, 2, 9, 10), datetime(2024, 3, 2, 10, 50)),
+]
+
+
+@pytest.fixture(scope='module')
+def file_tasks(tmp_path_factory):
+    root = tmp_path_factory.mktemp('warehouse')
+    folders = generate_dataset(str(root), lines=2, days=3, first_day='20240301', modules=12, feeders=4, rows_per_day=1500)
+    return [(line, os.path.join(folder, file_name)) for line, folder in folders.items() for file_name in sorted(os.listdir(folder))]
+
+
+@pytest.fixture(scope='module')
+def warehouse(file_tasks, tmp_path_factory):
+    warehouse = Warehouse(str(tmp_path_factory.mktemp('store') / 'warehouse.db'))
+    assert warehouse.ingest(file_tasks) == []
+    return warehouse
+
+
+def _memory_report(file_tasks, start_datetime, end_datetime):
+    return aggregate_frame(concat_frames(extract_files(file_tasks, start_datetime, end_datetime)).reindex(columns=desired_columns))
+
+
+@pytest.mark.parametrize('start_datetime, end_datetime', WINDOWS)
+def test_warehouse_matches_memory(file_tasks, warehouse, start_datetime, end_datetime):
+    expected = _memory_report(file_tasks, start_datetime, end_datetime)
+    assert expected['Module'].nunique() >= 10
+    assert_same_report(warehouse.aggregate(['Ligne1', 'Ligne2'], start_datetime, end_datetime), expected)
+
+
+def test_modules_are_stored_as_integers(warehouse):
+    report = warehouse.aggregate(['Ligne1'], *WINDOWS[0])
+    modules = report['Module'].drop_duplicates().tolist()
+    assert pd.api.types.is_integer_dtype(report['Module'])
+    assert modules == sorted(modules) and max(modules) >= 10
+    with closing(sqlite3.connect(warehouse.warehouse_file)) as conn:
+        for table_name in ['rollup_hourly', 'rollup_daily'] + [name for (name,) in conn.execute("SELECT table_name FROM partitions")]:
+            assert conn.execute(f"SELECT DISTINCT typeof(Module) FROM {table_name}").fetchall() == [('integer',)]
+
+
+def test_older_layout_is_ingested_again(file_tasks, tmp_path):
+    warehouse_file = str(tmp_path / 'warehouse.db')
+    with closing(sqlite3.connect(warehouse_file)) as conn:
+        conn.execute("CREATE TABLE files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL)")
+        conn.executemany("INSERT INTO files VALUES (?, ?, ?)",
+                         [(os.path.abspath(file_name), os.path.getsize(file_name), os.path.getmtime(file_name)) for _, file_name in file_tasks])
+        conn.commit()
+    warehouse = Warehouse(warehouse_file)
+    warehouse.ingest(file_tasks)
+    with closing(sqlite3.connect(warehouse_file)) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == WAREHOUSE_LAYOUT_VERSION
+    assert_same_report(warehouse.aggregate(['Ligne1', 'Ligne2'], *WINDOWS[1]), _memory_report(file_tasks, *WINDOWS[1]))
+
+
+def test_unreadable_table_is_reported(file_tasks, tmp_path):
+    broken_file = str(tmp_path / '20240301_Ligne1[COUNT].1.db')
+    shutil.copyfile(file_tasks[0][1], broken_file)
+    corrupt_prod_table(broken_file)
+    warehouse = Warehouse(str(tmp_path / 'warehouse.db'))
+    assert warehouse.ingest([('Ligne1', broken_file)] + file_tasks) == [broken_file]
+    assert_same_report(warehouse.aggregate(['Ligne1', 'Ligne2'], *WINDOWS[1]), _memory_report(file_tasks, *WINDOWS[1]))
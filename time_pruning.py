@@ -0,0 +1,73 @@
+import os
+
+# (path, table) -> (size, mtime, (min_id, max_id, min DateTime, max DateTime)) of the tables already looked at.
+# One entry per table: a new state of the file replaces the previous one.
+_recorded_ranges = {}
+
+
+# Function to read the id and DateTime range of a Prod table.
+# id increases with DateTime, so both ends are two rowid lookups instead of a scan.
+# Ranges are recorded per file state so a file is only looked at again once it changes.
+def table_time_range(db_conn, table_name, file_name=None):
+    record_key = None
+    if file_name is not None:
+        stat = os.stat(file_name)
+        record_key = (os.path.abspath(file_name), table_name)
+        recorded = _recorded_ranges.get(record_key)
+        if recorded is not None and recorded[:2] == (stat.st_size, stat.st_mtime):
+            return recorded[2]
+    first = db_conn.execute(f"SELECT id, DateTime FROM {table_name} ORDER BY id LIMIT 1").fetchone()
+    last = db_conn.execute(f"SELECT id, DateTime FROM {table_name} ORDER BY id DESC LIMIT 1").fetchone()
+    time_range = None if first is None else (first[0], last[0], first[1], last[1])
+    if record_key is not None:
+        _recorded_ranges[record_key] = (stat.st_size, stat.st_mtime, time_range)
+    return time_range
+
+
+# Function to tell whether a recorded range can hold rows of the window
+def range_overlaps(time_range, start_datetime, end_datetime):
+    return time_range is not None and time_range[2] <= str(end_datetime) and time_range[3] >= str(start_datetime)
+
+
+# Function to find the smallest id whose DateTime is >= start (None when every row is before start)
+def _first_id_from(db_conn, table_name, low, high, start):
+    found = None
+    while low <= high:
+        middle = (low + high) // 2
+        row_id, date_time = db_conn.execute(
+            f"SELECT id, DateTime FROM {table_name} WHERE id >= ? ORDER BY id LIMIT 1", (middle,)).fetchone()
+        if date_time >= start:
+            found = row_id
+            high = middle - 1
+        else:
+            low = row_id + 1
+    return found
+
+
+# Function to find the largest id whose DateTime is <= end (None when every row is after end)
+def _last_id_until(db_conn, table_name, low, high, end):
+    found = None
+    while low <= high:
+        middle = (low + high) // 2
+        row_id, date_time = db_conn.execute(
+            f"SELECT id, DateTime FROM {table_name} WHERE id <= ? ORDER BY id DESC LIMIT 1", (middle,)).fetchone()
+        if date_time <= end:
+            found = row_id
+            low = middle + 1
+        else:
+            high = row_id - 1
+    return found
+
+
+# Function to find the (first id, last id) range holding the rows of the window with a binary search on id.
+# Returns None when the table has no row in the window, so the table can be skipped without being read.
+def window_id_range(db_conn, table_name, start_datetime, end_datetime, file_name=None):
+    time_range = table_time_range(db_conn, table_name, file_name)
+    if not range_overlaps(time_range, start_datetime, end_datetime):
+        return None
+    min_id, max_id = time_range[0], time_range[1]
+    first_id = _first_id_from(db_conn, table_name, min_id, max_id, str(start_datetime))
+    last_id = _last_id_until(db_conn, table_name, min_id, max_id, str(end_datetime))
+    if first_id is None or last_id is None or first_id > last_id:
+        return None
+    return first_id, last_id
@@ -0,0 +1,52 @@
+import heapq
+import numpy as np
+from aggregation import add_rates, sum_columns
+
+# Report columns a top-N query can rank on, the worst rows being the largest values
+RANKING_METRICS = ['RejectRate', 'ErrorPickupRate', 'ErrorRate', 'Dislodged_parts_count']
+
+# Entities a top-N query can rank: the report columns identifying one of them (None keeps the report groups)
+RANKING_LEVELS = {
+    'group': None,
+    'feeder': ['FIDL'],
+    'slot': ['Line_name', 'Type', 'Module', 'Slot'],
+    'part': ['PartName'],
+}
+
+
+# Function to sum the counters of the report rows of each entity and compute its rates again
+def _entity_counters(report, level):
+    columns = RANKING_LEVELS[level]
+    if columns is None:
+        return report
+    counters = report.groupby(columns, sort=False, dropna=False, observed=True)[[column for column, _ in sum_columns]].sum()
+    return add_rates(counters.reset_index())
+
+
+# Function to return the n worst entities of a report on a metric, among those with at least min_pickups picked parts.
+# The candidates are scanned once through a heap of n entries (heapq.nlargest), the report is never sorted and
+# only the n selected rows are copied out. Ties keep the report order. Returns None when no entity qualifies.
+def top_n(report, metric, n=10, min_pickups=1, level='group'):
+    if metric not in RANKING_METRICS:
+        raise ValueError(f"Unknown ranking metric '{metric}', expected one of {RANKING_METRICS}")
+    if level not in RANKING_LEVELS:
+        raise ValueError(f"Unknown ranking level '{level}', expected one of {list(RANKING_LEVELS)}")
+    if report is None or report.empty or n <= 0:
+        return None
+    rows = _entity_counters(report, level)
+    values = rows[metric].to_numpy(dtype=np.float64)
+    # Rates of entities without any pickup are NaN, they are never ranked
+    eligible = np.flatnonzero((rows['PickupCount'].to_numpy() >= min_pickups) & ~np.isnan(values))
+    positions = heapq.nlargest(n, eligible.tolist(), key=values.tolist().__getitem__)
+    if not positions:
+        return None
+    worst = rows.iloc[positions].reset_index(drop=True)
+    worst.insert(0, 'Rank', range(1, len(worst) + 1))
+    return worst
+
+
+# Function to read the default size and pickup threshold of the top-N panel from the [TopN] section of config.ini
+def read_top_n_settings(config):
+    count = config.getint('TopN', 'count', fallback=10)
+    min_pickups = config.getint('TopN', 'min_pickups', fallback=100)
+    return count, min_pickups
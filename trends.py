@@ -0,0 +1,124 @@
+import argparse
+import re
+from datetime import datetime
+import pandas as pd
+from aggregation import (add_rates, fixed_bucket_starts, format_moments, read_shift_starts, shift_bucket_starts, sum_columns,
+                         timestamps_ns)
+from extraction import extract_files, read_prefetch_settings, read_time_pruning, read_worker_count
+from parsed_cache import open_parsed_cache
+from report_writers import write_report_file
+from source_catalog import plan_file_tasks
+
+# Columns of one trend series, the bucket is added on top of them
+trend_keys = ['Line_name', 'Type', 'Module', 'FIDL']
+
+# Partial rows kept before they are summed again into one partial per (series, bucket)
+TREND_COMPACT_ROWS = 200000
+
+
+# Function to read a bucket: 'shift' (the [Shifts] calendar) or a width such as '5min', '15min', '1h', '8h', 'day'.
+# Returns the width in minutes, None for 'shift'.
+def parse_bucket(bucket):
+    bucket = bucket.strip().lower()
+    if bucket == 'shift':
+        return None
+    if bucket == 'day':
+        return 1440
+    match = re.fullmatch(r'(\d+)\s*(min|m|h)', bucket)
+    if match is None or int(match.group(1)) <= 0:
+        raise ValueError(f"Unknown trend bucket '{bucket}', expected shift, day or a width such as 5min or 1h")
+    return int(match.group(1)) * (60 if match.group(2) == 'h' else 1)
+
+
+# Function to read the default trend bucket from the [Trends] section of config.ini
+def read_trend_bucket(config):
+    bucket = config.get('Trends', 'bucket', fallback='1h')
+    parse_bucket(bucket)
+    return bucket
+
+
+# Trend series per (Line_name, Type, Module, FIDL) and time bucket, built in one pass over the extracted
+# frames. The bucket of each row is computed from its int64 timestamp (fixed width or shift calendar),
+# each frame is summed per (series, bucket) with one group by and the partial sums are summed again
+# whenever they pile up, so no bucket is ever queried on its own.
+class TrendAggregator:
+    def __init__(self, bucket='1h', shift_starts=None):
+        self.width = parse_bucket(bucket)
+        if self.width is None and not shift_starts:
+            raise ValueError("A shift trend needs the shift start times")
+        self.shift_starts = shift_starts
+        self.partials = []
+        self.partial_rows = 0
+
+    # Function to compute the bucket start of each row, as int64 nanoseconds
+    def bucket_starts(self, start_times):
+        timestamps = timestamps_ns(start_times)
+        if self.width is None:
+            return shift_bucket_starts(timestamps, self.shift_starts)
+        return fixed_bucket_starts(timestamps, self.width)
+
+    def add_frame(self, df):
+        if df is None or df.empty:
+            return
+        bucket = pd.Series(self.bucket_starts(df['StartTime']), index=df.index, name='Bucket')
+        partial = df.groupby([df[column] for column in trend_keys] + [bucket], sort=False, dropna=False,
+                             observed=True)[[column for _, column in sum_columns]].sum().reset_index()
+        self.partials.append(partial)
+        self.partial_rows += len(partial)
+        if self.partial_rows > TREND_COMPACT_ROWS:
+            self._compact()
+
+    def _compact(self):
+        merged = pd.concat(self.partials, ignore_index=True)
+        self.partials = [merged.groupby(trend_keys + ['Bucket'], sort=False, dropna=False, observed=True).sum().reset_index()]
+        self.partial_rows = len(self.partials[0])
+
+    # Function to return the series sorted by key and bucket: Bucket ('YYYY-MM-DD HH:MM', start of the
+    # bucket), the summed counters and the rates. None when no row was added.
+    def result(self):
+        if not self.partials:
+            return None
+        self._compact()
+        trends = self.partials[0].rename(columns={collected: report for report, collected in sum_columns})
+        trends = add_rates(trends).sort_values(trend_keys + ['Bucket'], na_position='first', kind='stable')
+        trends['Bucket'] = format_moments(pd.Series(trends['Bucket'].to_numpy().view('datetime64[ns]'), index=trends.index),
+                                          '%Y-%m-%d %H:%M')
+        return trends.reset_index(drop=True)
+
+
+# Function to compute the trends of lines over a window: the files are planned, read and parsed once
+def run_trends(config, lines, start_datetime, end_datetime, bucket=None, on_error=None):
+    aggregator = TrendAggregator(bucket or read_trend_bucket(config), read_shift_starts(config))
+    file_tasks = plan_file_tasks(config, lines, start_datetime.strftime('%Y%m%d'), end_datetime.strftime('%Y%m%d'),
+                                 start_datetime, end_datetime, on_error)
+    read_threads, queue_depth = read_prefetch_settings(config)
+    extract_files(file_tasks, start_datetime, end_datetime, open_parsed_cache(config), read_worker_count(config),
+                  on_error, on_frame=aggregator.add_frame, pruning=read_time_pruning(config),
+                  read_threads=read_threads, queue_depth=queue_depth)
+    return aggregator.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trend series of the reject counters per line, module and feeder")
+    parser.add_argument('--start', required=True, help="YYYYMMDD HH:MM")
+    parser.add_argument('--end', required=True, help="YYYYMMDD HH:MM")
+    parser.add_argument('--lines', nargs='+', help="lines of the [Paths] section (default: all of them)")
+    parser.add_argument('--bucket', help="shift, day or a width such as 5min or 1h (default: the [Trends] bucket)")
+    parser.add_argument('--output', default='Trends.csv')
+    args = parser.parse_args()
+
+    from Function import read_config
+    config = read_config()
+    lines = args.lines or list(config['Paths'].keys())
+    trends = run_trends(config, lines, datetime.strptime(args.start, '%Y%m%d %H:%M'), datetime.strptime(args.end, '%Y%m%d %H:%M'),
+                        args.bucket, on_error=lambda file_name: print(f"Failed to open database file: {file_name}"))
+    if trends is None:
+        print("No row in the window")
+        return 1
+    write_report_file(trends, args.output)
+    print(f"{len(trends)} rows written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,287 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+import pandas as pd
+from aggregation import StreamingAggregator, sum_columns
+from extraction import list_prod_tables, parse_table_frame, read_source_rows
+from source_access import connect_source
+
+# Rows read from a source table per ingestion step (one transaction each)
+INGEST_CHUNK_ROWS = 200000
+
+# Parsed columns stored for every source row, after (source, id, Line_name, day)
+warehouse_columns = ['Type', 'Module', 'DateTime', 'Recipe_name', 'FIDL', 'PartName', 'Position_no', 'Stage_no'] + \
+                    [collected_column for _, collected_column in sum_columns]
+
+# Group key of the rollups, the hour ('YYYY-MM-DD HH') or the day is added on top of it
+rollup_key = ['Line_name', 'Type', 'Module', 'Recipe_name', 'FIDL', 'PartName']
+
+# SQL type of the rollup key columns: Module is a number, like in the source tables, so it sorts as one
+rollup_key_types = {column: 'INTEGER' if column == 'Module' else 'TEXT' for column in rollup_key}
+
+# Layout of the stored rows and rollups (PRAGMA user_version), a warehouse of another layout is emptied
+# and filled again from the source files. 1: Module stored as INTEGER
+WAREHOUSE_LAYOUT_VERSION = 1
+
+# Partial aggregate columns of a rollup row, in the order StreamingAggregator.add_partial folds them
+rollup_values = ['StartTime', 'EndTime', 'Slot', 'Stage_no'] + [report_column for report_column, _ in sum_columns]
+
+
+# Function to format a datetime the way the DateTime column is compared ('YYYY-MM-DD HH:MM:SS')
+def _text(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# Function to round a datetime up to the next whole hour (unchanged when already on one)
+def _ceil_hour(moment):
+    floor = moment.replace(minute=0, second=0, microsecond=0)
+    return floor if floor == moment else floor + timedelta(hours=1)
+
+
+# Consolidated store of the parsed Prod_NXT*/Prod_XPF* rows of every line. Rows live in one table
+# per (line, day) partition, keyed on (source table, id): a source table is ingested once, later
+# runs only read its rows above the recorded id, and ingesting the same rows again changes nothing.
+class Warehouse:
+    def __init__(self, warehouse_file):
+        self.warehouse_file = warehouse_file
+        with sqlite3.connect(warehouse_file) as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] != WAREHOUSE_LAYOUT_VERSION:
+                self._drop_layout(conn)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime REAL
+                );
+                CREATE TABLE IF NOT EXISTS sources (
+                    source INTEGER PRIMARY KEY,
+                    path TEXT,
+                    table_name TEXT,
+                    line TEXT,
+                    last_id INTEGER,
+                    UNIQUE (path, table_name)
+                );
+                CREATE TABLE IF NOT EXISTS partitions (
+                    line TEXT,
+                    day TEXT,
+                    table_name TEXT,
+                    PRIMARY KEY (line, day)
+                );
+            """)
+            # Hourly and daily rollups: the partial aggregate of every group per hour / per day
+            rollups_exist = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rollup_hourly'").fetchone()
+            for rollup, grain in (('rollup_hourly', 'hour'), ('rollup_daily', 'day')):
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {rollup} (
+                        {', '.join(f'{column} {rollup_key_types[column]}' for column in rollup_key)}, {grain} TEXT,
+                        StartTime TEXT, EndTime TEXT, Slot INTEGER, Stage_no INTEGER,
+                        {', '.join(f'{column} INTEGER' for column, _ in sum_columns)}
+                    )
+                """)
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {rollup}_key ON {rollup} (Line_name, {grain})")
+            if rollups_exist is None:
+                # Warehouse filled before the rollups existed: build them from every partition
+                for line, day, table_name in conn.execute("SELECT line, day, table_name FROM partitions").fetchall():
+                    hours = [hour for (hour,) in conn.execute(f"SELECT DISTINCT substr(DateTime, 1, 13) FROM {table_name}")]
+                    self._refresh_rollups(conn, line, day, table_name, hours)
+
+    # Function to drop the tables of a warehouse written with another layout, its files are then ingested again
+    @staticmethod
+    def _drop_layout(conn):
+        table_names = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+        for table_name in table_names:
+            conn.execute(f"DROP TABLE {table_name}")
+        conn.execute(f"PRAGMA user_version = {WAREHOUSE_LAYOUT_VERSION}")
+
+    # Function to find (or create) the table of the (line, day) partition
+    @staticmethod
+    def _partition_table(conn, line, day):
+        row = conn.execute("SELECT table_name FROM partitions WHERE line = ? AND day = ?", (line, day)).fetchone()
+        if row is not None:
+            return row[0]
+        table_name = f"part_{conn.execute('SELECT COUNT(*) FROM partitions').fetchone()[0] + 1}"
+        conn.execute(f"""
+            CREATE TABLE {table_name} (
+                source INTEGER, id INTEGER, Line_name TEXT, day TEXT, Type TEXT, Module INTEGER, DateTime TEXT,
+                Recipe_name TEXT, FIDL TEXT, PartName TEXT, Position_no INTEGER, Stage_no INTEGER,
+                {', '.join(f'{column} INTEGER' for _, column in sum_columns)},
+                PRIMARY KEY (source, id)
+            )
+        """)
+        conn.execute(f"CREATE INDEX {table_name}_key ON {table_name} (Line_name, day, Module, FIDL, PartName)")
+        conn.execute(f"CREATE INDEX {table_name}_time ON {table_name} (DateTime)")
+        conn.execute("INSERT INTO partitions VALUES (?, ?, ?)", (line, day, table_name))
+        return table_name
+
+    # Function to ingest the new rows of the (server, file_name) pairs
+    # Returns the list of files that could not be read
+    # on_file(file_name, done, total) is called after each file, cancelled() is checked between files
+    # (the files ingested before a cancellation stay in the warehouse)
+    def ingest(self, file_tasks, on_file=None, cancelled=None):
+        failed_files = []
+        with sqlite3.connect(self.warehouse_file) as conn:
+            for done, (server, file_name) in enumerate(file_tasks, start=1):
+                if cancelled is not None and cancelled():
+                    break
+                if not self._ingest_file(conn, server, file_name):
+                    failed_files.append(file_name)
+                if on_file is not None:
+                    on_file(file_name, done, len(file_tasks))
+        return failed_files
+
+    # Function to ingest one file, returns False when it could not be read
+    def _ingest_file(self, conn, server, file_name):
+        path = os.path.abspath(file_name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        # Unchanged files have nothing new to ingest
+        if conn.execute("SELECT size, mtime FROM files WHERE path = ?", (path,)).fetchone() == (stat.st_size, stat.st_mtime):
+            return True
+        try:
+            with closing(connect_source(file_name)) as db_conn:
+                for table_name in list_prod_tables(db_conn):
+                    self._ingest_table(conn, db_conn, path, table_name, server)
+        except sqlite3.Error:
+            conn.rollback()
+            return False
+        conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", (path, stat.st_size, stat.st_mtime))
+        conn.commit()
+        return True
+
+    def _ingest_table(self, conn, db_conn, path, table_name, server):
+        row = conn.execute("SELECT source, last_id FROM sources WHERE path = ? AND table_name = ?", (path, table_name)).fetchone()
+        if row is None:
+            source = conn.execute("INSERT INTO sources (path, table_name, line, last_id) VALUES (?, ?, ?, 0)",
+                                  (path, table_name, server)).lastrowid
+            last_id = 0
+        else:
+            source, last_id = row
+            max_id = db_conn.execute(f"SELECT MAX(id) FROM {table_name}").fetchone()[0] or 0
+            if max_id < last_id:
+                # The source file was replaced: forget its rows (and their rollups) and ingest it again
+                for line, day, partition in conn.execute("SELECT line, day, table_name FROM partitions").fetchall():
+                    hours = [hour for (hour,) in conn.execute(
+                        f"SELECT DISTINCT substr(DateTime, 1, 13) FROM {partition} WHERE source = ?", (source,))]
+                    if hours:
+                        conn.execute(f"DELETE FROM {partition} WHERE source = ?", (source,))
+                        self._refresh_rollups(conn, line, day, partition, hours)
+                last_id = 0
+        table_type = 'XPF' if 'Prod_XPF' in table_name else 'NXT'
+
+        while True:
+            df = read_source_rows(db_conn, f"SELECT id, DateTime, Module, Data FROM {table_name} WHERE id > ? ORDER BY id LIMIT ?",
+                                  (last_id, INGEST_CHUNK_ROWS))
+            if df.empty:
+                break
+            ids = df['id'].to_numpy()
+            parsed = parse_table_frame(df[['DateTime', 'Module', 'Data']])
+            # The warehouse keeps the source text of DateTime, its partitions and rollups compare it as text
+            parsed['DateTime'] = df['DateTime'].to_numpy()
+            parsed['source'] = source
+            parsed['id'] = ids
+            parsed['Line_name'] = server
+            parsed['day'] = parsed['DateTime'].str[:10]
+            parsed['Type'] = table_type
+            for day, rows in parsed.groupby('day', sort=True):
+                partition = self._partition_table(conn, server, day)
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {partition} VALUES ({', '.join('?' * (len(warehouse_columns) + 4))})",
+                    rows[['source', 'id', 'Line_name', 'day'] + warehouse_columns].itertuples(index=False, name=None))
+                # Only the hours that received rows are rolled up again
+                self._refresh_rollups(conn, server, day, partition, rows['DateTime'].str[:13].unique())
+            last_id = int(ids[-1])
+            conn.execute("UPDATE sources SET last_id = ? WHERE source = ?", (last_id, source))
+            if len(df) < INGEST_CHUNK_ROWS:
+                break
+
+    # Function to rebuild the hourly rollups of the given hours of one (line, day) partition, then its daily rollup.
+    # Rollups are recomputed from the stored rows, so ingesting the same rows twice cannot count them twice.
+    @staticmethod
+    def _refresh_rollups(conn, line, day, partition, hours):
+        sums = ", ".join(f"SUM({collected_column})" for _, collected_column in sum_columns)
+        for hour in hours:
+            next_hour = _text(datetime.strptime(hour, '%Y-%m-%d %H') + timedelta(hours=1))
+            conn.execute("DELETE FROM rollup_hourly WHERE Line_name = ? AND hour = ?", (line, hour))
+            conn.execute(f"""
+                INSERT INTO rollup_hourly
+                SELECT {', '.join(rollup_key)}, ?,
+                       MIN(substr(DateTime, 1, 16)), MAX(substr(DateTime, 1, 16)), MAX(Position_no), MIN(Stage_no), {sums}
+                FROM {partition}
+                WHERE DateTime >= ? AND DateTime < ?
+                GROUP BY {', '.join(rollup_key)}
+            """, (hour, hour + ':00:00', next_hour))
+        rollup_sums = ", ".join(f"SUM({report_column})" for report_column, _ in sum_columns)
+        conn.execute("DELETE FROM rollup_daily WHERE Line_name = ? AND day = ?", (line, day))
+        conn.execute(f"""
+            INSERT INTO rollup_daily
+            SELECT {', '.join(rollup_key)}, substr(hour, 1, 10), MIN(StartTime), MAX(EndTime), MAX(Slot), MIN(Stage_no), {rollup_sums}
+            FROM rollup_hourly
+            WHERE Line_name = ? AND hour BETWEEN ? AND ?
+            GROUP BY {', '.join(rollup_key)}
+        """, (line, day + ' 00', day + ' 23'))
+
+    # Function to aggregate the stored rows of the lines with start <= DateTime < end (<= end when inclusive)
+    @staticmethod
+    def _aggregate_raw(conn, aggregator, lines, start, end, inclusive):
+        sums = ", ".join(f"SUM({collected_column})" for _, collected_column in sum_columns)
+        partitions = conn.execute(
+            f"SELECT table_name FROM partitions WHERE line IN ({', '.join('?' * len(lines))}) AND day BETWEEN ? AND ? ORDER BY day",
+            list(lines) + [start[:10], end[:10]]).fetchall()
+        for (partition,) in partitions:
+            partial = pd.read_sql_query(f"""
+                SELECT {', '.join(rollup_key)}, day,
+                       MIN(substr(DateTime, 1, 16)), MAX(substr(DateTime, 1, 16)), MAX(Position_no), MIN(Stage_no), {sums}
+                FROM {partition}
+                WHERE DateTime >= ? AND DateTime {'<=' if inclusive else '<'} ?
+                GROUP BY {', '.join(rollup_key)}, day
+            """, conn, params=(start, end))
+            aggregator.add_partial(partial)
+
+    # Function to fold the rollup rows of the lines with start <= grain < end
+    @staticmethod
+    def _aggregate_rollup(conn, aggregator, rollup, grain, lines, start, end):
+        partial = pd.read_sql_query(f"""
+            SELECT {', '.join(rollup_key)}, substr({grain}, 1, 10), {', '.join(rollup_values)}
+            FROM {rollup}
+            WHERE Line_name IN ({', '.join('?' * len(lines))}) AND {grain} >= ? AND {grain} < ?
+        """, conn, params=list(lines) + [start, end])
+        aggregator.add_partial(partial)
+
+    # Function to build the report of the lines over the window. Whole days come from the daily rollups,
+    # whole hours from the hourly rollups, and only the partial hours at both edges are read row by row.
+    def aggregate(self, lines, start_datetime, end_datetime):
+        aggregator = StreamingAggregator()
+        with sqlite3.connect(self.warehouse_file) as conn:
+            # Whole hours are those entirely inside start <= DateTime <= end
+            first_hour = _ceil_hour(start_datetime)
+            last_hour = end_datetime.replace(minute=0, second=0, microsecond=0)
+            if first_hour >= last_hour:
+                self._aggregate_raw(conn, aggregator, lines, _text(start_datetime), _text(end_datetime), True)
+                return aggregator.result()
+
+            # Step 1: Partial hours at the edges, from the stored rows
+            self._aggregate_raw(conn, aggregator, lines, _text(start_datetime), _text(first_hour), False)
+            self._aggregate_raw(conn, aggregator, lines, _text(last_hour), _text(end_datetime), True)
+
+            # Step 2: Whole days from the daily rollups, the remaining whole hours from the hourly rollups
+            first_day = first_hour if first_hour.hour == 0 else first_hour.replace(hour=0) + timedelta(days=1)
+            last_day = last_hour.replace(hour=0)
+            if first_day < last_day:
+                self._aggregate_rollup(conn, aggregator, 'rollup_daily', 'day', lines,
+                                       first_day.strftime('%Y-%m-%d'), last_day.strftime('%Y-%m-%d'))
+                hour_ranges = [(first_hour, first_day), (last_day, last_hour)]
+            else:
+                hour_ranges = [(first_hour, last_hour)]
+            for start_hour, end_hour in hour_ranges:
+                if start_hour < end_hour:
+                    self._aggregate_rollup(conn, aggregator, 'rollup_hourly', 'hour', lines,
+                                           start_hour.strftime('%Y-%m-%d %H'), end_hour.strftime('%Y-%m-%d %H'))
+        return aggregator.result()
+
+
+# Function to open the warehouse file named in the [Warehouse] section of config.ini
+def open_warehouse(config):
+    return Warehouse(config.get('Warehouse', 'file', fallback='warehouse.db'))